@@ -561,9 +561,77 @@ def queries(table):
         branches.c.parent == bindparam('branch')
     )
 
+    for (name, tab, keycols, valcol) in [
+        ('graph_val', 'graph_val', ['graph', 'key'], 'value'),
+        ('node_val', 'node_val', ['graph', 'node', 'key'], 'value'),
+        ('edge_val', 'edge_val', ['graph', 'orig', 'dest', 'idx', 'key'], 'value'),
+        ('location', 'things', ['character', 'thing'], 'location'),
+        ('next_location', 'things', ['character', 'thing'], 'next_location')
+    ]:
+        r[name + '_cmp_windows'] = cmp_windows(table[tab], keycols, valcol)
+
     return r
 
 
+def cmp_windows(t, keycols, valcol):
+    """Return a query for when the value in ``valcol`` compared true or
+    false to a constant, in one stretch of one branch.
+
+    The value at the end of each turn is compared, and the result is
+    one row for every turn that the comparison changes, with the last
+    turn before the next change, and whether it was true.
+
+    """
+    def lit(v):
+        # constants go in the SQL itself, rather than being bound
+        return literal_column(repr(v))
+    changes = select([
+        t.c.turn,
+        func.json_extract(t.c[valcol], lit('$')).label('v'),
+        func.json_extract(bindparam('value'), lit('$')).label('c'),
+        func.row_number().over(
+            partition_by=t.c.turn, order_by=t.c.tick.desc()
+        ).label('rn')
+    ]).where(and_(
+        *[t.c[col] == bindparam(col) for col in keycols],
+        t.c.branch == bindparam('branch'),
+        or_(
+            t.c.turn > bindparam('turn_from'),
+            and_(
+                t.c.turn == bindparam('turn_from'),
+                t.c.tick > bindparam('tick_from')
+            )
+        ),
+        or_(
+            t.c.turn < bindparam('turn_to'),
+            and_(
+                t.c.turn == bindparam('turn_to'),
+                t.c.tick <= bindparam('tick_to')
+            )
+        )
+    )).alias('changes')
+    v, c = changes.c.v, changes.c.c
+    ends = select([
+        changes.c.turn,
+        func.coalesce(case(OrderedDict([
+            (lit('eq'), v == c), (lit('ne'), v != c), (lit('gt'), v > c),
+            (lit('lt'), v < c), (lit('ge'), v >= c), (lit('le'), v <= c)
+        ]), value=bindparam('oper')), lit(0)).label('ok')
+    ]).where(changes.c.rn == lit(1)).alias('ends')
+    runs = select([
+        ends.c.turn, ends.c.ok,
+        func.lag(ends.c.ok).over(order_by=ends.c.turn).label('prev_ok')
+    ]).alias('runs')
+    return select([
+        runs.c.turn,
+        (func.lead(runs.c.turn).over(order_by=runs.c.turn) - lit(1)).label('turn_to'),
+        runs.c.ok
+    ]).where(or_(
+        runs.c.prev_ok == None,
+        runs.c.ok != runs.c.prev_ok
+    )).order_by(runs.c.turn)
+
+
 if __name__ == '__main__':
     e = create_engine('sqlite:///:memory:')
     meta = MetaData()
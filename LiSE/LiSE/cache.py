@@ -1,16 +1,32 @@
+from collections import defaultdict, OrderedDict
+
 from allegedb.cache import (
     Cache,
+    NodesCache as AllegedNodesCache,
+    EdgesCache as AllegedEdgesCache,
     PickyDefaultDict,
     StructuredDefaultDict,
     TurnDict,
+    FuturistWindowDict,
     HistoryError
 )
 from .util import singleton_get
 
 
+def at_branch_end(engine, branch, turn, tick):
+    """Return whether the time is the latest in its branch, where new
+    history gets made.
+
+    """
+    if branch not in engine._branches:
+        return False
+    end_turn, end_tick = engine._branches[branch][3:]
+    return (turn, tick) >= (end_turn, end_tick)
+
+
 class EntitylessCache(Cache):
-    def store(self, key, branch, turn, tick, value, *, planning=False):
-        super().store(None, key, branch, turn, tick, value, planning=planning)
+    def store(self, key, branch, turn, tick, value, *, planning=False, forward=False):
+        super().store(None, key, branch, turn, tick, value, planning=planning, forward=forward)
 
     def load(self, data, validate=False):
         return super().load(((None,) + row for row in data), validate)
@@ -30,6 +46,52 @@ class EntitylessCache(Cache):
         return super().retrieve(*(None,)+args)
 
 
+class RulebooksCache(EntitylessCache):
+    """A cache for the lists of rules in each rulebook.
+
+    ``nonempty`` holds the rulebooks that have rules in them at the end
+    of the branch ``nonempty_branch``, in the order they got them. It's
+    kept up to date as rulebooks change there, and worked out again
+    from the history when it's wanted for any other time.
+
+    """
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.nonempty = OrderedDict()
+        self.nonempty_branch = None
+
+    def _store(self, *args, planning=False):
+        super()._store(*args, planning=planning)
+        rulebook, branch = args[1:3]
+        if branch != self.nonempty_branch:
+            return
+        if planning or self.db._loading:
+            # might not be true at the end of the branch; work it out later
+            self.nonempty_branch = None
+        elif args[-1]:
+            self.nonempty.setdefault(rulebook, True)
+        else:
+            self.nonempty.pop(rulebook, None)
+
+    def iter_nonempty(self, branch, turn, tick):
+        """Iterate over the rulebooks that have rules at the given time."""
+        if branch == self.nonempty_branch and \
+                at_branch_end(self.db, branch, turn, tick):
+            yield from list(self.nonempty)
+            return
+        nonempty = OrderedDict()
+        for rulebook in self.keys[(None,)]:
+            try:
+                if self.retrieve(rulebook, branch, turn, tick):
+                    nonempty[rulebook] = True
+            except KeyError:
+                continue
+        if at_branch_end(self.db, branch, turn, tick):
+            self.nonempty = nonempty
+            self.nonempty_branch = branch
+        yield from list(nonempty)
+
+
 class AvatarnessCache(Cache):
     """A cache for remembering when a node is an avatar of a character."""
     def __init__(self, engine):
@@ -44,10 +106,10 @@ class AvatarnessCache(Cache):
         self.uniqgraph = StructuredDefaultDict(1, TurnDict)
         self.users = StructuredDefaultDict(1, TurnDict)
 
-    def store(self, character, graph, node, branch, turn, tick, is_avatar, *, planning=False):
+    def store(self, character, graph, node, branch, turn, tick, is_avatar, *, planning=False, forward=False):
         if not is_avatar:
             is_avatar = None
-        Cache.store(self, character, graph, node, branch, turn, tick, is_avatar, planning=False)
+        Cache.store(self, character, graph, node, branch, turn, tick, is_avatar, planning=False, forward=forward)
         userturns = self.user_order[graph][node][character][branch]
         if userturns.has_exact_rev(turn):
             userturns[turn][tick] = is_avatar
@@ -197,15 +259,154 @@ class AvatarnessCache(Cache):
                 continue
 
 
+class EntityRulebooksCache(Cache):
+    """A cache for remembering what rulebook each node or portal follows.
+
+    ``users`` maps each rulebook to the entities that exist and follow
+    it at the end of the branch ``users_branch``, so the rules engine
+    can look at only those. It's kept up to date as rulebooks are
+    assigned and entities come and go there, and worked out again from
+    the history when it's wanted for any other time.
+
+    ``order`` numbers each entity in the order it first got a rulebook,
+    which, for nodes, is when they were made.
+
+    """
+    def __init__(self, engine, exists):
+        Cache.__init__(self, engine)
+        self.exists = exists
+        """Function to tell whether an entity exists at a given time"""
+        self.users = defaultdict(OrderedDict)
+        self.users_branch = None
+        self.following = {}
+        self.order = {}
+
+    def clear(self):
+        self.__init__(self.db, self.exists)
+
+    def _store(self, *args, planning=False):
+        super()._store(*args, planning=planning)
+        entity = args[:-4]
+        branch = args[-4]
+        self.order.setdefault(entity, len(self.order))
+        if branch != self.users_branch:
+            return
+        if planning or self.db._loading:
+            # might not be true at the end of the branch; work it out later
+            self.users_branch = None
+        elif self.exists(*args[:-1]):
+            self._follow(entity, args[-1])
+
+    def _follow(self, entity, rulebook):
+        self._unfollow(entity)
+        self.users[rulebook][entity] = True
+        self.following[entity] = rulebook
+
+    def _unfollow(self, entity):
+        if entity in self.following:
+            rulebook = self.following.pop(entity)
+            users = self.users[rulebook]
+            del users[entity]
+            if not users:
+                del self.users[rulebook]
+
+    def existence_changed(self, *args, planning=False):
+        """Note that an entity was made or deleted.
+
+        The arguments are the entity, then the branch, turn, tick, and
+        whether it exists now.
+
+        """
+        entity = args[:-4]
+        branch, turn, tick, extant = args[-4:]
+        if branch != self.users_branch:
+            return
+        if planning or self.db._loading:
+            self.users_branch = None
+        elif not extant:
+            self._unfollow(entity)
+        else:
+            try:
+                self._follow(entity, self.retrieve(*entity, branch, turn, tick))
+            except KeyError:
+                pass
+
+    def users_at(self, branch, turn, tick):
+        """Return a dictionary of the entities following each rulebook at
+        the given time.
+
+        """
+        if branch == self.users_branch and \
+                at_branch_end(self.db, branch, turn, tick):
+            return self.users
+        users = defaultdict(OrderedDict)
+        following = {}
+        for parent, entities in self.keys.items():
+            for key in list(entities):
+                entity = parent + (key,)
+                try:
+                    rulebook = self.retrieve(*entity, branch, turn, tick)
+                except KeyError:
+                    continue
+                if self.exists(*entity, branch, turn, tick):
+                    users[rulebook][entity] = True
+                    following[entity] = rulebook
+        if at_branch_end(self.db, branch, turn, tick):
+            self.users = users
+            self.following = following
+            self.users_branch = branch
+        return users
+
+
+class NodesCache(AllegedNodesCache):
+    """A cache of whether nodes exist, which keeps the index of the
+    nodes following each rulebook up to date.
+
+    """
+    def _store(self, graph, node, branch, turn, tick, ex, *, planning=False):
+        super()._store(graph, node, branch, turn, tick, ex, planning=planning)
+        self.db._nodes_rulebooks_cache.existence_changed(
+            graph, node, branch, turn, tick, bool(ex), planning=planning)
+
+    def load_turns(self, turns):
+        super().load_turns(turns)
+        self.db._nodes_rulebooks_cache.users_branch = None
+
+
+class EdgesCache(AllegedEdgesCache):
+    """A cache of whether portals exist, which keeps the index of the
+    portals following each rulebook up to date.
+
+    """
+    def _store(self, graph, orig, dest, idx, branch, turn, tick, ex, *, planning=False):
+        super()._store(graph, orig, dest, idx, branch, turn, tick, ex, planning=planning)
+        self.db._portals_rulebooks_cache.existence_changed(
+            graph, orig, dest, branch, turn, tick, bool(ex), planning=planning)
+
+    def load_turns(self, turns):
+        super().load_turns(turns)
+        self.db._portals_rulebooks_cache.users_branch = None
+
+
 class RulesHandledCache(object):
     def __init__(self, engine):
         self.engine = engine
         self.handled = {}
         self.unhandled = {}
 
+    def clear(self):
+        self.handled.clear()
+        self.unhandled.clear()
+
     def get_rulebook(self, *args):
         raise NotImplementedError
 
+    def has_rules(self, rulebook, branch, turn, tick):
+        try:
+            return bool(self.engine._rulebooks_cache.retrieve(rulebook, branch, turn, tick))
+        except KeyError:
+            return False
+
     def iter_unhandled_rules(self, branch, turn, tick):
         raise NotImplementedError
 
@@ -295,6 +496,8 @@ class AvatarRulesHandledCache(RulesHandledCache):
     def iter_unhandled_rules(self, branch, turn, tick):
         for character, char in self.engine.character.items():
             rulebook = self.get_rulebook(character, branch, turn, tick)
+            if not self.has_rules(rulebook, branch, turn, tick):
+                continue
             for graph, avs in char.avatar.items():
                 for avatar in avs:
                     try:
@@ -315,6 +518,8 @@ class CharacterThingRulesHandledCache(RulesHandledCache):
     def iter_unhandled_rules(self, branch, turn, tick):
         for character, char in self.engine.character.items():
             rulebook = self.get_rulebook(character, branch, turn, tick)
+            if not self.has_rules(rulebook, branch, turn, tick):
+                continue
             for thing in char.thing:
                 try:
                     rules = self.unhandled_rulebook_rules((character, thing), rulebook, branch, turn, tick)
@@ -334,6 +539,8 @@ class CharacterPlaceRulesHandledCache(RulesHandledCache):
     def iter_unhandled_rules(self, branch, turn, tick):
         for character, char in self.engine.character.items():
             rulebook = self.get_rulebook(character, branch, turn, tick)
+            if not self.has_rules(rulebook, branch, turn, tick):
+                continue
             for place in char.place:
                 try:
                     rules = self.unhandled_rulebook_rules((character, place), rulebook, branch, turn, tick)
@@ -356,6 +563,8 @@ class CharacterPortalRulesHandledCache(RulesHandledCache):
                 rulebook = self.get_rulebook(character, branch, turn, tick)
             except KeyError:
                 continue
+            if not self.has_rules(rulebook, branch, turn, tick):
+                continue
             for orig in char.portal:
                 for dest in char.portal[orig]:
                     try:
@@ -374,15 +583,42 @@ class NodeRulesHandledCache(RulesHandledCache):
             return character, node
 
     def iter_unhandled_rules(self, branch, turn, tick):
-        for character, char in self.engine.character.items():
-            for node in char.node:
+        """Iterate over the rules that nodes still have to follow this
+        turn, node by node, in the order the nodes got their rulebooks.
+        Nodes that never had one stored come last.
+
+        """
+        engine = self.engine
+        rbcache = engine._nodes_rulebooks_cache
+        users = rbcache.users_at(branch, turn, tick)
+        found = {}
+        for rulebook in engine._rulebooks_cache.iter_nonempty(branch, turn, tick):
+            candidates = list(users.get(rulebook, ()))
+            if (
+                isinstance(rulebook, tuple) and len(rulebook) == 2 and
+                rulebook not in rbcache.order
+            ):
+                # a node's default rulebook is named for it; nodes made
+                # some other way than by a character might not have it stored
+                if engine._nodes_cache.contains_entity(*rulebook, branch, turn, tick):
+                    candidates.append(rulebook)
+            for (character, node) in candidates:
+                if character not in engine.character:
+                    continue
                 try:
-                    rulebook = self.get_rulebook(character, node, branch, turn, tick)
                     rules = self.unhandled_rulebook_rules((character, node), rulebook, branch, turn, tick)
                 except KeyError:
                     continue
-                for rule in rules:
-                    yield character, node, rulebook, rule
+                if rules:
+                    found[character, node] = rulebook, rules
+        order = rbcache.order
+        unordered = len(order)
+        for (character, node) in sorted(
+                found, key=lambda node: order.get(node, unordered)
+        ):
+            rulebook, rules = found[character, node]
+            for rule in rules:
+                yield character, node, rulebook, rule
 
 
 class PortalRulesHandledCache(RulesHandledCache):
@@ -393,22 +629,159 @@ class PortalRulesHandledCache(RulesHandledCache):
             return character, orig, dest
 
     def iter_unhandled_rules(self, branch, turn, tick):
-        for character, char in self.engine.character.items():
-            for orig, dests in char.portal.items():
-                for dest in dests:
-                    try:
-                        rulebook = self.get_rulebook(character, orig, dest, branch, turn, tick)
-                        rules = self.unhandled_rulebook_rules((character, orig, dest), rulebook, branch, turn, tick)
-                    except KeyError:
-                        continue
-                    for rule in rules:
-                        yield character, orig, dest, rulebook, rule
+        """Iterate over the rules that portals still have to follow this
+        turn, portal by portal, in the order the portals got their
+        rulebooks. Portals that only ever had their default rulebook come
+        last.
+
+        """
+        engine = self.engine
+        rbcache = engine._portals_rulebooks_cache
+        users = rbcache.users_at(branch, turn, tick)
+        edges = engine._edges_cache
+        found = {}
+        for rulebook in engine._rulebooks_cache.iter_nonempty(branch, turn, tick):
+            candidates = list(users.get(rulebook, ()))
+            if (
+                isinstance(rulebook, tuple) and len(rulebook) == 3 and
+                rulebook not in rbcache.order
+            ):
+                # a portal's default rulebook is named for it, and
+                # isn't stored unless someone sets it
+                if edges.has_successor(*rulebook, branch, turn, tick):
+                    candidates.append(rulebook)
+            for (character, orig, dest) in candidates:
+                if character not in engine.character:
+                    continue
+                try:
+                    rules = self.unhandled_rulebook_rules((character, orig, dest), rulebook, branch, turn, tick)
+                except KeyError:
+                    continue
+                if rules:
+                    found[character, orig, dest] = rulebook, rules
+        order = rbcache.order
+        unordered = len(order)
+        for (character, orig, dest) in sorted(
+                found, key=lambda portal: order.get(portal, unordered)
+        ):
+            rulebook, rules = found[character, orig, dest]
+            for rule in rules:
+                yield character, orig, dest, rulebook, rule
+
+
+def update_views(cache, args, planning):
+    """Tell the engine's views about a value stored in ``cache``."""
+    for view in cache.db.view.values():
+        if view.source is cache:
+            view.stored(*args, planning=planning)
+
+
+class NodeValCache(Cache):
+    """A cache for the stats of nodes, which keeps views of them up to date."""
+    def _store(self, *args, planning=False):
+        super()._store(*args, planning=planning)
+        update_views(self, args, planning)
+
+    def load_turns(self, turns):
+        super().load_turns(turns)
+        for view in self.db.view.values():
+            if view.source is self:
+                view.reset()
 
 
 class ThingsCache(Cache):
     def __init__(self, db):
         Cache.__init__(self, db)
         self._make_node = db.thing_cls
+        self.contents = StructuredDefaultDict(2, TurnDict)
+        """Whether things are in a location, keyed by character and
+        location, then thing, then branch, turn, and tick.
+
+        """
+        self.contentscache = PickyDefaultDict(TurnDict)
+        """Things in a location at a given turn and tick"""
+
+    def _moved(self, branch, turn, tick):
+        """Return the location of whatever thing was stored at the given
+        time, before and after it was.
+
+        """
+        prev = self.presettings[branch][turn][tick][-1]
+        now = self.settings[branch][turn][tick][-1]
+        return prev[0] if prev else None, now[0] if now else None
+
+    def _store(self, *args, planning=False):
+        super()._store(*args, planning=planning)
+        character, thing, branch, turn, tick, locs = args
+        oldloc, newloc = self._moved(branch, turn, tick)
+        if oldloc != newloc:
+            if oldloc is not None:
+                self._store_content(character, oldloc, thing, branch, turn, tick, None)
+            if newloc is not None:
+                self._store_content(character, newloc, thing, branch, turn, tick, True)
+        update_views(self, args, planning)
+
+    def _store_content(self, character, location, thing, branch, turn, tick, present):
+        contents = self.contents[(character, location)][thing][branch]
+        if contents and turn < contents.end:
+            # the thing's own history after this was just erased
+            contents.truncate(turn)
+        if contents.has_exact_rev(turn):
+            contentsturn = contents[turn]
+            contentsturn.truncate(tick)
+            contentsturn[tick] = present
+        else:
+            new = FuturistWindowDict()
+            new[tick] = present
+            contents[turn] = new
+
+    def _update_keycache(self, *args, validate=False, forward=False):
+        super()._update_keycache(*args, validate=validate, forward=forward)
+        character, thing, branch, turn, tick, locs = args
+        oldloc, newloc = self._moved(branch, turn, tick)
+        if oldloc == newloc:
+            return
+        if oldloc is not None:
+            self._get_contentscache(
+                character, oldloc, branch, turn, tick, forward=forward
+            ).discard(thing)
+        if newloc is not None:
+            self._get_contentscache(
+                character, newloc, branch, turn, tick, forward=forward
+            ).add(thing)
+        if validate:
+            for loc in (oldloc, newloc):
+                if loc is not None and self.contentscache[(character, loc, branch)][turn][tick] \
+                        != set(self._slow_iter_keys(self.contents[(character, loc)], branch, turn, tick)):
+                    raise ValueError("Invalid contents cache")
+
+    def _get_contentscache(self, character, location, branch, turn, tick, *, forward=False):
+        # any thing in the character might move here
+        self._note_read(character)
+        self.db._load_at(branch, turn)
+        return self._get_keycachelike(
+            self.contentscache, self.contents, self._slow_iter_keys, (character, location),
+            branch, turn, tick, forward=forward
+        )
+
+    def iter_contents(self, character, location, branch, turn, tick, *, forward=False):
+        """Iterate over the things in a location at a given time."""
+        # copied, so that you can move the things while you look
+        yield from list(self._get_contentscache(
+            character, location, branch, turn, tick, forward=forward
+        ))
+
+    def count_contents(self, character, location, branch, turn, tick, *, forward=False):
+        """Return how many things are in a location at a given time."""
+        return len(self._get_contentscache(
+            character, location, branch, turn, tick, forward=forward
+        ))
+
+    def has_content(self, character, location, thing, branch, turn, tick, *, forward=False):
+        """Return whether a thing is in a location at a given time."""
+        return thing in self._get_contentscache(
+            character, location, branch, turn, tick, forward=forward
+        )
 
     def turn_before(self, character, thing, branch, turn):
         try:
@@ -6,12 +6,24 @@ flow of time.
 
 """
 from random import Random
+from hashlib import sha256
 from functools import partial, partialmethod
+from multiprocessing import get_context, get_all_start_methods
 from types import FunctionType
 from json import dumps, loads, JSONEncoder
 from operator import gt, lt, ge, le, eq, ne
 from blinker import Signal
-from allegedb import ORM as gORM, update_window, update_backward_window
+from allegedb import (
+    ORM as gORM,
+    DeltaFilter as GraphDeltaFilter,
+    update_window,
+    update_backward_window,
+    delta_leaves,
+    matcher,
+    filtered,
+    filtered_changes
+)
+from allegedb.cache import Cache
 from allegedb.xjson import JSONReWrapper, JSONListReWrapper
 from .xcollections import (
     StringStore,
@@ -27,8 +39,9 @@ from .rule import AllRuleBooks, AllRules, Rule
 from .query import Query, QueryEngine
 from .util import getatt, reify, EntityStatAccessor
 from .cache import (
-    Cache,
     EntitylessCache,
+    RulebooksCache,
+    EntityRulebooksCache,
     AvatarnessCache,
     AvatarRulesHandledCache,
     CharacterThingRulesHandledCache,
@@ -37,14 +50,73 @@ from .cache import (
     NodeRulesHandledCache,
     PortalRulesHandledCache,
     CharacterRulesHandledCache,
+    NodeValCache,
+    NodesCache,
+    EdgesCache,
     ThingsCache
 )
+from .view import View
+
+
+class DeltaFilter(GraphDeltaFilter):
+    """Which parts of the world a delta should describe.
+
+    ``characters``, ``nodes``, and ``stats`` work like the ``graphs``,
+    ``nodes``, and ``stats`` of :class:`allegedb.DeltaFilter`. Things'
+    locations are never filtered out by ``stats``.
+
+    ``rulebooks`` limits the changes to rulebooks, to the rules in
+    them, and to which rulebooks the watched entities follow.
+
+    """
+    def __init__(self, characters=None, nodes=None, stats=None, rulebooks=None):
+        super().__init__(characters, nodes, stats)
+        self.rulebook = matcher(rulebooks)
+
+    def for_things(self):
+        if self.graph is None and self.node is None:
+            return None
+        return lambda char, thing, locs: self._want(char, thing)
+
+    def for_rulebooks(self):
+        if self.rulebook is None:
+            return None
+        return lambda _, rulebook, rules: self.rulebook(rulebook)
+
+    def for_rules(self, engine):
+        if self.rulebook is None:
+            return None
+        rules = {
+            rule for rulebook in engine.rulebook if self.rulebook(rulebook)
+            for rule in engine.rulebook[rulebook]
+        }
+        return lambda _, rule, funs: rule in rules
+
+    def for_character_rulebooks(self):
+        if self.graph is None and self.rulebook is None:
+            return None
+        return lambda _, char, rulebook: self._want(char) and (
+            self.rulebook is None or self.rulebook(rulebook))
+
+    def for_node_rulebooks(self):
+        if self.graph is None and self.node is None and self.rulebook is None:
+            return None
+        return lambda char, node, rulebook: self._want(char, node) and (
+            self.rulebook is None or self.rulebook(rulebook))
+
+    def for_portal_rulebooks(self):
+        if self.graph is None and self.node is None and self.rulebook is None:
+            return None
+        return lambda char, orig, dest, rulebook: self._want(
+            char, (orig, dest)) and (
+            self.rulebook is None or self.rulebook(rulebook))
 
 
 class NextTurn(Signal):
     """Make time move forward in the simulation.
 
-    Calls ``advance`` repeatedly, returning a list of the rules' return values.
+    Calls ``advance`` repeatedly, returning a list of the rules' return values,
+    and the delta, limited by ``delta_filter`` if you pass a :class:`DeltaFilter`.
 
     I am also a ``Signal``, so you can register functions to be
     called when the simulation runs. Pass them to my ``connect``
@@ -55,7 +127,7 @@ class NextTurn(Signal):
         super().__init__()
         self.engine = engine
 
-    def __call__(self):
+    def __call__(self, delta_filter=None):
         engine = self.engine
         start_branch, start_turn, start_tick = engine.btt()
         with engine.advancing:
@@ -81,7 +153,8 @@ class NextTurn(Signal):
                 turn_from=start_turn,
                 turn_to=engine.turn,
                 tick_from=start_tick,
-                tick_to=engine.tick
+                tick_to=engine.tick,
+                delta_filter=delta_filter
             )
         branch, turn = engine.time
         turn += 1
@@ -104,7 +177,8 @@ class NextTurn(Signal):
             turn_from=start_turn,
             turn_to=turn,
             tick_from=start_tick,
-            tick_to=engine.tick
+            tick_to=engine.tick,
+            delta_filter=delta_filter
         )
 
 
@@ -128,8 +202,61 @@ class FinalRule:
 final_rule = FinalRule()
 
 
-json_dump_hints = {final_rule: 'final_rule'}
-json_load_hints = {'final_rule': final_rule}
+class NoDatabase(object):
+    """Stands in for the query engine in a trigger worker.
+
+    The database connection belongs to the parent process, so the
+    worker mustn't use it.
+
+    """
+    def __getattr__(self, k):
+        raise RuntimeError("Trigger workers can't use the database")
+
+
+def _trigger_worker(engine, eternal, conn):
+    """Check rules' triggers for the engine that forked me, until it
+    sends ``None``.
+
+    Each time, it sends what it's stored in its caches since the last
+    time, its branches, the time, the state of its randomizer, and a
+    list of ``(rule, entity, branch, turn)``, naming rules to check and
+    the entities to check them on. I send back ``(True, results)``, or
+    ``(False, exception)`` if one was raised.
+
+    """
+    # Keep a reference to the connection, so it isn't closed from here,
+    # but never use it. Pretend to be loading already, so that a cache
+    # miss doesn't try to load anything.
+    query = engine.query  # noqa: F841
+    engine.query = NoDatabase()
+    engine.eternal = eternal
+    engine._loading = True
+    engine._journal = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            conn.close()
+            return
+        journal, branches, btt, rando_state, todo = msg
+        try:
+            for (cachename, args, planning, forward) in journal:
+                cache = getattr(engine, cachename)
+                if isinstance(cache, EntitylessCache):
+                    # journaled with the entity of ``None`` it adds
+                    Cache.store(cache, *args, planning=planning, forward=forward)
+                else:
+                    cache.store(*args, planning=planning, forward=forward)
+            engine._branches.update(branches)
+            engine._obranch, engine._oturn, engine._otick = btt
+            engine.rando.setstate(rando_state)
+            results = [
+                engine._check_rule_named(rulename, entname, branch, turn)
+                for (rulename, entname, branch, turn) in todo
+            ]
+        except Exception as ex:
+            conn.send((False, ex))
+        else:
+            conn.send((True, results))
 
 
 class Encoder(JSONEncoder):
@@ -179,11 +306,16 @@ class AbstractEngine(object):
             tuple: lambda obj: ["tuple"] + [self.listify(v) for v in obj],
             dict: listify_dict,
             JSONReWrapper: listify_dict,
-            self.char_cls: lambda obj: ["character", obj.name],
-            self.thing_cls: lambda obj: ["thing", obj.character.name, obj.name, self.listify(obj.location.name), self.listify(obj.next_location.name), obj['arrival_time'], obj['next_arrival_time']],
-            self.place_cls: lambda obj: ["place", obj.character.name, obj.name],
+            self.char_cls: lambda obj: ["character", self.listify(obj.name)],
+            self.thing_cls: lambda obj: [
+                "thing", self.listify(obj.character.name), self.listify(obj.name),
+                self.listify(obj.location.name),
+                None if obj.next_location is None else self.listify(obj.next_location.name),
+                obj['arrival_time'], obj['next_arrival_time']],
+            self.place_cls: lambda obj: ["place", self.listify(obj.character.name), self.listify(obj.name)],
             self.portal_cls: lambda obj: [
-                "portal", obj.character.name, obj.orig, obj.dest],
+                "portal", self.listify(obj.character.name),
+                self.listify(obj.orig), self.listify(obj.dest)],
             FunctionType: self._listify_function
         }
 
@@ -253,21 +385,13 @@ class AbstractEngine(object):
         return EngEncoder
 
     def json_dump(self, obj):
-        global json_dump_hints, json_load_hints
-        try:
-            if obj not in json_dump_hints:
-                dumped = json_dump_hints[obj] = dumps(
-                    obj, cls=self.json_encoder
-                )
-                json_load_hints[dumped] = obj
-            return json_dump_hints[obj]
-        except TypeError:
-            return dumps(obj, cls=self.json_encoder)
+        if obj is final_rule:
+            return 'final_rule'
+        return dumps(obj, cls=self.json_encoder)
 
     def json_load(self, s):
-        global json_dump_hints, json_load_hints
-        if s in json_load_hints:
-            return json_load_hints[s]
+        if s == 'final_rule':
+            return final_rule
         return self.delistify(loads(s))
 
 
@@ -320,6 +444,35 @@ class Engine(AbstractEngine, gORM):
       state of the randomizer is saved here under the key
       ``'rando_state'``.
     - ``rando``: The randomizer used by all of the rules.
+    - ``view``: A mapping of the :class:`View` objects made with
+      ``new_view``, each the set of nodes whose stat passes some test,
+      kept up to date as time passes. Their definitions are saved in
+      ``eternal['views']``.
+    - ``skipped_rules``: With ``track_reads=True``, how many times a
+      rule has been marked handled without checking its triggers and
+      prereqs, because nothing they looked at the last time they came
+      up false has changed since. Triggers and prereqs that depend on
+      anything but the world state and the randomizer, such as the
+      current turn or ``eternal``, shouldn't be used this way.
+    - ``trigger_workers``: If set, how many processes to check the
+      triggers and prereqs of each kind of rule in. They're all
+      checked against the world as it was before any of that kind of
+      rule ran, and whatever they draw from the randomizer doesn't
+      advance it here, unless you use ``rule_random_streams``. The
+      actions are still run here, in the usual order. The processes
+      are forked the first time they're needed and kept until
+      :meth:`close`, except that loading history or making a new
+      character, branch, rule, or function forks them over again.
+      They never use the database, and they see ``eternal`` as it was
+      when they were forked.
+    - ``rule_random_streams``: If ``True``, rules don't share ``rando``.
+      Each rule gets its own randomizer for each entity it's applied
+      to, in each turn of each branch, derived from the world's
+      ``eternal['rule_random_seed']``, one for checking its triggers
+      and prereqs and another for its actions. The randomizing methods
+      like ``coinflip`` and ``roll_die`` use it while the rule runs.
+      Then the order rules run in, or whether some are skipped,
+      doesn't change what random numbers the others get.
 
     """
     char_cls = Character
@@ -329,6 +482,7 @@ class Engine(AbstractEngine, gORM):
     query_engine_cls = QueryEngine
     illegal_graph_names = ['global', 'eternal', 'universal', 'rulebooks', 'rules']
     illegal_node_names = ['nodes', 'node_val', 'edges', 'edge_val', 'things']
+    _special_delta_depths = {'universal': 1, 'rulebooks': 1, 'rules': 2}
 
     def _make_node(self, char, node):
         if self._is_thing(char.name, node):
@@ -336,7 +490,7 @@ class Engine(AbstractEngine, gORM):
         else:
             return Place(char, node)
 
-    def get_delta(self, branch, turn_from, tick_from, turn_to, tick_to):
+    def get_delta(self, branch, turn_from, tick_from, turn_to, tick_to, delta_filter=None):
         """Get a dictionary describing changes to the world.
 
         Most keys will be character names, and their values will be dictionaries of
@@ -365,10 +519,14 @@ class Engine(AbstractEngine, gORM):
         * 'rules', a dictionary keyed by the name of each changed rule, containing any
         of the lists 'triggers', 'prereqs', and 'actions'
 
+        With a :class:`DeltaFilter`, only the changes it wants are included.
+
         """
         if turn_from == turn_to:
-            return self.get_turn_delta(branch, turn_to, tick_to, start_tick=tick_from)
-        delta = super().get_delta(branch, turn_from, tick_from, turn_to, tick_to)
+            return self.get_turn_delta(
+                branch, turn_to, tick_to, start_tick=tick_from, delta_filter=delta_filter)
+        delta = super().get_delta(branch, turn_from, tick_from, turn_to, tick_to, delta_filter)
+        filt = delta_filter or DeltaFilter()
         if turn_from < turn_to:
             updater = partial(update_window, turn_from, tick_from, turn_to, tick_to)
             univbranches = self._universal_cache.settings
@@ -420,44 +578,48 @@ class Engine(AbstractEngine, gORM):
             thingd['location'] = loc
             thingd['next_location'] = nxtloc
         if branch in thbranches:
-            updater(updthing, thbranches[branch])
+            updater(filtered(filt.for_things(), updthing), thbranches[branch])
         # TODO handle arrival_time and next_arrival_time stats of things
 
         def updrb(whatev, rulebook, rules):
             delta.setdefault('rulebooks', {})[rulebook] = rules
 
         if branch in rbbranches:
-            updater(updrb, rbbranches[branch])
+            updater(filtered(filt.for_rulebooks(), updrb), rbbranches[branch])
+
+        rules_pred = filt.for_rules(self)
 
         def updru(key, _, rule, funs):
             delta.setdefault('rules', {}).setdefault(rule, {})[key] = funs
 
         if branch in trigbranches:
-            updater(partial(updru, 'triggers'), trigbranches[branch])
+            updater(filtered(rules_pred, partial(updru, 'triggers')), trigbranches[branch])
 
         if branch in preqbranches:
-            updater(partial(updru, 'prereqs'), preqbranches[branch])
+            updater(filtered(rules_pred, partial(updru, 'prereqs')), preqbranches[branch])
 
         if branch in actbranches:
-            updater(partial(updru, 'actions'), actbranches[branch])
+            updater(filtered(rules_pred, partial(updru, 'actions')), actbranches[branch])
+
+        crb_pred = filt.for_character_rulebooks()
 
         def updcrb(key, _, character, rulebook):
             delta.setdefault(character, {})[key] = rulebook
 
         if branch in charrbbranches:
-            updater(partial(updcrb, 'character_rulebook'), charrbbranches[branch])
+            updater(filtered(crb_pred, partial(updcrb, 'character_rulebook')), charrbbranches[branch])
 
         if branch in avrbbranches:
-            updater(partial(updcrb, 'avatar_rulebook'), avrbbranches[branch])
+            updater(filtered(crb_pred, partial(updcrb, 'avatar_rulebook')), avrbbranches[branch])
 
         if branch in charthrbbranches:
-            updater(partial(updcrb, 'character_thing_rulebook'), charthrbbranches[branch])
+            updater(filtered(crb_pred, partial(updcrb, 'character_thing_rulebook')), charthrbbranches[branch])
 
         if branch in charplrbbranches:
-            updater(partial(updcrb, 'character_place_rulebook'), charplrbbranches[branch])
+            updater(filtered(crb_pred, partial(updcrb, 'character_place_rulebook')), charplrbbranches[branch])
 
         if branch in charporbbranches:
-            updater(partial(updcrb, 'character_portal_rulebook'), charporbbranches[branch])
+            updater(filtered(crb_pred, partial(updcrb, 'character_portal_rulebook')), charporbbranches[branch])
 
         def updnoderb(character, node, rulebook):
             if (
@@ -468,7 +630,7 @@ class Engine(AbstractEngine, gORM):
             delta.setdefault(character, {}).setdefault('node_val', {}).setdefault(node, {})['rulebook'] = rulebook
 
         if branch in noderbbranches:
-            updater(updnoderb, noderbbranches[branch])
+            updater(filtered(filt.for_node_rulebooks(), updnoderb), noderbbranches[branch])
 
         def updedgerb(character, orig, dest, rulebook):
             if (
@@ -481,64 +643,115 @@ class Engine(AbstractEngine, gORM):
                 orig, {}).setdefault(dest, {})['rulebook'] = rulebook
 
         if branch in edgerbbranches:
-            updater(updedgerb, edgerbbranches[branch])
+            updater(filtered(filt.for_portal_rulebooks(), updedgerb), edgerbbranches[branch])
 
         return delta
 
-    def get_turn_delta(self, branch=None, turn=None, tick=None, start_tick=0):
+    def delta_chunks(self, delta, size):
+        """Split a delta from ``get_delta`` into smaller deltas of about
+        ``size`` changes each, emptying ``delta`` as I go.
+
+        Applying the chunks in order has the same effect as applying the
+        whole delta. A new node's stats come in the same chunk that
+        creates it, and portals are created before their stats arrive.
+
+        """
+        chunk = {}
+        n = 0
+        for unit in self._delta_units(delta):
+            for path, val in unit:
+                d = chunk
+                for k in path[:-1]:
+                    d = d.setdefault(k, {})
+                d[path[-1]] = val
+            n += len(unit)
+            if n >= size:
+                yield chunk
+                chunk = {}
+                n = 0
+        if chunk:
+            yield chunk
+
+    def _delta_units(self, delta):
+        special = self._special_delta_depths
+        depths = self._graph_delta_depths
+        while delta:
+            top, topd = delta.popitem()
+            if top in special:
+                for leaf in delta_leaves((top,), topd, special[top]):
+                    yield [leaf]
+                continue
+            nodevals = topd.pop('node_val', {})
+            for node, ex in topd.pop('nodes', {}).items():
+                unit = [((top, 'nodes', node), ex)]
+                if ex and node in nodevals:
+                    unit.extend(delta_leaves((top, 'node_val', node), nodevals.pop(node), 1))
+                yield unit
+            for section in ('edges', 'edge_val'):
+                for leaf in delta_leaves((top, section), topd.pop(section, {}), depths[section]):
+                    yield [leaf]
+            for leaf in delta_leaves((top, 'node_val'), nodevals, depths['node_val']):
+                yield [leaf]
+            for key, val in topd.items():
+                yield [((top, key), val)]
+
+    def get_turn_delta(self, branch=None, turn=None, tick=None, start_tick=0, delta_filter=None):
         """Get a dictionary describing changes to the world within a given turn
 
         Defaults to the present turn, and stops at the present tick unless specified.
 
         See the documentation for ``get_delta`` for a detailed description of the
-        delta format.
+        delta format, and ``delta_filter``.
 
         """
         branch = branch or self.branch
-        turn = turn or self.turn
-        tick = tick or self.tick
-        delta = super().get_turn_delta(branch, turn, start_tick, tick)
+        turn = self.turn if turn is None else turn
+        tick = self.tick if tick is None else tick
+        delta = super().get_turn_delta(branch, turn, start_tick, tick, delta_filter)
+        filt = delta_filter or DeltaFilter()
+        rules_pred = filt.for_rules(self)
+        crb_pred = filt.for_character_rulebooks()
         if branch in self._things_cache.settings and self._things_cache.settings[branch].has_exact_rev(turn):
-            for chara, thing, (location, next_location) in self._things_cache.settings[branch][turn][start_tick:tick]:
+            for chara, thing, (location, next_location) in filtered_changes(filt.for_things(), self._things_cache.settings[branch][turn][start_tick:tick]):
                 thingd = delta.setdefault(chara, {}).setdefault('node_val', {}).setdefault(thing, {})
                 thingd['location'] = location
                 thingd['next_location'] = next_location
         delta['rulebooks'] = rbdif = {}
         if branch in self._rulebooks_cache.settings and self._rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, rulebook, rules in self._rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, rulebook, rules in filtered_changes(filt.for_rulebooks(), self._rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 rbdif[rulebook] = rules
         delta['rules'] = rdif = {}
         if branch in self._triggers_cache.settings and self._triggers_cache.settings[branch].has_exact_rev(turn):
-            for _, rule, funs in self._triggers_cache.settings[branch][turn][start_tick:tick]:
+            for _, rule, funs in filtered_changes(rules_pred, self._triggers_cache.settings[branch][turn][start_tick:tick]):
                 rdif.setdefault(rule, {})['triggers'] = funs
         if branch in self._prereqs_cache.settings and self._prereqs_cache.settings[branch].has_exact_rev(turn):
-            for _, rule, funs in self._prereqs_cache.settings[branch][turn][start_tick:tick]:
+            for _, rule, funs in filtered_changes(rules_pred, self._prereqs_cache.settings[branch][turn][start_tick:tick]):
                 rdif.setdefault(rule, {})['prereqs'] = funs
-        if branch in self._actions_cache.settings and self._triggers_cache.settings[branch].has_exact_rev(turn):
-            for _, rule, funs in self._triggers_cache.settings[branch][turn][start_tick:tick]:
+        if branch in self._actions_cache.settings and self._actions_cache.settings[branch].has_exact_rev(turn):
+            for _, rule, funs in filtered_changes(rules_pred, self._actions_cache.settings[branch][turn][start_tick:tick]):
                 rdif.setdefault(rule, {})['actions'] = funs
 
         if branch in self._characters_rulebooks_cache.settings and self._characters_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, character, rulebook in self._characters_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, character, rulebook in filtered_changes(crb_pred, self._characters_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {})['character_rulebook'] = rulebook
         if branch in self._avatars_rulebooks_cache.settings and self._avatars_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, character, rulebook in self._avatars_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, character, rulebook in filtered_changes(crb_pred, self._avatars_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {})['avatar_rulebook'] = rulebook
         if branch in self._characters_things_rulebooks_cache.settings and self._characters_things_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, character, rulebook in self._characters_things_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, character, rulebook in filtered_changes(crb_pred, self._characters_things_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {})['character_thing_rulebook'] = rulebook
         if branch in self._characters_places_rulebooks_cache.settings and self._characters_places_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, character, rulebook in self._characters_places_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, character, rulebook in filtered_changes(crb_pred, self._characters_places_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {})['character_place_rulebook'] = rulebook
         if branch in self._characters_portals_rulebooks_cache.settings and self._characters_portals_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for _, character, rulebook in self._characters_portals_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for _, character, rulebook in filtered_changes(crb_pred, self._characters_portals_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {})['character_portal_rulebook'] = rulebook
 
         if branch in self._nodes_rulebooks_cache.settings and self._nodes_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for character, node, rulebook in self._nodes_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for character, node, rulebook in filtered_changes(filt.for_node_rulebooks(), self._nodes_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {}).setdefault('node_val', {}).setdefault(node, {})['rulebook'] = rulebook
         if branch in self._portals_rulebooks_cache.settings and self._portals_rulebooks_cache.settings[branch].has_exact_rev(turn):
-            for character, orig, dest, rulebook in self._portals_rulebooks_cache.settings[branch][turn][start_tick:tick]:
+            for character, orig, dest, rulebook in filtered_changes(filt.for_portal_rulebooks(), self._portals_rulebooks_cache.settings[branch][turn][start_tick:tick]):
                 delta.setdefault(character, {}).setdefault('edge_val', {})\
                     .setdefault(orig, {}).setdefault(dest, {})['rulebook'] = rulebook
         return delta
@@ -579,12 +792,12 @@ class Engine(AbstractEngine, gORM):
         del self._rulebooks_cache._data[rulebook]
 
     def _set_node_rulebook(self, character, node, rulebook):
-        branch, turn, tick = self.engine.nbtt()
+        branch, turn, tick = self.nbtt()
         self._nodes_rulebooks_cache.store(character, node, branch, turn, tick, rulebook)
-        self.engine.query.set_node_rulebook(character, node, branch, turn, tick, rulebook)
+        self.query.set_node_rulebook(character, node, branch, turn, tick, rulebook)
 
     def _set_portal_rulebook(self, character, orig, dest, rulebook):
-        branch, turn, tick = self.engine.nbtt()
+        branch, turn, tick = self.nbtt()
         self._portals_rulebooks_cache.store(character, orig, dest, branch, turn, tick, rulebook)
         self.query.set_portal_rulebook(character, orig, dest, branch, turn, tick, rulebook)
 
@@ -628,18 +841,23 @@ class Engine(AbstractEngine, gORM):
 
     def _init_caches(self):
         super()._init_caches()
+        self._nodes_cache = NodesCache(self)
+        self._edges_cache = EdgesCache(self)
+        self._node_val_cache = NodeValCache(self)
         self._portal_objs = {}
         self._things_cache = ThingsCache(self)
         self.character = self.graph = CharacterMapping(self)
         self._universal_cache = EntitylessCache(self)
-        self._rulebooks_cache = EntitylessCache(self)
+        self._rulebooks_cache = RulebooksCache(self)
         self._characters_rulebooks_cache = EntitylessCache(self)
         self._avatars_rulebooks_cache = EntitylessCache(self)
         self._characters_things_rulebooks_cache = EntitylessCache(self)
         self._characters_places_rulebooks_cache = EntitylessCache(self)
         self._characters_portals_rulebooks_cache = EntitylessCache(self)
-        self._nodes_rulebooks_cache = Cache(self)
-        self._portals_rulebooks_cache = Cache(self)
+        self._nodes_rulebooks_cache = EntityRulebooksCache(
+            self, self._nodes_cache.contains_entity)
+        self._portals_rulebooks_cache = EntityRulebooksCache(
+            self, self._edges_cache.has_successor)
         self._triggers_cache = EntitylessCache(self)
         self._prereqs_cache = EntitylessCache(self)
         self._actions_cache = EntitylessCache(self)
@@ -675,6 +893,24 @@ class Engine(AbstractEngine, gORM):
                 self.eternal.setdefault('language', 'eng')
             )
 
+    def _reset_caches(self):
+        super()._reset_caches()
+        for cache in (
+                self._things_cache, self._universal_cache, self._rulebooks_cache,
+                self._characters_rulebooks_cache, self._avatars_rulebooks_cache,
+                self._characters_things_rulebooks_cache, self._characters_places_rulebooks_cache,
+                self._characters_portals_rulebooks_cache, self._nodes_rulebooks_cache,
+                self._portals_rulebooks_cache, self._triggers_cache, self._prereqs_cache,
+                self._actions_cache, self._node_rules_handled_cache, self._portal_rules_handled_cache,
+                self._character_rules_handled_cache, self._avatar_rules_handled_cache,
+                self._character_thing_rules_handled_cache, self._character_place_rules_handled_cache,
+                self._character_portal_rules_handled_cache, self._avatarness_cache
+        ):
+            cache.clear()
+        # the views will work out their members again when next used
+        for view in self.view.values():
+            view.reset()
+
     def _load_graphs(self):
         for charn in self.query.characters():
             self._graph_objs[charn] = Character(self, charn, init_rulebooks=False)
@@ -694,12 +930,25 @@ class Engine(AbstractEngine, gORM):
             commit_modulus=None,
             random_seed=None,
             logfun=None,
-            validate=False
+            validate=False,
+            memo_size=None,
+            load_window=None,
+            keyframe_interval=None,
+            turn_granular=(),
+            track_reads=False,
+            trigger_workers=None,
+            rule_random_streams=False
     ):
         """Store the connections for the world database and the code database;
         set up listeners; and start a transaction
 
         """
+        if trigger_workers and 'fork' not in get_all_start_methods():
+            raise ValueError("trigger_workers needs processes that can fork")
+        self.trigger_workers = trigger_workers
+        self._trigger_pool = None
+        self.view = {}
+        self.rule_random_streams = rule_random_streams
         if isinstance(string, str):
             self._string_file = string
         else:
@@ -728,8 +977,15 @@ class Engine(AbstractEngine, gORM):
             worlddb,
             connect_args=connect_args,
             alchemy=alchemy,
-            validate=validate
+            validate=validate,
+            memo_size=memo_size,
+            load_window=load_window,
+            keyframe_interval=keyframe_interval,
+            turn_granular=turn_granular,
+            track_reads=track_reads
         )
+        self._rule_reads = {}
+        self.skipped_rules = 0
         self.next_turn = NextTurn(self)
         if logfun is None:
             from logging import getLogger
@@ -748,60 +1004,70 @@ class Engine(AbstractEngine, gORM):
         else:
             self.rando.seed(self.random_seed)
             self.universal['rando_state'] = self.rando.getstate()
+        if rule_random_streams:
+            if 'rule_random_seed' not in self.eternal:
+                self.eternal['rule_random_seed'] = Random(self.random_seed).getrandbits(64)
+            self._rule_random_seed = self.eternal['rule_random_seed']
+        if trigger_workers:
+            for store in (self.action, self.prereq, self.trigger, self.function, self.method):
+                store.connect(self._break_journal)
+            self.rule.connect(self._break_journal)
+        for name, (stat, test, character) in self.eternal.get('views', {}).items():
+            self.view[name] = View(self, name, stat, test, character)
         if hasattr(self.method, 'init'):
             self.method.init(self)
 
-    def _init_load(self, validate=False):
+    def _init_load(self, validate=False, window=None):
         q = self.query
         self._things_cache.load((
             (character, thing, branch, turn, tick, (location, next_location))
             for character, thing, branch, turn, tick, location, next_location
-            in q.things_dump()
+            in q.things_dump(window)
         ), validate)
-        super()._init_load(validate=validate)
-        self._avatarness_cache.load(q.avatars_dump(), validate)
-        self._universal_cache.load(q.universals_dump(), validate)
-        self._rulebooks_cache.load(q.rulebooks_dump(), validate)
-        self._characters_rulebooks_cache.load(q.character_rulebook_dump(), validate)
-        self._avatars_rulebooks_cache.load(q.avatar_rulebook_dump(), validate)
-        self._characters_things_rulebooks_cache.load(q.character_thing_rulebook_dump(), validate)
-        self._characters_places_rulebooks_cache.load(q.character_place_rulebook_dump(), validate)
-        self._characters_portals_rulebooks_cache.load(q.character_portal_rulebook_dump(), validate)
-        self._nodes_rulebooks_cache.load(q.node_rulebook_dump(), validate)
-        self._portals_rulebooks_cache.load(q.portal_rulebook_dump(), validate)
-        self._triggers_cache.load(q.rule_triggers_dump(), validate)
-        self._prereqs_cache.load(q.rule_prereqs_dump(), validate)
-        self._actions_cache.load(q.rule_actions_dump(), validate)
+        super()._init_load(validate=validate, window=window)
+        self._avatarness_cache.load(q.avatars_dump(window), validate)
+        self._universal_cache.load(q.universals_dump(window), validate)
+        self._rulebooks_cache.load(q.rulebooks_dump(window), validate)
+        self._characters_rulebooks_cache.load(q.character_rulebook_dump(window), validate)
+        self._avatars_rulebooks_cache.load(q.avatar_rulebook_dump(window), validate)
+        self._characters_things_rulebooks_cache.load(q.character_thing_rulebook_dump(window), validate)
+        self._characters_places_rulebooks_cache.load(q.character_place_rulebook_dump(window), validate)
+        self._characters_portals_rulebooks_cache.load(q.character_portal_rulebook_dump(window), validate)
+        self._nodes_rulebooks_cache.load(q.node_rulebook_dump(window), validate)
+        self._portals_rulebooks_cache.load(q.portal_rulebook_dump(window), validate)
+        self._triggers_cache.load(q.rule_triggers_dump(window), validate)
+        self._prereqs_cache.load(q.rule_prereqs_dump(window), validate)
+        self._actions_cache.load(q.rule_actions_dump(window), validate)
         # I'm throwing out the ticks here, but I think I might want to use them
         # to map handled rules to changes made by those rules
-        for character, rulebook, rule, branch, turn, tick in q.character_rules_handled_dump():
+        for character, rulebook, rule, branch, turn, tick in q.character_rules_handled_dump(window):
             self._character_rules_handled_cache.store(
                 character, rulebook, rule, branch, turn, loading=True
             )
         for character, rulebook, rule, graph, avatar, branch, turn, tick in \
-                q.avatar_rules_handled_dump():
+                q.avatar_rules_handled_dump(window):
             self._avatar_rules_handled_cache.store(
                 character, rulebook, rule, graph, avatar, branch, turn, loading=True
             )
         for character, rulebook, rule, thing, branch, turn, tick in \
-                q.character_thing_rules_handled_dump():
+                q.character_thing_rules_handled_dump(window):
             self._character_thing_rules_handled_cache.store(
                 character, rulebook, rule, thing, branch, turn, loading=True
             )
         for character, rulebook, rule, place, branch, turn, tick in \
-                q.character_place_rules_handled_dump():
+                q.character_place_rules_handled_dump(window):
             self._character_place_rules_handled_cache.store(
                 character, rulebook, rule, place, branch, turn, loading=True
             )
         for character, rulebook, rule, orig, dest, branch, turn, tick in \
-                q.character_portal_rules_handled_dump():
+                q.character_portal_rules_handled_dump(window):
             self._character_portal_rules_handled_cache.store(
                 character, rulebook, rule, orig, dest, branch, turn, loading=True
             )
-        for character, node, rulebook, rule, branch, turn, tick in q.node_rules_handled_dump():
+        for character, node, rulebook, rule, branch, turn, tick in q.node_rules_handled_dump(window):
             self._node_rules_handled_cache.store(character, node, rulebook, rule, branch, turn, tick, loading=True)
-        for character, orig, dest, rulebook, rule, branch, turn, tick in q.portal_rules_handled_dump():
-            self._portal_rules_handled_cache.store(character, orig, dest, rulebook, rule, branch, turn, tick)
+        for character, orig, dest, rulebook, rule, branch, turn, tick in q.portal_rules_handled_dump(window):
+            self._portal_rules_handled_cache.store(character, orig, dest, rulebook, rule, branch, turn, tick, loading=True)
         self._rules_cache = {name: Rule(self, name, create=False) for name in q.rules_dump()}
 
     betavariate = getatt('rando.betavariate')
@@ -866,11 +1132,13 @@ class Engine(AbstractEngine, gORM):
         """Roll ``n`` dice with ``d`` faces, and yield the results.
 
         This is an iterator. You'll get the result of each die in
-        successon.
+        successon. They come from the randomizer I had when you called
+        this, even if a rule with its own randomizer has finished by
+        the time you look.
 
         """
-        for i in range(0, n):
-            yield self.roll_die(d)
+        randint = self.rando.randint
+        return (randint(1, d) for i in range(0, n))
 
     def dice_check(self, n, d, target, comparator=le):
         """Roll ``n`` dice with ``d`` sides, sum them, and return whether they
@@ -912,6 +1180,8 @@ class Engine(AbstractEngine, gORM):
 
     def close(self):
         """Commit changes and close the database."""
+        if self._trigger_pool is not None:
+            self._stop_trigger_workers()
         for store in self.stores:
             if hasattr(store, 'save'):
                 store.save()
@@ -1031,144 +1301,353 @@ class Engine(AbstractEngine, gORM):
             character, orig, dest, rulebook, rule, branch, turn, tick
         )
 
-    def _follow_rule(self, rule, handled_fun, branch, turn, *args):
-        satisfied = True
+    def _rule_satisfied(self, rule, *args):
         for prereq in rule.prereqs:
-            res = prereq(*args)
-            if not res:
-                satisfied = False
-                break
-        if not satisfied:
-            return handled_fun()
+            if not prereq(*args):
+                return False
         for trigger in rule.triggers:
-            res = trigger(*args)
-            if res:
-                break
+            if trigger(*args):
+                return True
+        return False
+
+    def _tracked_rule_satisfied(self, rule, handled_fun, branch, turn, *args):
+        # the handler's arguments, less the time, say which rule this is
+        # and what it's applied to
+        key = handled_fun.args[:-3]
+        if key in self._rule_reads:
+            was_branch, was_turn, serial, reads = self._rule_reads[key]
+            if was_branch == branch and was_turn < turn \
+                    and not self.changed_since(reads, serial):
+                self.skipped_rules += 1
+                return False
+        serial = self.write_serial
+        rando_state = self.rando.getstate()
+        with self.tracking_reads as reads:
+            satisfied = self._rule_satisfied(rule, *args)
+        if satisfied or self.rando.getstate() != rando_state:
+            # randomness isn't in the caches, so there's no telling
+            # when it would have come out different
+            self._rule_reads.pop(key, None)
+        else:
+            self._rule_reads[key] = (branch, turn, serial, reads)
+        return satisfied
+
+    def _rule_random(self, rule, entity, branch, turn, purpose):
+        """Return a randomizer just for this rule, applied to this entity,
+        at this time, for checking its triggers or running its actions.
+
+        """
+        digest = sha256(repr((
+            self._rule_random_seed, rule.name, self._entity_name(entity),
+            branch, turn, purpose
+        )).encode()).digest()
+        return Random(int.from_bytes(digest, 'big'))
+
+    def _entity_name(self, entity):
+        """Return a tuple naming a character, node, or portal."""
+        if isinstance(entity, self.char_cls):
+            return (entity.name,)
+        elif isinstance(entity, self.portal_cls):
+            return (entity.character.name, entity.orig, entity.dest)
+        else:
+            return (entity.character.name, entity.name)
+
+    def _entity_named(self, name):
+        """Return the character, node, or portal that ``_entity_name``
+        gave this ``name``.
+
+        """
+        char = self.character[name[0]]
+        if len(name) == 1:
+            return char
+        elif len(name) == 3:
+            return char.portal[name[1]][name[2]]
         else:
-            return handled_fun()
-        actres = []
-        for action in rule.actions:
-            res = action(*args)
-            if res:
-                actres.append(res)
-        handled_fun()
-        return actres
+            return char.node[name[1]]
+
+    def _check_rule_named(self, rulename, entname, branch, turn):
+        """Return whether a rule's prereqs and triggers are satisfied,
+        looking up the rule and the entity by name.
+
+        """
+        rule = self.rule[rulename]
+        entity = self._entity_named(entname)
+        if not self.rule_random_streams:
+            return self._rule_satisfied(rule, entity)
+        rando = self.rando
+        self.rando = self._rule_random(rule, entity, branch, turn, 'check')
+        try:
+            return self._rule_satisfied(rule, entity)
+        finally:
+            self.rando = rando
+
+    def _check_rule(self, rule, handled_fun, branch, turn, *args):
+        if self._written is None:
+            return self._rule_satisfied(rule, *args)
+        return self._tracked_rule_satisfied(rule, handled_fun, branch, turn, *args)
+
+    def _follow_rule(self, rule, handled_fun, branch, turn, *args, satisfied=None):
+        streams = self.rule_random_streams
+        rando = self.rando
+        try:
+            if satisfied is None:
+                if streams:
+                    self.rando = self._rule_random(rule, args[0], branch, turn, 'check')
+                satisfied = self._check_rule(rule, handled_fun, branch, turn, *args)
+            if not satisfied:
+                return handled_fun()
+            if streams:
+                self.rando = self._rule_random(rule, args[0], branch, turn, 'act')
+            actres = []
+            for action in rule.actions:
+                res = action(*args)
+                if res:
+                    actres.append(res)
+            handled_fun()
+            return actres
+        finally:
+            self.rando = rando
+
+    def _iter_rule_phases(self, branch, turn, tick):
+        """Return generators of ``(rule, handled_fun, entity)`` for each
+        kind of rule, in the order they're followed.
+
+        Each only looks up what rules are unhandled when you start it.
+
+        """
+        charmap = self.character
+        rulemap = self.rule
+
+        def character_rules():
+            for (
+                charactername, rulebook, rulename
+            ) in list(
+                self._character_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                if charactername not in charmap:
+                    continue
+                yield (
+                    rulemap[rulename],
+                    partial(self._handled_char, charactername, rulebook, rulename, branch, turn, tick),
+                    charmap[charactername]
+                )
+
+        def avatar_rules():
+            for (
+                charn, rulebook, graphn, avn, rulen
+            ) in list(
+                self._avatar_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                if charn not in charmap:
+                    continue
+                char = charmap[charn]
+                if graphn not in char.avatar or avn not in char.avatar[graphn]:
+                    continue
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_av, charn, graphn, avn, rulebook, rulen, branch, turn, tick),
+                    charmap[graphn].node[avn]
+                )
+
+        def character_thing_rules():
+            for (
+                charn, rulebook, rulen, thingn
+            ) in list(
+                self._character_thing_rules_handled_cache.iter_unhandled_rules(branch, turn, tick)
+            ):
+                if charn not in charmap or thingn not in charmap[charn].thing:
+                    continue
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_char_thing, charn, thingn, rulebook, rulen, branch, turn, tick),
+                    charmap[charn].thing[thingn]
+                )
+
+        def character_place_rules():
+            for (
+                charn, rulebook, rulen, placen
+            ) in list(
+                self._character_place_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                if charn not in charmap or placen not in charmap[charn].place:
+                    continue
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_char_place, charn, placen, rulebook, rulen, branch, turn, tick),
+                    charmap[charn].place[placen]
+                )
+
+        def character_portal_rules():
+            for (
+                charn, rulebook, rulen, orign, destn
+            ) in list(
+                self._character_portal_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_char_port, charn, orign, destn, rulebook, rulen, branch, turn, tick),
+                    charmap[charn].portal[orign][destn]
+                )
+
+        def node_rules():
+            for (
+                    charn, noden, rulebook, rulen
+            ) in list(
+                self._node_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                if charn not in charmap or noden not in charmap[charn]:
+                    continue
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_node, charn, noden, rulebook, rulen, branch, turn, tick),
+                    charmap[charn].node[noden]
+                )
+
+        def portal_rules():
+            for (
+                    charn, orign, destn, rulebook, rulen
+            ) in list(
+                self._portal_rules_handled_cache.iter_unhandled_rules(
+                    branch, turn, tick
+                )
+            ):
+                if charn not in charmap:
+                    continue
+                char = charmap[charn]
+                if orign not in char.portal or destn not in char.portal[orign]:
+                    continue
+                yield (
+                    rulemap[rulen],
+                    partial(self._handled_portal, charn, orign, destn, rulebook, rulen, branch, turn, tick),
+                    charmap[charn].portal[orign][destn]
+                )
+
+        return (
+            character_rules(), avatar_rules(), character_thing_rules(),
+            character_place_rules(), character_portal_rules(), node_rules(),
+            portal_rules()
+        )
+
+    def _start_trigger_workers(self):
+        """Fork ``trigger_workers`` processes to check triggers in.
+
+        They get a copy of the world as it is now. From now on, what's
+        stored in the caches is kept in ``_journal``, to send to them
+        when they're needed next.
+
+        """
+        ctx = get_context('fork')
+        eternal = dict(self.eternal)
+        self._cache_names = {
+            cache: name for (name, cache) in vars(self).items()
+            if isinstance(cache, Cache)
+        }
+        self._journal = []
+        self._trigger_pool = []
+        for i in range(self.trigger_workers):
+            conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(
+                target=_trigger_worker, args=(self, eternal, child_conn),
+                daemon=True
+            )
+            proc.start()
+            child_conn.close()
+            self._trigger_pool.append((proc, conn))
+
+    def _stop_trigger_workers(self):
+        for proc, conn in self._trigger_pool:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for proc, conn in self._trigger_pool:
+            proc.join()
+        self._trigger_pool = None
+        self._journal = None
+
+    def _break_journal(self, *args, **kwargs):
+        """Make the trigger workers start over from a fresh copy of the
+        world next time.
+
+        For when something changed that isn't in the caches, like the
+        rules or the functions they use.
+
+        """
+        self._journal = None
+
+    def _check_rules_in_pool(self, todo):
+        """Return whether each rule in ``todo`` has its prereqs and
+        triggers satisfied, checking them in worker processes.
+
+        The same workers are used every time, and sent whatever was
+        stored in the caches since they were last used. When something
+        changed that can't be sent that way, such as history being
+        loaded, a new character or branch, or new rules or functions,
+        the workers are replaced with new ones, forked just now.
+
+        """
+        if self._trigger_pool is not None and self._journal is None:
+            self._stop_trigger_workers()
+        if self._trigger_pool is None:
+            self._start_trigger_workers()
+        names = self._cache_names
+        journal = [
+            (names[cache], args, planning, forward)
+            for (cache, args, planning, forward) in self._journal
+        ]
+        self._journal = []
+        state = (journal, self._branches.copy(), self.btt(), self.rando.getstate())
+        named = [
+            (rule.name, self._entity_name(entity)) + handled_fun.args[-3:-1]
+            for (rule, handled_fun, entity) in todo
+        ]
+        pool = self._trigger_pool
+        n = len(pool)
+        for i, (proc, conn) in enumerate(pool):
+            conn.send(state + (named[i::n],))
+        results = [None] * len(todo)
+        error = None
+        for i, (proc, conn) in enumerate(pool):
+            ok, res = conn.recv()
+            if ok:
+                results[i::n] = res
+            elif error is None:
+                error = res
+        if error is not None:
+            # there's no telling what state the workers' caches are in
+            self._stop_trigger_workers()
+            raise error
+        return results
 
     def _follow_rules(self):
         # TODO: rulebook priorities (not individual rule priorities, just follow the order of the rulebook)
         # TODO: apply changes to a facade first, and commit it when you're done. Then report changes to the facade
         branch, turn, tick = self.btt()
-        charmap = self.character
-        rulemap = self.rule
-
         # TODO: if there's a paradox while following some rule, start a new branch, copying handled rules
-        for (
-            charactername, rulebook, rulename
-        ) in list(
-            self._character_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            if charactername not in charmap:
-                continue
-            yield self._follow_rule(
-                rulemap[rulename],
-                partial(self._handled_char, charactername, rulebook, rulename, branch, turn, tick),
-                branch, turn,
-                charmap[charactername]
-            )
-        for (
-            charn, rulebook, graphn, avn, rulen
-        ) in list(
-            self._avatar_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            if charn not in charmap:
-                continue
-            char = charmap[charn]
-            if graphn not in char.avatar or avn not in char.avatar[graphn]:
-                continue
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_av, charn, graphn, avn, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[graphn].node[avn]
-            )
-        for (
-            charn, rulebook, rulen, thingn
-        ) in list(
-            self._character_thing_rules_handled_cache.iter_unhandled_rules(branch, turn, tick)
-        ):
-            if charn not in charmap or thingn not in charmap[charn].thing:
-                continue
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_char_thing, charn, thingn, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[charn].thing[thingn]
-            )
-        for (
-            charn, rulebook, rulen, placen
-        ) in list(
-            self._character_place_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            if charn not in charmap or placen not in charmap[charn].place:
-                continue
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_char_place, charn, placen, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[charn].place[placen]
-            )
-        for (
-            charn, rulebook, rulen, orign, destn
-        ) in list(
-            self._character_portal_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_char_port, charn, orign, destn, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[charn].portal[orign][destn]
-            )
-        for (
-                charn, noden, rulebook, rulen
-        ) in list(
-            self._node_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            if charn not in charmap or noden not in charmap[charn]:
-                continue
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_node, charn, noden, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[charn].node[noden]
-            )
-        for (
-                charn, orign, destn, rulebook, rulen
-        ) in list(
-            self._portal_rules_handled_cache.iter_unhandled_rules(
-                branch, turn, tick
-            )
-        ):
-            if charn not in charmap:
-                continue
-            char = charmap[charn]
-            if orign not in char.portal or destn not in char.portal[orign]:
-                continue
-            yield self._follow_rule(
-                rulemap[rulen],
-                partial(self._handled_port, charn, orign, destn, rulebook, rulen, branch, turn, tick),
-                branch, turn,
-                charmap[charn].portal[orign][destn]
-            )
+        for todo in self._iter_rule_phases(branch, turn, tick):
+            if self.trigger_workers:
+                todo = list(todo)
+                if len(todo) > 1:
+                    for (rule, handled_fun, entity), satisfied in zip(
+                            todo, self._check_rules_in_pool(todo)
+                    ):
+                        yield self._follow_rule(
+                            rule, handled_fun, branch, turn, entity, satisfied=satisfied
+                        )
+                    continue
+            for rule, handled_fun, entity in todo:
+                yield self._follow_rule(rule, handled_fun, branch, turn, entity)
 
     def advance(self):
         """Follow the next rule if available, or advance to the next turn."""
@@ -1178,6 +1657,37 @@ class Engine(AbstractEngine, gORM):
             self._rules_iter = self._follow_rules()
             return final_rule
 
+    def new_view(self, name, stat, test, character=None):
+        """Make a :class:`View` of the nodes whose ``stat`` passes ``test``,
+        and return it.
+
+        ``test`` is a function, or the name of one in my ``function``
+        store, that takes the value of the stat and returns whether the
+        node should be in the view. With ``character``, only look at the
+        nodes in that one.
+
+        The view is kept in my ``view`` mapping under ``name``, and it
+        comes back when I'm loaded again.
+
+        """
+        if callable(test):
+            self.function(test)
+            test = test.__name__
+        elif not hasattr(self.function, test):
+            raise KeyError("No such function: {}".format(test))
+        views = dict(self.eternal.get('views', {}))
+        views[name] = [stat, test, character]
+        self.eternal['views'] = views
+        ret = self.view[name] = View(self, name, stat, test, character)
+        return ret
+
+    def del_view(self, name):
+        """Stop keeping the view ``name`` up to date, and forget it."""
+        del self.view[name]
+        views = dict(self.eternal['views'])
+        del views[name]
+        self.eternal['views'] = views
+
     def new_character(self, name, **kwargs):
         """Create and return a new :class:`Character`."""
         self.add_character(name, **kwargs)
@@ -1281,4 +1791,11 @@ class Engine(AbstractEngine, gORM):
         return self.alias(v, stat)
 
     def ticks_when(self, query):
+        """Return the turns when ``query`` is true, in this branch.
+
+        The query isn't evaluated until the result is used. Its
+        ``windows`` attribute has a list of ``(turn_from, turn_to)``
+        pairs; iterate over it to get each turn.
+
+        """
         return query()
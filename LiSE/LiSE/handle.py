@@ -9,14 +9,31 @@ from re import match
 from collections import defaultdict
 from functools import partial
 from importlib import import_module
+from allegedb.cache import HistoryError
 from allegedb.xjson import (
     JSONReWrapper,
     JSONListReWrapper
 )
-from .engine import Engine
+from .engine import Engine, DeltaFilter
+from .snapshot import SnapshotWriter
 from .util import dict_delta, set_delta
 
 
+class DeltaStream(object):
+    """A result to be sent in pieces: each of my ``chunks``, then
+    ``final``.
+
+    """
+    __slots__ = ['chunks', 'final']
+
+    def __init__(self, chunks, final):
+        self.chunks = chunks
+        self.final = final
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
 class EngineHandle(object):
     """A wrapper for a :class:`LiSE.Engine` object that runs in the same
     process, but with an API built to be used in a command-processing
@@ -39,13 +56,14 @@ class EngineHandle(object):
         self._logq = logq
         self._loglevel = loglevel
         self._muted_chars = set()
+        self._delta_filter = None
         self.branch = self._real.branch
         self.turn = self._real.turn
         self.tick = self._real.tick
-        self._node_stat_cache = defaultdict(dict)
-        self._portal_stat_cache = defaultdict(
-            lambda: defaultdict(dict)
-        )
+        # the time each character was last described in a delta;
+        # node and portal stats are diffed from the history since then
+        self._char_delta_btt = {}
+        self._journal_memo = (None, None, None)
         self._char_stat_cache = {}
         self._char_av_cache = defaultdict(lambda: defaultdict(set))
         self._char_rulebooks_cache = {}
@@ -62,6 +80,7 @@ class EngineHandle(object):
         self._rule_cache = {}
         self._rulebook_cache = defaultdict(list)
         self._stores_cache = defaultdict(dict)
+        self._snapshot = None
 
     def log(self, level, message):
         if isinstance(level, str):
@@ -102,6 +121,48 @@ class EngineHandle(object):
     def advance(self):
         self._real.advance()
 
+    def batch(self, commands, stop_on_error=False):
+        """Run several commands in order, and return all their results.
+
+        ``commands`` is a list of dictionaries, each with the name of
+        one of my methods under ``'command'`` and the keyword arguments
+        to call it with under ``'kwargs'``. Set ``'branching'`` in one
+        to make a new branch if that command would cause a paradox.
+
+        Return a dictionary with the list of ``'results'``, in the same
+        order as ``commands``, and a list of ``'errors'``, each a list
+        of the index of the command that failed, the name of the
+        exception's type, and its message. Failed commands get ``None``
+        for a result. With ``stop_on_error=True``, don't run anything
+        after the first failure.
+
+        """
+        results = []
+        errors = []
+        for i, entry in enumerate(commands):
+            method = getattr(self, entry['command'])
+            kwargs = entry.get('kwargs', {})
+            try:
+                if entry.get('branching'):
+                    try:
+                        r = method(**kwargs)
+                    except HistoryError:
+                        self.increment_branch()
+                        r = method(**kwargs)
+                else:
+                    r = method(**kwargs)
+            except Exception as ex:
+                results.append(None)
+                errors.append([i, type(ex).__name__, str(ex)])
+                if stop_on_error:
+                    break
+                continue
+            results.append(r)
+            if hasattr(self, '_after_ret'):
+                self._after_ret()
+                del self._after_ret
+        return {'results': results, 'errors': errors}
+
     def get_char_deltas(self, chars, *, store=True):
         if chars == 'all':
             return {
@@ -128,12 +189,7 @@ class EngineHandle(object):
             # stores?
             for charn, char in self._real.character.items():
                 self._char_stat_cache[charn] = self.character_stat_copy(charn)
-                self._node_stat_cache[charn] = {
-                    node: self.node_stat_copy(charn, node) for node in char.node
-                }
-                portst = self._portal_stat_cache[charn]
-                for port in char.portals():
-                    portst.setdefault(port.orig, {})[port.dest] = self.portal_stat_copy(charn, port.orig, port.dest)
+                self._char_delta_btt[charn] = self._real.btt()
                 self._char_things_cache[charn] = self.character_things(char)
                 self._char_places_cache[charn] = self.character_places(char)
                 self._char_portals_cache[charn] = self.character_portals(char)
@@ -154,9 +210,6 @@ class EngineHandle(object):
             updd(self._rulebook_cache.setdefault(rule, {}), d)
         for char, d in delta.items():
             updd(self._char_nodes_cache.setdefault(char, {}), d.pop('nodes', {}))
-            nodevd = self._node_stat_cache.setdefault(char, {})
-            for node, val in d.pop('node_val', {}).items():
-                updd(nodevd.setdefault(node, {}), val)
             edges = self._char_portals_cache.setdefault(char, set())
             for orig, dests in d.pop('edges', {}).items():
                 for dest, exists in dests.items():
@@ -164,17 +217,37 @@ class EngineHandle(object):
                         edges.add((orig, dest))
                     else:
                         edges.remove((orig, dest))
-            edgevd = self._portal_stat_cache.setdefault(char, {})
-            for orig, dests in d.pop('edge_val', {}).items():
-                for dest, val in dests.items():
-                    updd(edgevd.setdefault(orig, {}).setdefault(dest, {}), val)
+        if self._delta_filter is not None:
+            # the journals still have what the filter left out
+            return
+        # the delta had all the changes up to now
+        btt = self._real.btt()
+        for char in self._char_delta_btt:
+            self._char_delta_btt[char] = btt
 
-    def next_turn(self):
-        ret, delta = self._real.next_turn()
+    def next_turn(self, chunk_size=None):
+        """Simulate a turn, and return the rules' results and the delta.
+
+        With ``chunk_size``, return a :class:`DeltaStream` of deltas with
+        about that many changes each, and then the results with an empty
+        delta. The whole delta is still computed up front; chunking bounds
+        what's encoded and in flight at once, not the work to build it.
+
+        """
+        ret, delta = self._real.next_turn(delta_filter=self._delta_filter)
         self.branch, self.turn, self.tick = self._real.btt()
+        if chunk_size:
+            self._after_ret = partial(self._upd_local_caches, {})
+            return DeltaStream(self._stream_delta(delta, chunk_size), (ret, {}))
         self._after_ret = partial(self._upd_local_caches, delta)
         return ret, delta
 
+    def _stream_delta(self, delta, chunk_size):
+        for chunk in self._real.delta_chunks(delta, chunk_size):
+            yield chunk
+            # it's been sent
+            self._upd_local_caches(chunk)
+
     def get_slow_delta(self, chars='all', store=True):
         delta = {}
         if chars:
@@ -195,7 +268,6 @@ class EngineHandle(object):
 
     def time_travel(self, branch, turn, tick=None, chars='all'):
         branch_from, turn_from, tick_from = self._real.btt()
-        slow_delta = branch != branch_from
         self._real.time = (branch, turn)
         if tick is None:
             self.tick = tick = self._real.tick
@@ -203,13 +275,31 @@ class EngineHandle(object):
             self._real.tick = tick
         self.branch = branch
         self.turn = turn
-        if slow_delta:
-            delta = self.get_slow_delta(chars)
-        else:
-            delta = self._real.get_delta(branch, turn_from, tick_from, turn, tick)
-            self._after_ret = partial(self._upd_local_caches, delta)
+        delta = self._real.get_branch_delta(
+            branch_from, turn_from, tick_from, branch, turn, tick,
+            delta_filter=self._delta_filter
+        )
+        if chars != 'all':
+            for char in self._real.character:
+                if char in delta and char not in chars:
+                    del delta[char]
+        self._after_ret = partial(self._upd_local_caches, delta)
         return None, delta
 
+    def subscribe(self, characters=None, nodes=None, stats=None, rulebooks=None):
+        """Only describe the changes to these in the deltas from
+        ``next_turn`` and ``time_travel``.
+
+        See :class:`LiSE.engine.DeltaFilter` for what the arguments
+        mean. Replaces any earlier subscription.
+
+        """
+        self._delta_filter = DeltaFilter(characters, nodes, stats, rulebooks)
+
+    def unsubscribe(self):
+        """Go back to describing every change in deltas."""
+        self._delta_filter = None
+
     def increment_branch(self, chars=[]):
         branch = self._real.branch
         m = match('(.*)([0-9]+)', branch)
@@ -250,8 +340,32 @@ class EngineHandle(object):
         self._real.commit()
 
     def close(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
         self._real.close()
 
+    def start_snapshot(self, name):
+        """Publish snapshots of the world in shared memory as ``name``,
+        whenever the branch or turn changes.
+
+        See :mod:`LiSE.snapshot`. Return the first version number.
+
+        """
+        self._snapshot = SnapshotWriter(self._real, name)
+        return self.publish_snapshot()
+
+    def publish_snapshot(self):
+        """Publish a new version of the snapshot now, and return its number."""
+        self._snapshot_bt = (self._real.branch, self._real.turn)
+        return self._snapshot.publish()
+
+    def snapshot_if_moved(self):
+        """Publish a new snapshot if I have one and the branch or turn changed."""
+        if self._snapshot is not None and \
+                (self._real.branch, self._real.turn) != self._snapshot_bt:
+            self.publish_snapshot()
+
     def get_branch(self):
         return self._real.branch
 
@@ -379,8 +493,7 @@ class EngineHandle(object):
         del self._real.character[char]
         for cache in (
                 self._char_stat_cache,
-                self._node_stat_cache,
-                self._portal_stat_cache,
+                self._char_delta_btt,
                 self._char_av_cache,
                 self._char_rulebooks_cache,
                 self._char_nodes_rulebooks_cache,
@@ -507,14 +620,38 @@ class EngineHandle(object):
             for orig, dests in porbs.items():
                 for dest, rb in dests.items():
                     ret['edge_val'].setdefault(orig, {}).setdefault(dest, {})['rulebook'] = rb
-        nv = self.character_nodes_stat_delta(char, store=store)
+        journal = self._character_journal(char, store=store)
+        if journal is None:
+            nv = self.character_nodes_stat_copy(char)
+            ev = self.character_portals_stat_copy(char)
+        else:
+            nv = journal.get('node_val')
+            ev = journal.get('edge_val')
         if nv:
             ret['node_val'] = nv
-        ev = self.character_portals_stat_delta(char, store=store)
         if ev:
             ret['edge_val'] = ev
         return ret
 
+    def _character_journal(self, char, *, store=True):
+        """Return the changes to ``char`` recorded in history since I last
+        described it in a delta, or ``None`` if I never have.
+
+        """
+        since = self._char_delta_btt.get(char)
+        now = self._real.btt()
+        if store:
+            self._char_delta_btt[char] = now
+        if since is None:
+            return None
+        # every character is usually described at the same times,
+        # so keep the world's delta for the next one
+        if self._journal_memo[:2] != (since, now):
+            self._journal_memo = (
+                since, now, self._real.get_branch_delta(*(since + now))
+            )
+        return self._journal_memo[2].get(char, {})
+
     def set_character_stat(self, char, k, v):
         self._real.character[char].stat[k] = v
         self._char_stat_cache.setdefault(char, {})[k] = v
@@ -540,11 +677,9 @@ class EngineHandle(object):
 
     def set_node_stat(self, char, node, k, v):
         self._real.character[char].node[node][k] = v
-        self._node_stat_cache.setdefault(char, {})[node][k] = v
 
     def del_node_stat(self, char, node, k):
         del self._real.character[char].node[node][k]
-        del self._node_stat_cache[char][node][k]
 
     def node_stat_copy(self, node_or_char, node=None):
         """Return a node's stats, prepared for pickling, in a dictionary."""
@@ -560,35 +695,15 @@ class EngineHandle(object):
             }
         }
 
-    def node_stat_delta(self, char, node, *, store=True):
-        """Return a dictionary describing changes to a node's stats since the
-        last time you looked at it.
-
-        Deleted keys have the value ``None``. If the node's been deleted, this
-        returns ``None``.
-
-        """
-        try:
-            old = self._node_stat_cache[char].get(node, {})
-            new = self.node_stat_copy(self._real.character[char].node[node])
-            if store:
-                self._node_stat_cache[char][node] = new
-            r = dict_delta(old, new)
-            return r
-        except KeyError:
-            return None
-
-    def character_nodes_stat_delta(self, char, *, store=True):
-        """Return a dictionary of ``node_stat_delta`` output for each node in a
+    def character_nodes_stat_copy(self, char):
+        """Return a dictionary of ``node_stat_copy`` output for each node in a
         character.
 
         """
-        r = {}
-        for node in self._real.character[char].node:
-            delta = self.node_stat_delta(char, node, store=store)
-            if delta:
-                r[node] = delta
-        return r
+        return {
+            node: self.node_stat_copy(char, node)
+            for node in self._real.character[char].node
+        }
 
     def update_node(self, char, node, patch):
         """Change a node's stats according to a dictionary.
@@ -628,7 +743,6 @@ class EngineHandle(object):
         del self._real.character[char].node[node]
         for cache in (
                 self._char_nodes_rulebooks_cache,
-                self._node_stat_cache,
                 self._node_successors_cache
         ):
             try:
@@ -639,13 +753,6 @@ class EngineHandle(object):
             del self._char_things_cache[char][node]
         if char in self._char_places_cache and node in self._char_places_cache[char]:
             self._char_places_cache[char].remove(node)
-        if char in self._portal_stat_cache:
-            portal_stat_cache_char = self._portal_stat_cache[char]
-            if node in portal_stat_cache_char:
-                del portal_stat_cache_char[node]
-            for charo in portal_stat_cache_char.values():
-                if node in charo:
-                    del charo[node]
         if char in self._char_portals_rulebooks_cache:
             portal_rulebook_cache_char = self._char_portals_rulebooks_cache[char]
             if node in portal_rulebook_cache_char:
@@ -708,7 +815,6 @@ class EngineHandle(object):
 
     def set_thing(self, char, thing, statdict):
         self._real.character[char].thing[thing] = statdict
-        self._node_stat_cache.setdefault(char, {})[thing] = statdict
         loc = statdict.pop('location')
         nxtloc = statdict.pop('next_location', None)
         arrt = statdict.pop('arrival_time', self.tick)
@@ -719,7 +825,6 @@ class EngineHandle(object):
         self._real.character[char].add_thing(
             thing, loc, next_loc, **statdict
         )
-        self._node_stat_cache.setdefault(char, {})[thing] = statdict
         self._char_things_cache.setdefault(char, {})[thing] = (loc, next_loc, self.tick, None)
 
     def place2thing(self, char, node, loc):
@@ -739,7 +844,6 @@ class EngineHandle(object):
 
     def set_thing_location(self, char, thing, loc):
         self._real.character[char].thing[thing]['location'] = loc
-        self._node_stat_cache.setdefault(char, {}).setdefault(thing, {})['location'] = loc
 
     def get_thing_special_stats(self, char, thing):
         try:
@@ -781,7 +885,6 @@ class EngineHandle(object):
 
     def set_place(self, char, place, statdict):
         self._real.character[char].place[place] = statdict
-        self._node_stat_cache.setdefault(char, {})[place] = statdict
 
     def add_places_from(self, char, seq):
         self._real.character[char].add_places_from(seq)
@@ -800,7 +903,6 @@ class EngineHandle(object):
 
     def set_portal(self, char, orig, dest, statdict):
         self._real.character[char].portal[orig][dest] = statdict
-        self._portal_stat_cache.setdefault(char, {})[orig][dest] = statdict
 
     def character_portals(self, char):
         r = set()
@@ -837,41 +939,22 @@ class EngineHandle(object):
 
     def del_portal(self, char, orig, dest):
         del self._real.character[char].portal[orig][dest]
-        try:
-            del self._portal_stat_cache[char][orig][dest]
-        except KeyError:
-            pass
 
     def set_portal_stat(self, char, orig, dest, k, v):
         self._real.character[char].portal[orig][dest][k] = v
-        self._portal_stat_cache.setdefault(char, {}).setdefault(orig, {})[dest][k] = v
 
     def del_portal_stat(self, char, orig, dest, k):
         del self._real.character[char][orig][dest][k]
-        del self._portal_stat_cache[char][orig][dest][k]
 
     def portal_stat_copy(self, char, orig, dest):
         return dict(self._real.character[char].portal[orig][dest].items())
 
-    def portal_stat_delta(self, char, orig, dest, *, store=True):
-        try:
-            old = self._portal_stat_cache[char][orig].get(dest, {})
-            new = self.portal_stat_copy(char, orig, dest)
-            if store:
-                self._portal_stat_cache[char][orig][dest] = new
-            return dict_delta(old, new)
-        except KeyError:
-            return None
-
-    def character_portals_stat_delta(self, char, *, store=True):
+    def character_portals_stat_copy(self, char):
         r = {}
         for orig in self._real.character[char].portal:
             for dest in self._real.character[char].portal[orig]:
-                delta = self.portal_stat_delta(char, orig, dest, store=store)
-                if delta:
-                    if orig not in r:
-                        r[orig] = {}
-                    r[orig][dest] = delta
+                r.setdefault(orig, {})[dest] \
+                    = self.portal_stat_copy(char, orig, dest)
         return r
 
     def update_portal(self, char, orig, dest, patch):
@@ -99,9 +99,9 @@ class UserMapping(Mapping):
 class NodeContentValues(ValuesView):
     def __iter__(self):
         node = self._mapping.node
-        for thing in node.character.thing.values():
-            if thing.location == node:
-                yield thing
+        thing = node.character.thing
+        for name in self._mapping:
+            yield thing[name]
 
     def __contains__(self, item):
         return item.location == self._mapping.node
@@ -114,22 +114,19 @@ class NodeContent(Mapping):
         self.node = node
 
     def __iter__(self):
-        # TODO: cache this
-        for name, thing in self.node.character.thing.items():
-            if thing.location == self.node:
-                yield name
+        yield from self.node.engine._things_cache.iter_contents(
+            self.node.character.name, self.node.name, *self.node.engine.btt()
+        )
 
     def __len__(self):
-        n = 0
-        for thing in self:
-            n += 1
-        return n
+        return self.node.engine._things_cache.count_contents(
+            self.node.character.name, self.node.name, *self.node.engine.btt()
+        )
 
     def __contains__(self, item):
-        try:
-            return self.node.character.thing[item].location == self.node
-        except KeyError:
-            return False
+        return self.node.engine._things_cache.has_content(
+            self.node.character.name, self.node.name, item, *self.node.engine.btt()
+        )
 
     def __getitem__(self, item):
         if item not in self:
@@ -249,6 +246,7 @@ class Node(allegedb.graph.Node, rule.RuleFollower):
         )
 
     def _user_names(self):
+        self.engine._avatarness_cache._note_read()
         cache = self.engine._avatarness_cache.user_order
         if self.character.name not in cache or \
            self.name not in cache[self.character.name]:
@@ -8,7 +8,11 @@ entity in the LiSE core.
 
 """
 import sys
+import builtins
 import logging
+from asyncio import wrap_future
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count
 from os import getpid
 from collections import (
     Mapping,
@@ -16,9 +20,9 @@ from collections import (
     MutableSequence
 )
 from functools import partial
-from threading import Thread, Lock
+from threading import Thread, Lock, local
 from multiprocessing import Process, Pipe, Queue, ProcessError
-from queue import Empty
+from queue import Empty, Queue as ChunkQueue
 from blinker import Signal
 
 from allegedb.cache import HistoryError
@@ -27,7 +31,9 @@ from .character import Facade
 from allegedb.xjson import JSONReWrapper, JSONListReWrapper
 from .util import reify, getatt
 from allegedb.cache import PickyDefaultDict, StructuredDefaultDict
-from .handle import EngineHandle
+from .handle import EngineHandle, DeltaStream
+from .serialize import serializers, negotiate
+from .snapshot import WorldSnapshot
 from .xcollections import AbstractLanguageDescriptor
 
 
@@ -1818,6 +1824,166 @@ class TimeDescriptor(object):
         inst.time_travel(*val)
 
 
+class CommandBatch(object):
+    """Collect the commands an :class:`EngineProxy` is asked to handle
+    in this thread, and send them in one round trip when the ``with``
+    block ends.
+
+    Commands handled in the block return ``None``. Afterward, their
+    results are in my ``results`` list, in order, and any failures are
+    in ``errors``, as described in :meth:`LiSE.handle.EngineHandle.batch`.
+    Callbacks are called once the whole batch has been handled.
+
+    """
+    def __init__(self, engine, stop_on_error=False):
+        self.engine = engine
+        self.stop_on_error = stop_on_error
+        self.commands = []
+        self.callbacks = []
+        self.results = None
+        self.errors = None
+        self._depth = 0
+
+    def add(self, kwargs, cb=None):
+        entry = {'command': kwargs.pop('command')}
+        kwargs.pop('silent', None)
+        if kwargs.pop('branching', False):
+            entry['branching'] = True
+        entry['kwargs'] = kwargs
+        self.commands.append(entry)
+        self.callbacks.append(cb)
+
+    def __enter__(self):
+        if self._depth == 0:
+            self.engine._batching.batch = self
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth:
+            return
+        del self.engine._batching.batch
+        if not self.commands:
+            self.results = []
+            self.errors = []
+            return
+        # send even if the block raised, since the proxies' caches
+        # already show the changes
+        received = self.engine._submit({
+            'command': 'batch',
+            'silent': False,
+            'commands': self.commands,
+            'stop_on_error': self.stop_on_error
+        }).result()
+        r = self.engine._handled('batch', received)
+        self.results = r['results']
+        self.errors = r['errors']
+        failed = set(err[0] for err in self.errors)
+        branch, turn, tick = received[1:4]
+        for i, (entry, cb, result) in enumerate(zip(
+                self.commands, self.callbacks, self.results
+        )):
+            if cb and i not in failed:
+                cb(entry['command'], branch, turn, tick, **result)
+
+
+class CommandPipe(object):
+    """The proxy's end of the pipes to the engine's process.
+
+    Commands that want results are tagged with a request id, and get a
+    :class:`concurrent.futures.Future`. A thread reading ``handle_in``
+    resolves the future for each id as its result comes in, so any
+    number of commands may be in flight at once, from any thread.
+
+    The engine's process sends ``(id, command, branch, turn, tick,
+    result)`` for each result. It may send ``(id, chunk)`` pieces of
+    it first, or ``(id, command, [exception_name, message])`` if the
+    command raised an exception.
+
+    """
+    def __init__(self, handle_out, handle_in, serializer):
+        self._handle_out = handle_out
+        self._handle_out_lock = Lock()
+        self._handle_in = handle_in
+        self._serializer = serializer
+        self._request_ids = count()
+        self._futures = {}
+        self._streams = {}
+        self._recv_thread = Thread(
+            target=self._recv_forever, name='recv', daemon=True
+        )
+        self._recv_thread.start()
+
+    def send(self, obj):
+        """Send something that doesn't want a result."""
+        data = self._serializer.dump(obj)
+        with self._handle_out_lock:
+            self._handle_out.send_bytes(data)
+
+    def submit(self, obj, stream=None):
+        """Send a command that wants a result, and return a
+        :class:`concurrent.futures.Future` of the tuple of the command,
+        branch, turn, tick, and result that the engine's process sends
+        back.
+
+        If the result comes in chunks first, put them in the queue
+        ``stream``, followed by ``None``.
+
+        """
+        fut = Future()
+        with self._handle_out_lock:
+            reqid = obj['id'] = next(self._request_ids)
+            self._futures[reqid] = fut
+            if stream is not None:
+                self._streams[reqid] = stream
+            self._handle_out.send_bytes(self._serializer.dump(obj))
+        return fut
+
+    def _recv_forever(self):
+        while True:
+            try:
+                data = self._handle_in.recv_bytes()
+            except (EOFError, OSError):
+                break
+            reqid, *received = self._serializer.load(data)
+            if len(received) == 1:
+                # blocks when the stream's consumer falls behind,
+                # and so does the engine's process, eventually
+                self._streams[reqid].put(received[0])
+                continue
+            if reqid in self._streams:
+                self._streams.pop(reqid).put(None)
+            fut = self._futures.pop(reqid)
+            if len(received) == 2:
+                command, (name, msg) = received
+                fut.set_exception(engine_exception(name, msg))
+            else:
+                fut.set_result(tuple(received))
+        for stream in self._streams.values():
+            stream.put(None)
+        for reqid in list(self._futures):
+            self._futures.pop(reqid).set_exception(
+                EOFError("The engine's process hung up")
+            )
+
+
+def engine_exception(name, msg):
+    """Return an exception like the one called ``name`` that the engine's
+    process raised.
+
+    Built-in exceptions and ``HistoryError`` keep their type. Any other
+    is a ``RuntimeError``.
+
+    """
+    if name == 'HistoryError':
+        return HistoryError(msg)
+    cls = getattr(builtins, name, None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        return cls(msg)
+    return RuntimeError("{}: {}".format(name, msg))
+
+
 class EngineProxy(AbstractEngine):
     """An engine-like object for controlling the actual LiSE engine in another process.
 
@@ -1830,6 +1996,9 @@ class EngineProxy(AbstractEngine):
     place_cls = PlaceProxy
     portal_cls = PortalProxy
     time = TimeDescriptor()
+    # how many chunks of a streamed delta may wait to be applied
+    # before the engine's process has to wait
+    chunk_queue_size = 4
 
     @property
     def branch(self):
@@ -1849,15 +2018,23 @@ class EngineProxy(AbstractEngine):
 
     def __init__(
             self, handle_out, handle_in, logger,
-            do_game_start=False,  install_modules=[]
+            do_game_start=False,  install_modules=[], snapshot=None
     ):
-        self._handle_out = handle_out
-        self._handle_out_lock = Lock()
-        self._handle_in = handle_in
-        self._handle_in_lock = Lock()
-        self._handle_lock = Lock()
-        self.send(self.json_dump({'command': 'get_watched_btt'}))
-        self._branch, self._turn, self._tick = self.json_load(self.recv()[-1])
+        # the engine's process says what serializer it picked
+        # before anything else
+        self.serializer = handle_in.recv()
+        self._serializer = serializers[self.serializer](self)
+        self._pipe = CommandPipe(handle_out, handle_in, self._serializer)
+        # callbacks run here, in the order their results came in,
+        # so they can't hold up the recv thread
+        self._callback_executor = ThreadPoolExecutor(max_workers=1)
+        self._batching = local()
+        self._branch, self._turn, self._tick = self._submit(
+            {'command': 'get_watched_btt', 'silent': False}
+        ).result()[-1]
+        # the engine's process published the first version before
+        # it sent the serializer
+        self.snapshot = WorldSnapshot(snapshot) if snapshot else None
         self.logger = logger
         self.method = FuncStoreProxy(self, 'method')
         self.eternal = EternalVarProxy(self)
@@ -2009,16 +2186,11 @@ class EngineProxy(AbstractEngine):
         else:
             return super().delistify(obj)
 
-    def send(self, obj, blocking=True, timeout=-1):
-        self._handle_out_lock.acquire(blocking, timeout)
-        self._handle_out.send(obj)
-        self._handle_out_lock.release()
+    def send(self, obj):
+        self._pipe.send(obj)
 
-    def recv(self, blocking=True, timeout=-1):
-        self._handle_in_lock.acquire(blocking, timeout)
-        data = self._handle_in.recv()
-        self._handle_in_lock.release()
-        return data
+    def _submit(self, obj, stream=None):
+        return self._pipe.submit(obj, stream)
 
     def debug(self, msg):
         self.logger.debug(msg)
@@ -2055,73 +2227,106 @@ class EngineProxy(AbstractEngine):
         ``branching=True``.
 
         With a function ``cb``, I will call ``cb`` when I get
-        a result. If ``silent=True`` this will happen in a thread.
+        a result. If ``silent=True`` this will happen in another thread,
+        after the callbacks of any commands sent before.
         ``cb`` will be called with keyword arguments ``command``,
         the same command you asked for; ``result``, the value returned
         by it, possibly ``None``; and the present ``branch``,
         ``turn``, and ``tick``, possibly different than when you called
         ``handle``.
 
+        Commands are pipelined: other threads may send theirs while
+        this one waits for its result, and the engine will run them
+        all in the order they were sent.
+
+        Inside a ``with`` block on :meth:`batch`, commands are only
+        collected, and I return ``None``.
+
         """
-        if 'command' in kwargs:
-            cmd = kwargs['command']
-        elif cmd:
-            kwargs['command'] = cmd
-        else:
-            raise TypeError("No command")
+        cmd = self._prep_command(cmd, kwargs)
         branching = kwargs.get('branching', False)
         cb = kwargs.pop('cb', None)
-        self._handle_lock.acquire()
-        if 'silent' not in kwargs:
-            kwargs['silent'] = False
-        if kwargs['silent']:
-            if branching or cb:
-                # I'll still execute the command asynchronously,
-                # and *this* method won't return anything, but
-                # the subprocess should still return a value, so don't
-                # silence *that*
-                del kwargs['silent']
-            self.send(self.json_dump(kwargs))
-            if branching:
-                self._branching_thread = Thread(
-                    target=self._branching, args=[cb], daemon=True
-                )
-                self._branching_thread.start()
+        batch = getattr(self._batching, 'batch', None)
+        if batch is not None:
+            batch.add(kwargs, cb)
+            return
+        if kwargs.setdefault('silent', False):
+            if not (branching or cb):
+                self.send(kwargs)
                 return
-            if cb:
-                self._callback_thread = Thread(
-                    target=self._callback, args=[cb], daemon=True
+            # I'll still execute the command asynchronously,
+            # and *this* method won't return anything, but
+            # the subprocess should still return a value, so don't
+            # silence *that*
+            del kwargs['silent']
+            after = self._branching if branching else self._callback
+            self._submit(kwargs).add_done_callback(
+                lambda fut: self._callback_executor.submit(
+                    after, cb, fut.result()
                 )
-                self._callback_thread.start()
-                return
+            )
+            return
+        return self._handled(cmd, self._submit(kwargs).result(), cb)
+
+    def batch(self, stop_on_error=False):
+        """Return a context manager that collects the commands I'm asked
+        to handle in this thread and sends them all at once.
+
+        ``with engine.batch():`` blocks may be nested; the commands are
+        sent when the outermost one ends.
+
+        """
+        batch = getattr(self._batching, 'batch', None)
+        if batch is None:
+            return CommandBatch(self, stop_on_error)
+        return batch
+
+    async def ahandle(self, cmd=None, **kwargs):
+        """Send a command to the LiSE core, and await its result.
+
+        Like :meth:`handle`, but for use in a coroutine. ``silent``
+        isn't accepted, since there'd be nothing to wait for.
+
+        """
+        cmd = self._prep_command(cmd, kwargs)
+        cb = kwargs.pop('cb', None)
+        if kwargs.get('silent'):
+            raise TypeError("Can't await a silent command")
+        kwargs['silent'] = False
+        received = await wrap_future(self._submit(kwargs))
+        return self._handled(cmd, received, cb)
+
+    @staticmethod
+    def _prep_command(cmd, kwargs):
+        if 'command' in kwargs:
+            return kwargs['command']
+        elif cmd:
+            kwargs['command'] = cmd
+            return cmd
         else:
-            self.send(self.json_dump(kwargs))
-            command, branch, turn, tick, result = self.recv()
-            assert cmd == command, \
-                "Sent command {} but received results for {}".format(
-                    cmd, command
-                )
-            self._handle_lock.release()
-            r = self.json_load(result)
-            if (branch, turn, tick) != self.btt():
-                self._branch = branch
-                self._turn = turn
-                self._tick = tick
-                self.time.send(self, branch=branch, turn=turn, tick=tick)
-            if cb:
-                cb(command, branch, turn, tick, **r)
-            return r
-        self._handle_lock.release()
-
-    def _callback(self, cb):
-        command, branch, turn, tick, result = self.recv()
-        self._handle_lock.release()
-        cb(command, branch, turn, tick, **self.json_load(result))
-
-    def _branching(self, cb=None):
-        command, branch, turn, tick, result = self.recv()
-        self._handle_lock.release()
-        r = self.json_load(result)
+            raise TypeError("No command")
+
+    def _handled(self, cmd, received, cb=None):
+        command, branch, turn, tick, r = received
+        assert cmd == command, \
+            "Sent command {} but received results for {}".format(
+                cmd, command
+            )
+        if (branch, turn, tick) != self.btt():
+            self._branch = branch
+            self._turn = turn
+            self._tick = tick
+            self.time.send(self, branch=branch, turn=turn, tick=tick)
+        if cb:
+            cb(command, branch, turn, tick, **r)
+        return r
+
+    def _callback(self, cb, received):
+        command, branch, turn, tick, result = received
+        cb(command, branch, turn, tick, **result)
+
+    def _branching(self, cb, received):
+        command, branch, turn, tick, r = received
         if branch != self._branch:
             self._branch = branch
             self._turn = turn
@@ -2132,12 +2337,18 @@ class EngineProxy(AbstractEngine):
         if cb:
             cb(command, branch, turn, tick, **r)
 
-    def _call_with_recv(self, *cbs, **kwargs):
-        cmd, branch, turn, tick, res = self.recv()
-        received = self.json_load(res)
+    def _call_with_received(self, received, *cbs, **kwargs):
+        cmd, branch, turn, tick, r = received
         for cb in cbs:
-            cb(cmd, branch, turn, tick, received, **kwargs)
-        return received
+            cb(cmd, branch, turn, tick, r, **kwargs)
+        return r
+
+    def _call_when_received(self, fut, *cbs, **kwargs):
+        fut.add_done_callback(
+            lambda fut: self._callback_executor.submit(
+                self._call_with_received, fut.result(), *cbs, **kwargs
+            )
+        )
 
     def _upd_caches(self, *args, **kwargs):
         deleted = set(self.character.keys())
@@ -2186,19 +2397,6 @@ class EngineProxy(AbstractEngine):
         self._tick = tick
         self.time.send(self, branch=branch, turn=turn, tick=tick)
 
-    def _pull_async(self, chars, cb):
-        if not callable(cb):
-            raise TypeError("Uncallable callback")
-        self.send(self.json_dump({
-            'silent': False,
-            'command': 'get_char_deltas',
-            'chars': chars
-        }))
-        cbs = [self._upd_caches]
-        if cb:
-            cbs.append(cb)
-        self._call_with_recv(cbs)
-
     def pull(self, chars='all', cb=None, sync=True):
         """Update the state of all my proxy objects from the real objects."""
         if sync:
@@ -2207,30 +2405,49 @@ class EngineProxy(AbstractEngine):
             if cb:
                 cb(deltas)
         else:
-            Thread(
-                target=self._pull_async,
-                args=(chars, cb)
-            ).start()
+            if not callable(cb):
+                raise TypeError("Uncallable callback")
+            fut = self._submit({
+                'silent': False,
+                'command': 'get_char_deltas',
+                'chars': chars
+            })
+            self._call_when_received(fut, self._upd_caches, cb)
 
     # TODO: make this into a Signal, like it is in the LiSE core
-    def next_turn(self, cb=None, silent=False):
-        if not callable(cb):
+    def next_turn(self, cb=None, silent=False, chunk_size=None):
+        """Simulate a turn.
+
+        With ``chunk_size``, the delta comes in pieces with about that
+        many changes each, applied to my caches as they arrive.
+
+        """
+        if cb is not None and not callable(cb):
             raise TypeError("Uncallable callback")
         if silent:
             self.handle(command='next_turn', silent=True, cb=cb)
+        elif chunk_size:
+            stream = ChunkQueue(self.chunk_queue_size)
+            fut = self._submit({
+                'silent': False,
+                'command': 'next_turn',
+                'chunk_size': chunk_size
+            }, stream)
+            for chunk in iter(stream.get, None):
+                self._upd_caches((None, chunk), no_del=True)
+            args = [self._set_time]
+            if cb:
+                args.append(cb)
+            return self._call_with_received(fut.result(), *args)
         elif cb:
-            self.send(self.json_dump({
+            fut = self._submit({
                 'silent': False,
                 'command': 'next_turn'
-            }))
-            args = [partial(self._upd_caches, no_del=True), self._set_time, cb]
-            if silent:
-                Thread(
-                    target=self._call_with_recv,
-                    args=args
-                ).start()
-            else:
-                return self._call_with_recv(*args)
+            })
+            return self._call_with_received(
+                fut.result(), partial(self._upd_caches, no_del=True),
+                self._set_time, cb
+            )
         else:
             ret = self.handle(command='next_turn')
             self.time.send(self, branch=ret['branch'], turn=ret['turn'], tick=ret['tick'])
@@ -2245,22 +2462,18 @@ class EngineProxy(AbstractEngine):
             args = [self._set_time, self._upd_caches]
             if cb:
                 args.append(cb)
-            self._time_travel_thread = Thread(
-                target=self._call_with_recv,
-                args=args,
-                kwargs={'no_del': True}
-            )
-            self._time_travel_thread.start()
-            self.send(self.json_dump({
+            fut = self._submit({
                 'command': 'time_travel',
                 'silent': False,
                 'branch': branch,
                 'turn': turn,
                 'tick': tick,
                 'chars': chars
-            }))
+            })
             if block:
-                self._time_travel_thread.join()
+                self._call_with_received(fut.result(), *args, no_del=True)
+            else:
+                self._call_when_received(fut, *args, no_del=True)
         else:
             self.handle(
                 command='time_travel',
@@ -2271,6 +2484,35 @@ class EngineProxy(AbstractEngine):
                 silent=True
             )
 
+    def subscribe(self, characters=None, nodes=None, stats=None, rulebooks=None):
+        """Only get the changes to these from ``next_turn`` and ``time_travel``.
+
+        ``characters``, ``stats``, and ``rulebooks`` are collections of
+        names, ``nodes`` a dictionary of collections of node names,
+        keyed by character. Leave any out to get all of them. See
+        :class:`LiSE.engine.DeltaFilter`.
+
+        Proxies for what you leave out won't be kept up to date. Call
+        ``pull`` if you want them again after you ``unsubscribe``.
+
+        """
+        def listed(coll):
+            return None if coll is None else list(coll)
+        self.handle(
+            command='subscribe',
+            characters=listed(characters),
+            nodes=None if nodes is None else {
+                char: list(ns) for (char, ns) in nodes.items()
+            },
+            stats=listed(stats),
+            rulebooks=listed(rulebooks),
+            silent=True
+        )
+
+    def unsubscribe(self):
+        """Go back to getting every change from ``next_turn`` and ``time_travel``."""
+        self.handle(command='unsubscribe', silent=True)
+
     def add_character(self, char, data={}, **attr):
         if char in self._char_cache:
             raise KeyError("Character already exists")
@@ -2364,10 +2606,14 @@ class EngineProxy(AbstractEngine):
     def close(self):
         self.handle(command='close')
         self.send('shutdown')
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self._callback_executor.shutdown(wait=False)
 
 
 def subprocess(
-    args, kwargs, handle_out_pipe, handle_in_pipe, logq, loglevel
+    args, kwargs, handle_out_pipe, handle_in_pipe, logq, loglevel,
+    serializer=None, snapshot=None
 ):
     def log(typ, data):
         if typ == 'command':
@@ -2385,38 +2631,55 @@ def subprocess(
             )
         logq.put(('debug', logs))
     engine_handle = EngineHandle(args, kwargs, logq, loglevel=loglevel)
+    if snapshot:
+        engine_handle.start_snapshot(snapshot)
+    serializer = negotiate(serializer)
+    handle_in_pipe.send(serializer)
+    serializer = serializers[serializer](engine_handle._real)
 
     while True:
-        inst = handle_out_pipe.recv()
-        if inst == 'shutdown':
+        instruction = serializer.load(handle_out_pipe.recv_bytes())
+        if instruction == 'shutdown':
             handle_out_pipe.close()
             handle_in_pipe.close()
             logq.close()
             return 0
-        instruction = engine_handle.json_load(inst)
         silent = instruction.pop('silent',  False)
+        reqid = instruction.pop('id', None)
         cmd = instruction.pop('command')
         log('command', (cmd, instruction))
 
         branching = instruction.pop('branching', False)
-        if branching:
-            try:
-                r = getattr(engine_handle, cmd)(**instruction)
-            except HistoryError:
-                engine_handle.increment_branch()
+        try:
+            if branching:
+                try:
+                    r = getattr(engine_handle, cmd)(**instruction)
+                except HistoryError:
+                    engine_handle.increment_branch()
+                    r = getattr(engine_handle, cmd)(**instruction)
+            else:
                 r = getattr(engine_handle, cmd)(**instruction)
-        else:
-            r = getattr(engine_handle, cmd)(**instruction)
-        if silent:
+            if isinstance(r, DeltaStream):
+                for chunk in r:
+                    if not silent:
+                        handle_in_pipe.send_bytes(serializer.dump((reqid, chunk)))
+                r = r.final
+        except Exception as ex:
+            logq.put(('error', "LiSE proc {}: {} raised {!r}".format(getpid(), cmd, ex)))
+            if not silent:
+                handle_in_pipe.send_bytes(serializer.dump((
+                    reqid, cmd, [type(ex).__name__, str(ex)]
+                )))
             continue
-        log('result', r)
-        handle_in_pipe.send((
-            cmd, engine_handle.branch, engine_handle.turn, engine_handle.tick,
-            engine_handle.json_dump(r)
-        ))
+        if not silent:
+            log('result', r)
+            handle_in_pipe.send_bytes(serializer.dump((
+                reqid, cmd, engine_handle.branch, engine_handle.turn, engine_handle.tick, r
+            )))
         if hasattr(engine_handle, '_after_ret'):
             engine_handle._after_ret()
             del engine_handle._after_ret
+        engine_handle.snapshot_if_moved()
 
 
 class RedundantProcessError(ProcessError):
@@ -2428,6 +2691,24 @@ class RedundantProcessError(ProcessError):
 
 class EngineProcessManager(object):
     def start(self, *args, **kwargs):
+        """Start a LiSE engine in another process, and return a proxy to it.
+
+        Positional arguments, and most keyword arguments, are passed
+        to the engine.
+
+        ``serializer`` is the name of the serializer in
+        :mod:`LiSE.serialize` that commands and results should be sent
+        in, or a list of them in order of preference. By default, use
+        the fastest available.
+
+        With ``snapshot``, the engine's process publishes snapshots of
+        the world in shared memory under that name, which any process
+        can read with :class:`LiSE.snapshot.WorldSnapshot`. The proxy
+        keeps one as its ``snapshot`` attribute, but still loads its own
+        caches over the pipe as usual; the snapshot is for readers that
+        don't want a whole proxy.
+
+        """
         if hasattr(self, 'engine_proxy'):
             raise RedundantProcessError("Already started")
         (handle_out_pipe_recv, self._handle_out_pipe_send) = Pipe(duplex=False)
@@ -2469,6 +2750,8 @@ class EngineProcessManager(object):
                         if 'do_game_start' in kwargs else False
         install_modules = kwargs.pop('install_modules') \
                           if 'install_modules' in kwargs else []
+        serializer = kwargs.pop('serializer', None)
+        snapshot = kwargs.pop('snapshot', None)
         formatter = logging.Formatter(
             fmt='[{levelname}] LiSE.proxy({process})\t{message}',
             style='{'
@@ -2485,7 +2768,9 @@ class EngineProcessManager(object):
                 handle_out_pipe_recv,
                 handle_in_pipe_send,
                 self.logq,
-                loglevel
+                loglevel,
+                serializer,
+                snapshot
             )
         )
         self._p.daemon = True
@@ -2501,7 +2786,8 @@ class EngineProcessManager(object):
             handle_in_pipe_recv,
             self.logger,
             do_game_start,
-            install_modules
+            install_modules,
+            snapshot
         )
         return self.engine_proxy
 
@@ -2,15 +2,25 @@
 # Copyright (c) Zachary Spector,  zacharyspector@gmail.com
 """The query engine provides Pythonic methods to access the database.
 
-This module also contains a notably unfinished implementation of a query
-language specific to LiSE. Access some stats using entities' method
-``historical``, and do comparisons on those, and instead of a boolean
-result you'll get a callable object that will return an iterator over
-turn numbers in which the comparison evaluated to ``True``.
+This module also contains a query language specific to LiSE. Access
+some stats using entities' method ``historical``, and do comparisons on
+those, and instead of a boolean result you'll get a callable object that
+will return an iterator over turn numbers in which the comparison
+evaluated to ``True``. Combine those objects with ``&``, ``|``, and
+``~`` to ask when several things were true at once.
 
 """
 from operator import gt, lt, eq, ne, le, ge
 from functools import partialmethod
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAXINT = 2 ** 63 - 1
+"""The largest integer SQLite can store"""
 
 import allegedb.query
 
@@ -23,114 +33,97 @@ from .util import EntityStatAccessor
 import LiSE
 
 
-def windows_union(windows):
-    def fix_overlap(left, right):
-        if left == right:
-            return [left]
-        assert left[0] < right[0]
-        if left[1] >= right[0]:
-            if right[1] > left[1]:
-                return [(left[0], right[1])]
-            else:
-                return [left]
-        return [left, right]
-
-    if len(windows) == 1:
-        yield windows[0]
-        return
-    none_left = []
-    otherwise = []
-    for window in windows:
-        if window[0] is None:
-            none_left.append(window)
-        else:
-            otherwise.append(window)
-
-    res = []
-    otherwise.sort()
-    for window in none_left:
-        if not res:
-            res.append(window)
-            continue
-        res.extend(fix_overlap(res.pop(), window))
-    while otherwise:
-        window = otherwise.pop(0)
-        if not res:
-            res.append(window)
-            continue
-        res.extend(fix_overlap(res.pop(), window))
-    return res
-
-
-def windows_intersection(windows):
-    """
+def windows_normal(windows):
+    """Return ``windows`` sorted, with overlapping ones merged.
+
+    Windows are ``(turn_from, turn_to)`` pairs, inclusive. A
+    ``turn_from`` of ``None`` becomes 0; a ``turn_to`` of ``None``
+    means the window never ends. The other ``windows_`` functions
+    expect their arguments in this form, and return it.
 
-    :rtype: list
     """
+    return windows_or(sorted(
+        ((start or 0, end) for (start, end) in windows),
+        key=lambda w: w[0]
+    ), [])
+
+
+def windows_or(left, right):
+    """Return the union of two lists of windows, merging as I go."""
+    ret = []
+    i = j = 0
+    while i < len(left) or j < len(right):
+        if j >= len(right) or (i < len(left) and left[i][0] <= right[j][0]):
+            start, end = left[i]
+            i += 1
+        else:
+            start, end = right[j]
+            j += 1
+        if ret:
+            prev_start, prev_end = ret[-1]
+            if prev_end is None:
+                break
+            if start <= prev_end + 1:
+                ret[-1] = (prev_start, None if end is None else max((prev_end, end)))
+                continue
+        ret.append((start, end))
+    return ret
+
+
+def windows_and(left, right):
+    """Return the intersection of two lists of windows."""
+    ret = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        (l0, l1), (r0, r1) = left[i], right[j]
+        start = max((l0, r0))
+        end = r1 if l1 is None else l1 if r1 is None else min((l1, r1))
+        if end is None or start <= end:
+            ret.append((start, end))
+        # move past whichever window ends first
+        if l1 is None or (r1 is not None and r1 < l1):
+            j += 1
+        else:
+            i += 1
+    return ret
 
-    def intersect2(left, right):
-        if left == right:
-            return left
-        elif left is (None, None):
-            return right
-        elif right is (None, None):
-            return left
-        elif left[0] is None:
-            if right[0] is None:
-                return None, min((left[1], right[1]))
-            elif right[1] is None:
-                if left[1] <= right[0]:
-                    return left[1], right[0]
-                else:
-                    return None
-            elif right[0] <= left[1]:
-                return right[0], left[1]
-            else:
-                return None
-        elif left[1] is None:
-            if right[0] is None:
-                return left[0], right[1]
-            else:
-                return right  # assumes left[0] <= right[0]
-        # None not in left
-        elif right[0] is None:
-            return left[0], min((left[1], right[1]))
-        elif right[1] is None:
-            if left[1] >= right[0]:
-                return right[0], left[1]
-            else:
-                return None
-        assert None not in left and None not in right and left[0] < right[1]
-        if left[1] >= right[0]:
-            if right[1] > left[1]:
-                return right[0], left[1]
-            else:
-                return right
-        return None
 
-    if len(windows) == 1:
-        return windows
-    left_none = []
-    otherwise = []
-    for window in windows:
-        if window[0] is None:
-            left_none.append(window)
-        else:
-            otherwise.append(window)
+def windows_not(windows):
+    """Return the windows of all the turns that aren't in ``windows``."""
+    ret = []
+    turn = 0
+    for (start, end) in windows:
+        if start > turn:
+            ret.append((turn, start - 1))
+        if end is None:
+            return ret
+        turn = end + 1
+    ret.append((turn, None))
+    return ret
+
 
-    done = []
-    todo = left_none + sorted(otherwise)
-    for window in todo:
-        if not done:
-            done.append(window)
-            continue
-        res = intersect2(done.pop(), window)
-        if res:
-            done.append(res)
-    return done
+def _restrict(limit, windows):
+    """Return the windows in both ``limit`` and ``windows``.
+
+    ``None`` for ``limit``, or an empty list for ``windows``, means
+    no restriction.
+
+    """
+    if not windows:
+        return limit
+    if limit is None:
+        return windows
+    return windows_and(limit, windows)
 
 
 class Query(object):
+    """Something that's true at some times and not others.
+
+    Compare ``historical`` stats to get one, then combine those with
+    ``&``, ``|``, and ``~``. Call it, or pass it to
+    ``Engine.ticks_when``, to find out when it's true.
+
+    """
     def __new__(cls, engine, leftside, rightside=None, **kwargs):
         if rightside is None:
             if not isinstance(leftside, cls):
@@ -141,12 +134,47 @@ class Query(object):
             me.leftside = leftside
             me.rightside = rightside
         me.engine = engine
-        me.windows = kwargs.get('windows', [])
+        me.windows = windows_normal(kwargs.get('windows', []))
         return me
 
     def __call__(self):
+        return QueryResults(self)
+
+    def evaluate(self, branch, limit=None):
+        """Return the windows of turns in ``branch`` when I'm true.
+
+        If ``limit`` is a list of windows, only look in those.
+
+        """
+        raise NotImplementedError("Query is abstract")
+
+    def cost(self, branch):
+        """Estimate how much work it'll be to ``evaluate`` me."""
+        raise NotImplementedError("Query is abstract")
+
+    def explain(self, branch=None):
+        """Return a description of how I'd be evaluated in ``branch``,
+        by default the current one.
+
+        """
+        return '\n'.join(self._explain(branch or self.engine.branch, 0))
+
+    def _explain(self, branch, depth):
         raise NotImplementedError("Query is abstract")
 
+    def __and__(self, other):
+        if not isinstance(other, Query):
+            return NotImplemented
+        return Intersection(self.engine, self, other)
+
+    def __or__(self, other):
+        if not isinstance(other, Query):
+            return NotImplemented
+        return Union(self.engine, self, other)
+
+    def __invert__(self):
+        return Complement(self.engine, self)
+
     def __eq__(self, other):
         return EqQuery(self.engine, self, self.engine.entityfy(other))
 
@@ -167,42 +195,40 @@ class Query(object):
 
     def and_before(self, end):
         if self.windows:
-            new_windows = windows_intersection(
-                sorted(self.windows + [(None, end)])
-            )
+            new_windows = windows_and(self.windows, [(0, end)])
         else:
             new_windows = [(0, end)]
-        return type(self)(self.leftside, self.rightside, windows=new_windows)
+        return type(self)(self.engine, self.leftside, self.rightside, windows=new_windows)
     before = and_before
 
     def or_before(self, end):
         if self.windows:
-            new_windows = windows_union(self.windows + [(None, end)])
+            new_windows = windows_or(self.windows, [(0, end)])
         else:
-            new_windows = [(None, end)]
-        return type(self)(self.leftside, self.rightside, windows=new_windows)
+            new_windows = [(0, end)]
+        return type(self)(self.engine, self.leftside, self.rightside, windows=new_windows)
 
     def and_after(self, start):
         if self.windows:
-            new_windows = windows_intersection(self.windows + [(start, None)])
+            new_windows = windows_and(self.windows, [(start, None)])
         else:
             new_windows = [(start, None)]
-        return type(self)(self.leftside, self.rightside, windows=new_windows)
+        return type(self)(self.engine, self.leftside, self.rightside, windows=new_windows)
     after = and_after
 
     def or_between(self, start, end):
         if self.windows:
-            new_windows = windows_union(self.windows + [(start, end)])
+            new_windows = windows_or(self.windows, [(start, end)])
         else:
             new_windows = [(start, end)]
-        return type(self)(self.leftside, self.rightside, windows=new_windows)
+        return type(self)(self.engine, self.leftside, self.rightside, windows=new_windows)
 
     def and_between(self, start, end):
         if self.windows:
-            new_windows = windows_intersection(self.windows + [(start, end)])
+            new_windows = windows_and(self.windows, [(start, end)])
         else:
             new_windows = [(start, end)]
-        return type(self)(self.leftside, self.rightside, windows=new_windows)
+        return type(self)(self.engine, self.leftside, self.rightside, windows=new_windows)
     between = and_between
 
     def or_during(self, tick):
@@ -213,15 +239,123 @@ class Query(object):
     during = and_during
 
 
+class Intersection(Query):
+    """True when both my sides are.
+
+    The cheaper side is evaluated first, and the other side only in
+    the windows when that one was true.
+
+    """
+    def evaluate(self, branch, limit=None):
+        limit = _restrict(limit, self.windows)
+        if limit is not None and not limit:
+            return []
+        first, second = sorted(
+            (self.leftside, self.rightside), key=lambda q: q.cost(branch))
+        windows = first.evaluate(branch, limit)
+        if not windows:
+            return []
+        return second.evaluate(branch, windows)
+
+    def cost(self, branch):
+        return self.leftside.cost(branch) + self.rightside.cost(branch)
+
+    def _explain(self, branch, depth):
+        ret = ['{}Intersection (cost {}), cheaper side first:'.format(
+            '  ' * depth, self.cost(branch))]
+        for side in sorted(
+                (self.leftside, self.rightside), key=lambda q: q.cost(branch)):
+            ret.extend(side._explain(branch, depth + 1))
+        return ret
+
+
 class Union(Query):
-    pass
+    """True when either of my sides is.
+
+    The cheaper side is evaluated first, and the other side only in
+    the windows when that one was false.
+
+    """
+    def evaluate(self, branch, limit=None):
+        limit = _restrict(limit, self.windows)
+        if limit is not None and not limit:
+            return []
+        first, second = sorted(
+            (self.leftside, self.rightside), key=lambda q: q.cost(branch))
+        windows = first.evaluate(branch, limit)
+        rest = windows_not(windows)
+        if limit is not None:
+            rest = windows_and(rest, limit)
+        if not rest:
+            return windows
+        return windows_or(windows, second.evaluate(branch, rest))
+
+    def cost(self, branch):
+        return self.leftside.cost(branch) + self.rightside.cost(branch)
+
+    def _explain(self, branch, depth):
+        ret = ['{}Union (cost {}), cheaper side first:'.format(
+            '  ' * depth, self.cost(branch))]
+        for side in sorted(
+                (self.leftside, self.rightside), key=lambda q: q.cost(branch)):
+            ret.extend(side._explain(branch, depth + 1))
+        return ret
+
+
+class Complement(Query):
+    """True when the query I wrap isn't."""
+    def __new__(cls, engine, leftside, rightside=None, **kwargs):
+        me = object.__new__(cls)
+        me.engine = engine
+        me.leftside = leftside
+        me.rightside = None
+        me.windows = windows_normal(kwargs.get('windows', []))
+        return me
+
+    def evaluate(self, branch, limit=None):
+        limit = _restrict(limit, self.windows)
+        if limit is not None and not limit:
+            return []
+        windows = windows_not(self.leftside.evaluate(branch, limit))
+        if limit is not None:
+            return windows_and(windows, limit)
+        return windows
+
+    def cost(self, branch):
+        return self.leftside.cost(branch)
+
+    def _explain(self, branch, depth):
+        return ['{}Complement (cost {}) of:'.format(
+            '  ' * depth, self.cost(branch))
+        ] + self.leftside._explain(branch, depth + 1)
 
 
 class ComparisonQuery(Query):
     oper = lambda x, y: NotImplemented
 
-    def __call__(self):
-        return QueryResults(iter_eval_cmp(self, self.oper, engine=self.engine))
+    def evaluate(self, branch, limit=None):
+        return eval_cmp_windows(
+            self, self.oper, branch, engine=self.engine, limit=limit)
+
+    def cost(self, branch):
+        return (
+            _side_cost(self.engine, self.leftside, branch) +
+            _side_cost(self.engine, self.rightside, branch)
+        )
+
+    def _explain(self, branch, depth):
+        plan, detail = plan_cmp(
+            self, self.oper, branch, _restrict(None, self.windows))
+        if plan == 'sql':
+            how = 'SQL on {} for {!r}, {} {!r}'.format(*detail)
+        else:
+            how = {
+                'constant': 'constant',
+                'memory': 'history in the caches',
+                'scan': 'look up every turn'
+            }[plan]
+        return ['{}{} (cost {}): {}'.format(
+            '  ' * depth, type(self).__name__, self.cost(branch), how)]
 
 
 class EqQuery(ComparisonQuery):
@@ -256,6 +390,11 @@ comparisons = {
     'ge': GeQuery,
     'le': LeQuery
 }
+oper_names = {cls.oper: name for (name, cls) in comparisons.items()}
+# what each comparison becomes when you swap its sides
+flipped_opers = {
+    'eq': 'eq', 'ne': 'ne', 'gt': 'lt', 'lt': 'gt', 'ge': 'le', 'le': 'ge'
+}
 
 
 class StatusAlias(EntityStatAccessor):
@@ -278,149 +417,406 @@ class StatusAlias(EntityStatAccessor):
         return LeQuery(self.engine, self, other)
 
 
-def intersect_qry(qry):
-    windows = []
-    windowses = 0
-    if hasattr(qry.leftside, 'windows'):
-        windows.extend(qry.leftside.windows)
-        windowses += 1
-    if hasattr(qry.rightside, 'windows'):
-        windows.extend(qry.rightside.windows)
-        windowses += 1
-    if windowses > 1:
-        windows = windows_intersection(windowses)
-    return windows
+class QueryResults(object):
+    """The turns when a query was true.
 
+    The query isn't evaluated until you look at my ``windows``, a
+    list of ``(turn_from, turn_to)`` pairs, inclusive; a ``turn_to``
+    of ``None`` means the query stays true. Iterating over me gives
+    every turn in the windows, up to the turn I was made in.
 
-def iter_intersection_ticks2check(ticks, windows):
-    windows = windows_intersection(windows)
-    if not windows:
-        yield from ticks
-        return
-    for tick in sorted(ticks):
-        (left, right) = windows.pop(0)
-        if left is None:
-            if tick <= right:
-                yield tick
-                windows.insert(0, (left, right))
-        elif right is None:
-            if tick >= left:
-                yield from ticks
-                return
-            windows.insert(0, (left, right))
-        elif left <= tick <= right:
-            yield tick
-            windows.insert(0, (left, right))
-        elif tick < left:
-            windows.insert(0, (left, right))
+    """
+    def __init__(self, query, branch=None, last_turn=None):
+        self.query = query
+        self.branch = branch or query.engine.branch
+        self.last_turn = query.engine.turn if last_turn is None else last_turn
+        self._windows = None
+
+    @property
+    def windows(self):
+        if self._windows is None:
+            self._windows = self.query.evaluate(self.branch)
+        return self._windows
 
+    def __iter__(self):
+        for (start, end) in self.windows:
+            yield from range(
+                start, (self.last_turn if end is None else end) + 1)
+
+    def __contains__(self, turn):
+        windows = self.windows
+        # bisect on the starts alone; an end of None won't compare
+        i = bisect_right([start for (start, end) in windows], turn) - 1
+        if i < 0:
+            return False
+        end = windows[i][1]
+        return end is None or turn <= end
 
-class QueryResults(object):
-    def __init__(self, iter):
-        self.iter = iter
-        try:
-            self.next = next(self.iter)
-        except StopIteration:
-            return
+    def __bool__(self):
+        return bool(self.windows)
 
-    def __iter__(self):
-        return self
 
-    def __next__(self):
-        try:
-            r = self.next
-        except AttributeError:
-            raise StopIteration
-        try:
-            self.next = next(self.iter)
-        except StopIteration:
-            del self.next
-        return r
+def _history_source(engine, entity, stat):
+    """Return the cache that keeps ``entity``'s ``stat``, the key of its
+    history there, a function to get the stat from the cached values,
+    and the name of its table for ``QueryEngine.cmp_windows``.
 
-    def __bool__(self):
-        return hasattr(self, 'next')
+    Return ``None`` if it isn't kept in one.
 
+    """
+    if isinstance(entity, dict):
+        # DummyEntity, for constants
+        return None
+    if hasattr(entity, 'orig') and hasattr(entity, 'dest'):
+        return engine._edge_val_cache, (
+            entity.character.name, entity.orig, entity.dest, 0, stat
+        ), None, 'edge_val'
+    if hasattr(entity, 'character') and hasattr(entity, 'name'):
+        if stat in ('location', 'next_location'):
+            i = 0 if stat == 'location' else 1
+            return engine._things_cache, (entity.character.name, entity.name), \
+                lambda locs: None if locs is None else locs[i], stat
+        return engine._node_val_cache, (
+            entity.character.name, entity.name, stat), None, 'node_val'
+    if hasattr(entity, 'character'):
+        # a character's stat mapping
+        return engine._graph_val_cache, (
+            entity.character.name, stat), None, 'graph_val'
+    return None
+
+
+def turn_history(engine, cache, key, branch, extract=None, until=None):
+    """Return a list of turns when a value in ``cache`` changed, and a
+    list of what it was at the end of each.
+
+    ``key`` identifies the value in ``cache.branches``. The history
+    of ``branch`` includes that of its ancestors, up to when it forked.
+    Only the turns with changes are looked at, and none after ``until``.
 
-def iter_eval_cmp(qry, oper, start_branch=None, engine=None):
-    def mungeside(side):
-        if isinstance(side, Query):
-            return side()
-        elif isinstance(side, StatusAlias):
-            return EntityStatAccessor(
-                side.entity, side.stat, side.engine,
-                side.branch, side.tick, side.current, side.mungers
-            )
-        elif isinstance(side, EntityStatAccessor):
-            return side
+    """
+    turns = []
+    values = []
+    if key not in cache.branches:
+        return turns, values
+    branches = cache.branches[key]
+    lineage = engine._branch_lineage(branch, None, None)
+    start = None
+    for (b, end_turn, end_tick) in reversed(lineage):
+        if b in branches:
+            for turn, ticks in branches[b].items():
+                if start is not None and turn < start[0]:
+                    continue
+                if until is not None and turn > until:
+                    return turns, values
+                if end_turn is not None and turn > end_turn:
+                    break
+                last = missing = object()
+                for tick, v in ticks.items():
+                    if start is not None and (turn, tick) <= start:
+                        continue
+                    if turn == end_turn and tick > end_tick:
+                        break
+                    last = v
+                if last is missing:
+                    continue
+                if extract is not None:
+                    last = extract(last)
+                if turns and turns[-1] == turn:
+                    values[-1] = last
+                else:
+                    turns.append(turn)
+                    values.append(last)
+        start = (end_turn, end_tick)
+    return turns, values
+
+
+def _side_history(engine, side, branch, limit=None, scan=False):
+    """Return ``(turns, values)`` for one side of a comparison, or
+    ``(None, value)`` if it's a constant.
+
+    With a list of windows for ``limit``, leave out what changes are
+    outside of them, apart from the one in effect when they start.
+    With ``scan``, look up the stat in every turn, rather than reading
+    its history from the caches.
+
+    """
+    if not isinstance(side, EntityStatAccessor):
+        return None, side
+    if isinstance(side.entity, dict):
+        return None, side()
+    source = _history_source(engine, side.entity, side.stat)
+    if source is None or scan:
+        # no history to read; look at every turn
+        if limit is None:
+            turns = list(range(0, engine.turn + 1))
         else:
-            return lambda b, t: side
-
-    def getcache(side):
-        if hasattr(side, 'cache'):
-            return side.cache
-        if hasattr(side, 'entity'):
-            if side.stat in (
-                    'location', 'next_location', 'locations',
-                    'arrival_time', 'next_arrival_time'
-            ):
-                return engine._things_cache.branches[
-                    (side.entity.character.name, side.entity.name)]
-            if side.stat in side.entity._cache:
-                return side.entity._cache[side.stat]
-
-    leftside = mungeside(qry.leftside)
-    rightside = mungeside(qry.rightside)
-    windows = qry.windows or [(0, None)]
-    engine = engine or leftside.engine or rightside.engine
-    for (branch, _, _) in engine._iter_parent_btt(start_branch):
-        try:
-            lkeys = frozenset(getcache(leftside)[branch].keys())
-        except AttributeError:
-            lkeys = frozenset()
+            turns = []
+            for (start, end) in limit:
+                if start > engine.turn:
+                    break
+                turns.extend(range(start, (
+                    engine.turn if end is None else min((end, engine.turn))
+                ) + 1))
+        values = []
+        time = engine.time
         try:
-            rkeys = getcache(rightside)[branch].keys()
-        except AttributeError:
-            rkeys = frozenset()
-        ticks = lkeys.union(rkeys)
-        if ticks:
-            yield from (
-                (branch, tick) for tick in
-                iter_intersection_ticks2check(ticks, windows)
-                if oper(leftside(branch, tick), rightside(branch, tick))
-            )
+            for turn in turns:
+                engine.time = (branch, turn)
+                values.append(side.entity.get(side.stat))
+        finally:
+            engine.time = time
+    else:
+        cache, key, extract, table = source
+        turns, values = turn_history(
+            engine, cache, key, branch, extract,
+            None if limit is None else limit[-1][1]
+        )
+        if limit is not None:
+            i = bisect_right(turns, limit[0][0]) - 1
+            if i > 0:
+                del turns[:i]
+                del values[:i]
+    if side.mungers:
+        munged = []
+        for v in values:
+            if v is not None:
+                for munger in side.mungers:
+                    v = munger(v)
+            munged.append(v)
+        values = munged
+    return turns, values
+
+
+def _side_cost(engine, side, branch):
+    """Return how many values I'd have to look at for ``side``."""
+    if not isinstance(side, EntityStatAccessor):
+        return 0
+    source = _history_source(engine, side.entity, side.stat)
+    if source is None:
+        return 0 if isinstance(side.entity, dict) else engine.turn + 1
+    cache, key, extract, table = source
+    if key not in cache.branches:
+        return 0
+    branches = cache.branches[key]
+    return sum(
+        len(branches[b])
+        for (b, turn, tick) in engine._branch_lineage(branch, None, None)
+        if b in branches
+    )
+
+
+def _cold(engine, branch, since):
+    """Return whether any of the history of ``branch`` from turn
+    ``since`` onward is missing from the caches.
+
+    """
+    loaded = engine._loaded
+    if loaded is None:
+        # everything's loaded
+        return False
+    for (b, turn, tick) in engine._branch_lineage(branch, None, None):
+        if b not in loaded:
+            return True
+        turn_from, turn_to = loaded[b]
+        if turn_from > (since if turn is None else min((since, turn))):
+            return True
+        if turn_to is not None and (turn is None or turn_to < turn):
+            return True
+    return False
+
+
+def _stretches(engine, branch, until=None):
+    """Return the parts of ``branch`` and its ancestors to look at for
+    its history up to turn ``until``, for ``QueryEngine.cmp_windows``.
+
+    """
+    ret = []
+    start = (-1, -1)
+    stop = (MAXINT, MAXINT) if until is None else (until, MAXINT)
+    for (b, turn, tick) in reversed(engine._branch_lineage(branch, None, None)):
+        end = stop if turn is None else min((stop, (turn, tick)))
+        ret.append((b,) + start + end)
+        if end == stop:
+            break
+        start = end
+    return ret
+
+
+def plan_cmp(qry, oper, branch, limit=None):
+    """Decide how to evaluate the comparison ``qry`` in ``branch``.
+
+    Return a pair of the plan's name and some details. The plans are:
+
+    * ``'constant'``: neither side changes.
+    * ``'memory'``: the history of each side is in the caches.
+    * ``'sql'``: some of the history isn't loaded, so SQLite compares
+      a stat to a constant. The details are the table, the stat's key
+      in it, the name of the comparison, and the constant, as for
+      ``QueryEngine.cmp_windows``.
+    * ``'scan'``: look up the stats in every turn. This is for stats
+      that don't have a history of their own, and for comparisons the
+      database can't do when the history isn't loaded.
+
+    """
+    engine = qry.engine
+    stats = [
+        side for side in (qry.leftside, qry.rightside)
+        if isinstance(side, EntityStatAccessor)
+        and not isinstance(side.entity, dict)
+    ]
+    if not stats:
+        return 'constant', None
+    sources = [_history_source(engine, side.entity, side.stat) for side in stats]
+    if None in sources:
+        return 'scan', None
+    if not _cold(engine, branch, limit[0][0] if limit else 0):
+        return 'memory', None
+    if len(stats) == 1 and not stats[0].mungers and oper in oper_names:
+        (side,) = stats
+        name = oper_names[oper]
+        if side is qry.leftside:
+            value = qry.rightside
         else:
-            yield from (
-                (branch, tick) for tick in
-                range(engine._branch_start.get(branch, 0), engine.tick+1)
-                if oper(leftside(branch, tick), rightside(branch, tick))
-            )
+            value = qry.leftside
+            name = flipped_opers[name]
+        if isinstance(value, EntityStatAccessor):
+            value = value()
+        cache, key, extract, table = sources[0]
+        return 'sql', (table, key, name, value)
+    return 'scan', None
+
+
+def _numeric(values):
+    return all(type(v) in (int, float) for v in values)
+
+
+def _carry(turns, values, points):
+    """Return the values in effect at each of ``points``, or ``None``."""
+    ret = []
+    i = -1
+    n = len(turns)
+    for point in points:
+        while i + 1 < n and turns[i + 1] <= point:
+            i += 1
+        ret.append(None if i < 0 else values[i])
+    return ret
+
+
+def eval_cmp_windows(qry, oper, branch=None, engine=None, limit=None):
+    """Return the windows of turns in which the comparison ``qry`` is true.
+
+    Each side's history is read from the caches as a list of the turns
+    it changed and the values it changed to, so this takes time in
+    proportion to the number of changes, not the number of turns.
+    Numeric histories are compared with numpy, if it's installed.
+
+    If ``limit`` is a list of windows, only look in those.
+
+    """
+    engine = engine or qry.engine
+    branch = branch or engine.branch
+    limit = _restrict(limit, qry.windows)
+    if limit is not None and not limit:
+        return []
+    plan, detail = plan_cmp(qry, oper, branch, limit)
+    if plan == 'sql':
+        windows = engine.query.cmp_windows(*detail, _stretches(
+            engine, branch, None if limit is None else limit[-1][1]))
+        return windows if limit is None else windows_and(windows, limit)
+    scan = plan == 'scan'
+    lturns, lvals = _side_history(engine, qry.leftside, branch, limit, scan)
+    rturns, rvals = _side_history(engine, qry.rightside, branch, limit, scan)
+    if lturns is None and rturns is None:
+        windows = [(0, None)] if oper(lvals, rvals) else []
+        return windows if limit is None else windows_and(windows, limit)
+    if lturns is None:
+        points = rturns
+        lvals = [lvals] * len(points)
+    elif rturns is None:
+        points = lturns
+        rvals = [rvals] * len(points)
+    else:
+        points = sorted(set(lturns).union(rturns))
+        lvals = _carry(lturns, lvals, points)
+        rvals = _carry(rturns, rvals, points)
+    if not points:
+        return []
+    if np is not None and _numeric(lvals) and _numeric(rvals):
+        runs = np.diff(np.concatenate((
+            [0], oper(np.array(lvals), np.array(rvals)).astype(np.int8), [0])))
+        starts = np.flatnonzero(runs == 1).tolist()
+        stops = np.flatnonzero(runs == -1).tolist()
+    else:
+        starts = []
+        stops = []
+        was = False
+        for i, (l, r) in enumerate(zip(lvals, rvals)):
+            now = l is not None and r is not None and bool(oper(l, r))
+            if now and not was:
+                starts.append(i)
+            elif was and not now:
+                stops.append(i)
+            was = now
+        if was:
+            stops.append(len(points))
+    windows = [
+        (points[start], points[stop] - 1 if stop < len(points) else None)
+        for (start, stop) in zip(starts, stops)
+    ]
+    return windows if limit is None else windows_and(windows, limit)
 
 
 class QueryEngine(allegedb.query.QueryEngine):
     json_path = LiSE.__path__[0]
     IntegrityError = IntegrityError
     OperationalError = OperationalError
-
-    def universals_dump(self):
-        for key, branch, turn, tick, value in self.sql('universals_dump'):
+    keyframe_tables = dict(
+        allegedb.query.QueryEngine.keyframe_tables,
+        universals=1, rulebooks=1, rule_triggers=1, rule_prereqs=1, rule_actions=1,
+        character_rulebook=1, avatar_rulebook=1, character_thing_rulebook=1,
+        character_place_rulebook=1, character_portal_rulebook=1,
+        node_rulebook=2, portal_rulebook=3, things=2, avatars=3
+    )
+
+    def __init__(self, dbstring, connect_args, alchemy, json_dump=None, json_load=None):
+        super().__init__(dbstring, connect_args, alchemy, json_dump, json_load)
+        self._things2set = {}
+        self._avatars2set = {}
+        self._char_rules_handled = []
+        self._avatar_rules_handled = []
+        self._char_thing_rules_handled = []
+        self._char_place_rules_handled = []
+        self._char_portal_rules_handled = []
+        self._node_rules_handled = []
+        self._portal_rules_handled = []
+
+    def flush(self):
+        """Put all pending changes into the SQL transaction."""
+        super().flush()
+        self._flush_things()
+        self._flush_avatars()
+        self._flush_rules_handled()
+
+    def universals_dump(self, window=None):
+        for key, branch, turn, tick, value in self._dump('universals', window):
             yield self.json_load(key), branch, turn, tick, self.json_load(value)
 
-    def rulebooks_dump(self):
-        for rulebook, branch, turn, tick, rules in self.sql('rulebooks_dump'):
+    def rulebooks_dump(self, window=None):
+        for rulebook, branch, turn, tick, rules in self._dump('rulebooks', window):
             yield self.json_load(rulebook), branch, turn, tick, self.json_load(rules)
 
-    def _rule_dump(self, typ):
-        for rule, branch, turn, tick, lst in self.sql('rule_{}_dump'.format(typ)):
+    def _rule_dump(self, typ, window=None):
+        for rule, branch, turn, tick, lst in self._dump('rule_' + typ, window):
             yield rule, branch, turn, tick, self.json_load(lst)
 
-    def rule_triggers_dump(self):
-        return self._rule_dump('triggers')
+    def rule_triggers_dump(self, window=None):
+        return self._rule_dump('triggers', window)
 
-    def rule_prereqs_dump(self):
-        return self._rule_dump('prereqs')
+    def rule_prereqs_dump(self, window=None):
+        return self._rule_dump('prereqs', window)
 
-    def rule_actions_dump(self):
-        return self._rule_dump('actions')
+    def rule_actions_dump(self, window=None):
+        return self._rule_dump('actions', window)
 
     def characters_dump(self):
         for graph, typ in self.sql('graphs_dump'):
@@ -428,19 +824,19 @@ class QueryEngine(allegedb.query.QueryEngine):
                 yield self.json_load(graph)
     characters = characters_dump
 
-    def node_rulebook_dump(self):
-        for character, node, branch, turn, tick, rulebook in self.sql('node_rulebook_dump'):
+    def node_rulebook_dump(self, window=None):
+        for character, node, branch, turn, tick, rulebook in self._dump('node_rulebook', window):
             yield self.json_load(character), self.json_load(node), branch, turn, tick, self.json_load(rulebook)
 
-    def portal_rulebook_dump(self):
-        for character, orig, dest, branch, turn, tick, rulebook in self.sql('portal_rulebook_dump'):
+    def portal_rulebook_dump(self, window=None):
+        for character, orig, dest, branch, turn, tick, rulebook in self._dump('portal_rulebook', window):
             yield (
                 self.json_load(character), self.json_load(orig), self.json_load(dest),
                 branch, turn, tick, self.json_load(rulebook)
             )
 
-    def _charactery_rulebook_dump(self, qry):
-        for character, branch, turn, tick, rulebook in self.sql(qry+'_rulebook_dump'):
+    def _charactery_rulebook_dump(self, qry, window=None):
+        for character, branch, turn, tick, rulebook in self._dump(qry+'_rulebook', window):
             yield self.json_load(character), branch, turn, tick, self.json_load(rulebook)
 
     character_rulebook_dump = partialmethod(_charactery_rulebook_dump, 'character')
@@ -449,8 +845,9 @@ class QueryEngine(allegedb.query.QueryEngine):
     character_place_rulebook_dump = partialmethod(_charactery_rulebook_dump, 'character_place')
     character_portal_rulebook_dump = partialmethod(_charactery_rulebook_dump, 'character_portal')
 
-    def character_rules_handled_dump(self):
-        for character, rulebook, rule, branch, turn, tick in self.sql('character_rules_handled_dump'):
+    def character_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, rulebook, rule, branch, turn, tick in self._dump('character_rules_handled', window, snapshot=False):
             yield self.json_load(character), self.json_load(rulebook), rule, branch, turn, tick
 
     def character_rules_changes_dump(self):
@@ -462,8 +859,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 rule, branch, turn, tick, handled_branch, handled_turn
             )
 
-    def avatar_rules_handled_dump(self):
-        for character, rulebook, rule, graph, avatar, branch, turn, tick in self.sql('avatar_rules_handled_dump'):
+    def avatar_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, rulebook, rule, graph, avatar, branch, turn, tick in self._dump('avatar_rules_handled', window, snapshot=False):
             yield (
                 self.json_load(character), self.json_load(rulebook), rule,
                 self.json_load(graph), self.json_load(avatar), branch, turn, tick
@@ -479,8 +877,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 branch, turn, tick, handled_branch, handled_turn
             )
 
-    def character_thing_rules_handled_dump(self):
-        for character, rulebook, rule, thing, branch, turn, tick in self.sql('character_thing_rules_handled_dump'):
+    def character_thing_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, rulebook, rule, thing, branch, turn, tick in self._dump('character_thing_rules_handled', window, snapshot=False):
             yield self.json_load(character), self.json_load(rulebook), rule, self.json_load(thing), branch, turn, tick
 
     def character_thing_rules_changes_dump(self):
@@ -493,8 +892,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 branch, turn, tick, handled_branch, handled_turn
             )
 
-    def character_place_rules_handled_dump(self):
-        for character, rulebook, rule, place, branch, turn, tick in self.sql('character_place_rules_handled_dump'):
+    def character_place_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, rulebook, rule, place, branch, turn, tick in self._dump('character_place_rules_handled', window, snapshot=False):
             yield self.json_load(character), self.json_load(rulebook), rule, self.json_load(place), branch, turn, tick
 
     def character_place_rules_changes_dump(self):
@@ -507,8 +907,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 branch, turn, tick, handled_branch, handled_turn
             )
 
-    def character_portal_rules_handled_dump(self):
-        for character, rulebook, rule, orig, dest, branch, turn, tick in self.sql('character_portal_rules_handled_dump'):
+    def character_portal_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, rulebook, rule, orig, dest, branch, turn, tick in self._dump('character_portal_rules_handled', window, snapshot=False):
             yield (
                 self.json_load(character), self.json_load(rulebook), rule, self.json_load(orig), self.json_load(dest),
                 branch, turn, tick
@@ -524,8 +925,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 branch, turn, tick, handled_branch, handled_turn
             )
 
-    def node_rules_handled_dump(self):
-        for character, node, rulebook, rule, branch, turn, tick in self.sql('node_rules_handled_dump'):
+    def node_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, node, rulebook, rule, branch, turn, tick in self._dump('node_rules_handled', window, snapshot=False):
             yield self.json_load(character), self.json_load(node), self.json_load(rulebook), rule, branch, turn, tick
 
     def node_rules_changes_dump(self):
@@ -538,8 +940,9 @@ class QueryEngine(allegedb.query.QueryEngine):
                 branch, turn, tick, handled_branch, handled_turn
             )
 
-    def portal_rules_handled_dump(self):
-        for character, orig, dest, rulebook, rule, branch, turn, tick in self.sql('portal_rules_handled_dump'):
+    def portal_rules_handled_dump(self, window=None):
+        self._flush_rules_handled()
+        for character, orig, dest, rulebook, rule, branch, turn, tick in self._dump('portal_rules_handled', window, snapshot=False):
             yield (
                 self.json_load(character), self.json_load(orig), self.json_load(dest),
                 self.json_load(rulebook), rule, branch, turn, tick
@@ -559,15 +962,17 @@ class QueryEngine(allegedb.query.QueryEngine):
         for character, sense, branch, turn, tick, function in self.sql('senses_dump'):
             yield self.json_load(character), sense, branch, turn, tick, function
 
-    def things_dump(self):
-        for character, thing, branch, turn, tick, location, next_location in self.sql('things_dump'):
+    def things_dump(self, window=None):
+        self._flush_things()
+        for character, thing, branch, turn, tick, location, next_location in self._dump('things', window):
             yield (
                 self.json_load(character), self.json_load(thing), branch, turn, tick,
                 self.json_load(location), self.json_load(next_location) if next_location else None
             )
 
-    def avatars_dump(self):
-        for character_graph, avatar_graph, avatar_node, branch, turn, tick, is_av in self.sql('avatars_dump'):
+    def avatars_dump(self, window=None):
+        self._flush_avatars()
+        for character_graph, avatar_graph, avatar_node, branch, turn, tick, is_av in self._dump('avatars', window):
             yield (
                 self.json_load(character_graph), self.json_load(avatar_graph),
                 self.json_load(avatar_node), branch, turn, tick, is_av
@@ -581,16 +986,50 @@ class QueryEngine(allegedb.query.QueryEngine):
         key = self.json_dump(key)
         self.sql('universals_insert', key, branch, turn, tick, None)
 
-    def comparison(
-            self, entity0, stat0, entity1,
-            stat1=None, oper='eq', windows=[]
-    ):
-        stat1 = stat1 or stat0
-        return comparisons[oper](
-            leftside=entity0.status(stat0),
-            rightside=entity1.status(stat1),
-            windows=windows
-        )
+    def cmp_windows(self, table, key, oper, value, stretches):
+        """Return the windows of turns when a stat compared true to ``value``.
+
+        ``table`` is one of ``'graph_val'``, ``'node_val'``,
+        ``'edge_val'``, ``'location'``, or ``'next_location'``, and
+        ``key`` has the values of its key columns, not including the
+        branch and time. ``oper`` is the name of the comparison, as in
+        ``comparisons``. ``stretches`` is a list of ``(branch, turn_from,
+        tick_from, turn_to, tick_to)``, oldest first, giving the parts of
+        each branch to look at; only the times after the ``_from`` and up
+        to the ``_to`` count.
+
+        The comparisons are done by SQLite, on the values at the end of
+        each turn.
+
+        """
+        self.flush()
+        if table == 'edge_val':
+            # the edge index isn't encoded
+            key = tuple(
+                k if i == 3 else self.json_dump(k) for (i, k) in enumerate(key))
+        else:
+            key = tuple(map(self.json_dump, key))
+        value = self.json_dump(value)
+        runs = []
+        for (branch, turn_from, tick_from, turn_to, tick_to) in stretches:
+            rows = self.sql(
+                table + '_cmp_windows', oper, value, *key, branch,
+                turn_from, turn_from, tick_from, turn_to, turn_to, tick_to
+            ).fetchall()
+            if not rows:
+                continue
+            first_turn = rows[0][0]
+            # this stretch starts where the one before left off, maybe in
+            # the same turn, in which case it has the last word on that turn
+            while runs and runs[-1][0] >= first_turn:
+                runs.pop()
+            if runs:
+                runs[-1] = (runs[-1][0], first_turn - 1, runs[-1][2])
+                if runs[-1][2] == rows[0][2]:
+                    runs[-1] = (runs[-1][0], rows[0][1], rows[0][2])
+                    rows = rows[1:]
+            runs.extend(rows)
+        return [(turn, turn_to) for (turn, turn_to, ok) in runs if ok]
 
     def count_all_table(self, tbl):
         return self.sql('{}_count'.format(tbl)).fetchone()[0]
@@ -671,72 +1110,56 @@ class QueryEngine(allegedb.query.QueryEngine):
             rulebook
         )
 
-    def handled_character_rule(
-            self, character, rulebook, rule, branch, turn, tick
-    ):
-        (character, rulebook, rule) = map(
-            self.json_dump, (character, rulebook, rule)
-        )
-        return self.sql(
-            'handled_character_rule',
-            character,
-            rulebook,
-            rule,
-            branch,
-            turn,
-            tick,
-        )
+    def handled_character_rule(self, character, rulebook, rule, branch, turn, tick):
+        (character, rulebook) = map(self.json_dump, (character, rulebook))
+        self._char_rules_handled.append((character, rulebook, rule, branch, turn, tick))
 
-    def handled_avatar_rule(self, character, graph, av, rulebook, rule, branch, turn, tick):
-        character, graph, av, rulebook, rule = map(
-            self.json_dump, (character, graph, av, rulebook, rule)
+    def handled_avatar_rule(self, character, rulebook, rule, graph, avatar, branch, turn, tick):
+        character, rulebook, graph, avatar = map(
+            self.json_dump, (character, rulebook, graph, avatar)
         )
-        return self.sql(
-            'avatar_rules_handled_insert',
-            character,
-            rulebook,
-            rule,
-            graph,
-            av,
-            branch,
-            turn,
-            tick
+        self._avatar_rules_handled.append((character, rulebook, rule, graph, avatar, branch, turn, tick))
+
+    def handled_character_thing_rule(self, character, rulebook, rule, thing, branch, turn, tick):
+        character, rulebook, thing = map(self.json_dump, (character, rulebook, thing))
+        self._char_thing_rules_handled.append((character, rulebook, rule, thing, branch, turn, tick))
+
+    def handled_character_place_rule(self, character, rulebook, rule, place, branch, turn, tick):
+        character, rulebook, place = map(self.json_dump, (character, rulebook, place))
+        self._char_place_rules_handled.append((character, rulebook, rule, place, branch, turn, tick))
+
+    def handled_character_portal_rule(self, character, orig, dest, rulebook, rule, branch, turn, tick):
+        character, rulebook, orig, dest = map(
+            self.json_dump, (character, rulebook, orig, dest)
         )
+        self._char_portal_rules_handled.append((character, rulebook, rule, orig, dest, branch, turn, tick))
 
-    def handled_node_rule(
-            self, character, node, rulebook, rule, branch, turn, tick
-    ):
+    def handled_node_rule(self, character, node, rulebook, rule, branch, turn, tick):
         (character, node, rulebook) = map(
             self.json_dump, (character, node, rulebook)
         )
-        return self.sql(
-            'node_rules_handled_insert',
-            character,
-            node,
-            rulebook,
-            rule,
-            branch,
-            turn,
-            tick
-        )
+        self._node_rules_handled.append((character, node, rulebook, rule, branch, turn, tick))
 
-    def handled_portal_rule(
-            self, character, orig, dest, rulebook, rule, branch, turn, tick
-    ):
-        (character, orig, dest, rulebook, rule) = map(
-            self.json_dump, (character, orig, dest, rulebook, rule)
-        )
-        return self.sql(
-            'portal_rules_handled_insert',
-            character,
-            orig,
-            dest,
-            rulebook,
-            rule,
-            branch,
-            turn,
-            tick
+    def handled_portal_rule(self, character, orig, dest, rulebook, rule, branch, turn, tick):
+        (character, orig, dest, rulebook) = map(
+            self.json_dump, (character, orig, dest, rulebook)
         )
+        self._portal_rules_handled.append((character, orig, dest, rulebook, rule, branch, turn, tick))
+
+    def _flush_rules_handled(self):
+        """Send all the records of handled rules to the database."""
+        for table, handled in (
+                ('character_rules_handled', self._char_rules_handled),
+                ('avatar_rules_handled', self._avatar_rules_handled),
+                ('character_thing_rules_handled', self._char_thing_rules_handled),
+                ('character_place_rules_handled', self._char_place_rules_handled),
+                ('character_portal_rules_handled', self._char_portal_rules_handled),
+                ('node_rules_handled', self._node_rules_handled),
+                ('portal_rules_handled', self._portal_rules_handled)
+        ):
+            if handled:
+                self.sqlmany(table + '_insert', *handled)
+                del handled[:]
 
     def get_rulebook_char(self, rulemap, character):
         character = self.json_dump(character)
@@ -749,35 +1172,25 @@ class QueryEngine(allegedb.query.QueryEngine):
     def thing_loc_and_next_set(
             self, character, thing, branch, turn, tick, loc, nextloc
     ):
-        (character, thing) = map(
+        (character, thing, loc, nextloc) = map(
             self.json_dump,
-            (character, thing)
-        )
-        loc = self.json_dump(loc)
-        nextloc = self.json_dump(nextloc)
-        self.sql('del_things_after', character, thing, branch, turn, turn, tick)
-        self.sql(
-            'things_insert',
-            character,
-            thing,
-            branch,
-            turn,
-            tick,
-            loc,
-            nextloc
+            (character, thing, loc, nextloc)
         )
+        self._buffer('things', self._things2set, (character, thing, branch, turn, tick), (loc, nextloc))
+
+    def _flush_things(self):
+        """Send all new and changed thing locations to the database."""
+        self._flush_buffer('things', self._things2set)
 
     def avatar_set(self, character, graph, node, branch, turn, tick, isav):
         (character, graph, node) = map(
             self.json_dump, (character, graph, node)
         )
-        self.sql(
-            'del_avatars_after',
-            character, graph, node, branch, turn, turn, tick
-        )
-        self.sql(
-            'avatars_insert', character, graph, node, branch, turn, tick, isav
-        )
+        self._buffer('avatars', self._avatars2set, (character, graph, node, branch, turn, tick), (isav,))
+
+    def _flush_avatars(self):
+        """Send all new and changed avatarhood to the database."""
+        self._flush_buffer('avatars', self._avatars2set)
 
     def rulebooks_rules(self):
         for (rulebook, rule) in self.sql('rulebooks_rules'):
@@ -341,7 +341,8 @@ class RuleBook(MutableSequence, Signal):
     def __setitem__(self, i, v):
         v = getattr(v, 'name', v)
         branch, turn, tick = self.engine.nbtt()
-        cache = self._get_cache(branch, turn, tick)
+        # copy, so the history keeps what the rulebook was before
+        cache = list(self._get_cache(branch, turn, tick))
         cache[i] = v
         self.engine.query.set_rulebook(self.name, branch, turn, tick, cache)
         self.engine._rulebooks_cache.store(self.name, branch, turn, tick, cache)
@@ -351,7 +352,7 @@ class RuleBook(MutableSequence, Signal):
     def insert(self, i, v):
         v = getattr(v, 'name', v)
         branch, turn, tick = self.engine.nbtt()
-        cache = self._get_cache(branch, turn, tick)
+        cache = list(self._get_cache(branch, turn, tick))
         cache.insert(i, v)
         self.engine.query.set_rulebook(self.name, branch, turn, tick, cache)
         self.engine._rulebooks_cache.store(self.name, branch, turn, tick, cache)
@@ -364,11 +365,11 @@ class RuleBook(MutableSequence, Signal):
         return super().index(v)
 
     def __delitem__(self, i):
-        branch, turn, tick = self.engine.btt()
-        cache = self._get_cache(branch, turn, tick)
+        branch, turn, tick = self.engine.nbtt()
+        cache = list(self._get_cache(branch, turn, tick))
         del cache[i]
-        self.engine.query.set_rulebook(self.name, branch, tick, cache)
-        self.engine._rulebooks_cache.store(self.name, branch, tick, cache)
+        self.engine.query.set_rulebook(self.name, branch, turn, tick, cache)
+        self.engine._rulebooks_cache.store(self.name, branch, turn, tick, cache)
         self.engine.rulebook.send(self, i=i, v=None)
         self.send(self, i=i, v=None)
 
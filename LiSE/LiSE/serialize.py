@@ -0,0 +1,153 @@
+# This file is part of LiSE, a framework for life simulation games.
+# Copyright (c) Zachary Spector,  zacharyspector@gmail.com
+"""Ways of encoding the commands and results that pass between
+:class:`LiSE.proxy.EngineProxy` and the engine's own process.
+
+Each is a subclass of :class:`Serializer` with a unique ``name``,
+listed in ``serializers`` in order of preference. The proxy says which
+it would like, and the engine's process picks the first it can use.
+
+"""
+import pickle
+from collections import OrderedDict
+from io import BytesIO
+from types import FunctionType
+
+from allegedb.xjson import JSONReWrapper, JSONListReWrapper
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Serializer(object):
+    """Turn objects into ``bytes`` and back, on behalf of an engine or
+    an engine proxy.
+
+    LiSE entities become references to the same entity on the
+    other side.
+
+    """
+    name = None
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @classmethod
+    def available(cls):
+        """Return whether I can be used in this Python."""
+        return True
+
+    def dump(self, obj):
+        raise NotImplementedError
+
+    def load(self, data):
+        raise NotImplementedError
+
+
+class JSONSerializer(Serializer):
+    """The engine's own JSON encoding. Slow, but readable."""
+    name = 'json'
+
+    def dump(self, obj):
+        return self.engine.json_dump(obj).encode('utf-8')
+
+    def load(self, data):
+        return self.engine.json_load(data.decode('utf-8'))
+
+
+class PickleSerializer(Serializer):
+    """Pickle, with LiSE entities pickled by reference."""
+    name = 'pickle'
+
+    def _persistent_types(self):
+        engine = self.engine
+        return (
+            engine.char_cls, engine.thing_cls, engine.place_cls,
+            engine.portal_cls, FunctionType, JSONReWrapper, JSONListReWrapper
+        )
+
+    def dump(self, obj):
+        engine = self.engine
+        persistent = self._persistent_types()
+        buf = BytesIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+
+        def persistent_id(o):
+            if type(o) in persistent:
+                return engine.listify(o)
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        return buf.getvalue()
+
+    def load(self, data):
+        unpickler = pickle.Unpickler(BytesIO(data))
+        unpickler.persistent_load = self.engine.delistify
+        return unpickler.load()
+
+
+class MsgpackSerializer(Serializer):
+    """msgpack, with extension types for tuples and LiSE entities.
+
+    Only available if you have the ``msgpack`` package.
+
+    """
+    name = 'msgpack'
+    TUPLE = 1
+    LISTIFIED = 2
+
+    @classmethod
+    def available(cls):
+        return msgpack is not None
+
+    def _default(self, obj):
+        if type(obj) is tuple:
+            return msgpack.ExtType(self.TUPLE, self.dump(list(obj)))
+        listified = self.engine.listify(obj)
+        if listified is not obj:
+            return msgpack.ExtType(self.LISTIFIED, self.dump(listified))
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, list):
+            return list(obj)
+        raise TypeError("Can't serialize {}".format(type(obj)))
+
+    def _ext_hook(self, code, data):
+        if code == self.TUPLE:
+            return tuple(self.load(data))
+        if code == self.LISTIFIED:
+            return self.engine.delistify(self.load(data))
+        return msgpack.ExtType(code, data)
+
+    def dump(self, obj):
+        return msgpack.packb(
+            obj, default=self._default, strict_types=True, use_bin_type=True
+        )
+
+    def load(self, data):
+        return msgpack.unpackb(
+            data, ext_hook=self._ext_hook, raw=False, strict_map_key=False
+        )
+
+
+serializers = OrderedDict(
+    (cls.name, cls) for cls in (MsgpackSerializer, PickleSerializer, JSONSerializer)
+)
+
+
+def negotiate(wanted=None):
+    """Return the name of the first serializer in ``wanted`` that's available.
+
+    With no ``wanted``, use the first available in ``serializers``.
+    Raise ``ValueError`` if none of them will do.
+
+    """
+    if wanted is None:
+        wanted = list(serializers)
+    elif isinstance(wanted, str):
+        wanted = [wanted]
+    for name in wanted:
+        if name in serializers and serializers[name].available():
+            return name
+    raise ValueError("No serializer available out of {}".format(wanted))
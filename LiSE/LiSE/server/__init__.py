@@ -1,31 +1,122 @@
+import asyncio
 import cherrypy
 import threading
 import logging
+from concurrent.futures import Future
+from json import dumps
 from queue import Queue
 from ..handle import EngineHandle
+from .. import snapshot
+
+
+def _node_stat_copy(snap, node_or_char, node):
+    char = snap.character(node_or_char)
+    stats = dict(char.node[node])
+    stats['name'] = node
+    stats['character'] = node_or_char
+    if node in char.thing:
+        stats['location'] = char.thing[node]
+        stats.setdefault('next_location', None)
+    return stats
+
+
+# commands that can be answered from a snapshot of the present turn,
+# and how
+snapshot_reads = {
+    'get_watched_btt': lambda snap: snap.btt,
+    'character_stat_copy': lambda snap, char: dict(
+        snap.character(char).stat
+    ),
+    'character_nodes': lambda snap, char: list(snap.character(char).node),
+    'node_stat_copy': _node_stat_copy,
+    'portal_stat_copy': lambda snap, char, orig, dest: dict(
+        snap.character(char).portal[orig][dest]
+    ),
+    'get_thing_location': lambda snap, char, thing: snap.character(
+        char).thing.get(thing)
+}
+
+
+class DeltaBroadcaster(object):
+    """Push the result of every ``next_turn`` to subscribers in an
+    asyncio event loop.
+
+    Call :meth:`subscribe` in the loop to get an :class:`asyncio.Queue`
+    that the results will be put in. :meth:`serve_websocket` sends them
+    to websocket clients instead, if you have the ``websockets``
+    package.
+
+    """
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self._queues = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        self._queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._queues.discard(queue)
+
+    def publish(self, result):
+        """Send ``result`` to every subscriber. Safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._put, result)
+
+    def _put(self, result):
+        for queue in self._queues:
+            queue.put_nowait(result)
+
+    async def serve_websocket(self, host='localhost', port=8765):
+        """Start a websocket server that sends each result, as JSON, to
+        everyone connected. Return the server.
+
+        """
+        import websockets
+
+        async def send_results(websocket, path=None):
+            queue = self.subscribe()
+            try:
+                while True:
+                    await websocket.send(dumps(await queue.get()))
+            finally:
+                self.unsubscribe(queue)
+        return await websockets.serve(send_results, host, port)
 
 
 class LiSEHandleWebService(object):
+    """Serve an :class:`EngineHandle` over HTTP.
+
+    Commands that change the world run one at a time, in the order
+    they came in, and each request gets the response to its own
+    command. While nothing has changed since the last snapshot, the
+    commands in ``snapshot_reads`` are answered from it, concurrently.
+
+    Pass a :class:`DeltaBroadcaster` as ``broadcaster`` to push
+    ``next_turn`` results to it.
+
+    """
     exposed = True
 
     def __init__(self, *args, **kwargs):
         if 'logger' in kwargs:
-            self.logger = kwargs['logger']
+            self.logger = kwargs.pop('logger')
         else:
-            self.logger = kwargs['logger'] = logging.getLogger(__name__)
-        self.cmdq = kwargs['cmdq'] = Queue()
-        self.outq = kwargs['outq'] = Queue()
+            self.logger = logging.getLogger(__name__)
+        self.broadcaster = kwargs.pop('broadcaster', None)
+        self.cmdq = Queue()
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
         self._handle_thread = threading.Thread(
             target=self._run_handle_forever, args=args, kwargs=kwargs,
             daemon=True
         )
         self._handle_thread.start()
+        self.batch = LiSEBatchWebService(self)
 
-    @staticmethod
-    def _run_handle_forever(*args, **kwargs):
-        cmdq = kwargs.pop('cmdq')
-        outq = kwargs.pop('outq')
-        logger = kwargs.pop('logger')
+    def _run_handle_forever(self, *args, **kwargs):
+        cmdq = self.cmdq
+        logger = self.logger
         setup = kwargs.pop('setup', None)
         logq = Queue()
 
@@ -49,31 +140,90 @@ class LiSEHandleWebService(object):
                 )
 
         def get_log_forever(logq):
-            (level, data) = logq.get()
-            getattr(logger, level)(data)
+            while True:
+                (level, data) = logq.get()
+                logger.log(level, data)
 
         engine_handle = EngineHandle(args, kwargs, logq)
+        self._listify = engine_handle._real.listify
         if setup:
             setup(engine_handle._real)
         handle_log_thread = threading.Thread(
             target=get_log_forever, args=(logq,), daemon=True
         )
         handle_log_thread.start()
+        last_snapshot = None
         while True:
             inst = cmdq.get()
             if inst == 'shutdown':
-                handle_log_thread.join()
-                cmdq.close()
-                outq.close()
+                engine_handle.close()
                 return 0
+            fut, inst = inst
             cmd = inst.pop('command')
-            silent = inst.pop('silent', False)
-            log('command', (cmd, args))
-            response = getattr(engine_handle, cmd)(**inst)
-            if silent:
+            inst.pop('silent', None)
+            log('command', (cmd, inst))
+            try:
+                response = getattr(engine_handle, cmd)(**inst)
+            except Exception as ex:
+                fut.set_exception(ex)
                 continue
+            response = engine_handle._real.listify(response)
             log('result', response)
-            outq.put(engine_handle._real.listify(response))
+            fut.set_result(response)
+            if hasattr(engine_handle, '_after_ret'):
+                engine_handle._after_ret()
+                del engine_handle._after_ret
+            if cmd == 'next_turn' and self.broadcaster is not None:
+                self.broadcaster.publish(response)
+            # bring the snapshot back once the writes stop, if it's wanted.
+            # Every change to the world moves the tick, so only take a new
+            # one when the time differs from the last snapshot's
+            if self._snapshot is None and (
+                cmd in snapshot_reads or cmd in ('next_turn', 'time_travel')
+            ):
+                with self._snapshot_lock:
+                    if cmdq.empty():
+                        btt = engine_handle._real.btt()
+                        if last_snapshot is None or last_snapshot.btt != btt:
+                            last_snapshot = snapshot.take(engine_handle._real)
+                        self._snapshot = last_snapshot
+
+    def submit(self, inst):
+        """Run the command described by the dictionary ``inst``, and return
+        its result, or ``None`` if it's ``silent``.
+
+        This is what every request does. Call it yourself to use the
+        service without HTTP.
+
+        """
+        inst = dict(inst)
+        cmd = inst['command']
+        fut = Future()
+        if cmd in snapshot_reads:
+            snap = self._snapshot
+            if snap is not None:
+                kwargs = {
+                    k: v for (k, v) in inst.items()
+                    if k not in ('command', 'silent')
+                }
+                try:
+                    return self._listify(snapshot_reads[cmd](snap, **kwargs))
+                except (KeyError, TypeError):
+                    # let the engine raise the proper error
+                    pass
+            self.cmdq.put((fut, inst))
+        else:
+            # reads after this one must wait for it
+            with self._snapshot_lock:
+                self._snapshot = None
+                self.cmdq.put((fut, inst))
+        if inst.get('silent', False):
+            return None
+        return fut.result()
+
+    def shutdown(self):
+        self.cmdq.put('shutdown')
+        self._handle_thread.join()
 
     @cherrypy.tools.accept(media='application/json')
     @cherrypy.tools.json_out()
@@ -82,19 +232,45 @@ class LiSEHandleWebService(object):
 
     @cherrypy.tools.json_out()
     def POST(self, **kwargs):
-        silent = kwargs.get('silent', False)
-        self.cmdq.put(kwargs)
-        if silent:
-            return None
-        response = self.outq.get()
-        cherrypy.session['LiSE_response'] = response
+        response = self.submit(kwargs)
+        if not kwargs.get('silent', False):
+            cherrypy.session['LiSE_response'] = response
         return response
 
     def PUT(self, silent=False, **kwargs):
-        silent = silent
-        self.cmdq.put(kwargs)
+        kwargs['silent'] = silent
+        response = self.submit(kwargs)
         if not silent:
-            cherrypy.session['LiSE_response'] = self.outq.get()
+            cherrypy.session['LiSE_response'] = response
 
     def DELETE(self):
         cherrypy.session.pop('LiSE_response', None)
+
+
+class LiSEBatchWebService(object):
+    """Run a list of commands in one request, with the engine of a
+    :class:`LiSEHandleWebService`.
+
+    POST a JSON list of ``{"command": ..., "kwargs": {...}}`` objects,
+    or an object with that list under ``"commands"`` and, optionally,
+    ``"stop_on_error": true``. See :meth:`LiSE.handle.EngineHandle.batch`.
+
+    """
+    exposed = True
+
+    def __init__(self, service):
+        self.service = service
+
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    def POST(self):
+        body = cherrypy.request.json
+        if isinstance(body, list):
+            body = {'commands': body}
+        response = self.service.submit({
+            'command': 'batch',
+            'commands': body['commands'],
+            'stop_on_error': body.get('stop_on_error', False)
+        })
+        cherrypy.session['LiSE_response'] = response
+        return response
@@ -1,10 +1,16 @@
+import asyncio
 import cherrypy
+import threading
 from argparse import ArgumentParser
-from . import LiSEHandleWebService
+from . import LiSEHandleWebService, DeltaBroadcaster
 
 parser = ArgumentParser()
-parser.add_argument('world', action='store', required=True)
+parser.add_argument('world', action='store')
 parser.add_argument('-c', '--code', action='store')
+parser.add_argument(
+    '-w', '--websocket', action='store', type=int,
+    help="port to push each turn's changes from, by websocket"
+)
 args = parser.parse_args()
 conf = {
     '/': {
@@ -16,4 +22,19 @@ conf = {
         'tools.encode.encoding': 'utf-8'
     }
 }
-cherrypy.quickstart(LiSEHandleWebService(args.world, args.code), '/', conf)
+broadcaster = None
+if args.websocket:
+    loop = asyncio.new_event_loop()
+    broadcaster = DeltaBroadcaster(loop)
+
+    def serve_forever():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(
+            broadcaster.serve_websocket('localhost', args.websocket)
+        )
+        loop.run_forever()
+    threading.Thread(target=serve_forever, daemon=True).start()
+cherrypy.quickstart(
+    LiSEHandleWebService(args.world, args.code, broadcaster=broadcaster),
+    '/', conf
+)
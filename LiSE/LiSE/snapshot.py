@@ -0,0 +1,627 @@
+# This file is part of LiSE, a framework for life simulation games.
+# Copyright (c) Zachary Spector,  zacharyspector@gmail.com
+"""Read-only snapshots of the world at the current turn, published in
+shared memory by the engine's process.
+
+A :class:`SnapshotWriter` keeps the snapshot in a data segment of
+shared memory, and a small header segment says how much of it is
+current. Any process on the same host can open a
+:class:`WorldSnapshot` by the header's name and read the world from
+there, without asking the engine.
+
+The data segment holds a dictionary of every distinct name and value,
+each pickled once, and a log of fixed-width rows of codes into that
+dictionary: what kind of fact the row records (a node exists, a stat of
+a portal, a thing's location...), the character, the entity, the key,
+and the value. Rows and symbols are only ever appended, so every
+version of the snapshot is a prefix of the segment that the writer
+won't touch again. When the engine moves forward in the same branch,
+the writer appends only the rows for what changed, which it gets from
+:meth:`LiSE.engine.Engine.get_delta`. Readers apply the new rows to
+their index of codes, reading them in place through a
+:class:`memoryview`, and unpickle a name or value only when it's asked
+for, and only once.
+
+When the segment is full, or the engine goes to another branch or
+back in time, the writer puts the rows that are still true in a new
+segment, and readers start over from that.
+
+Shared memory is only available in Pythons with
+:mod:`multiprocessing.shared_memory`. :func:`take` makes the same kind
+of snapshot for threads in the engine's own process.
+
+"""
+import pickle
+import struct
+from array import array
+from collections.abc import Mapping
+from copy import deepcopy
+from io import BytesIO
+
+from allegedb.xjson import JSONReWrapper, JSONListReWrapper
+
+from .serialize import PickleSerializer
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    SharedMemory = None
+
+# sequence number, version, number of symbols, number of rows, symbol
+# of the (branch, turn, tick), length of the data segment's name, the name
+HEADER = struct.Struct('=QQQQQH46s')
+# how many symbols, bytes of symbols, and rows the data segment can hold
+CAPACITY = struct.Struct('=QQQ')
+# kind, character, node or portal origin, portal destination, key, value
+ROW = struct.Struct('=6i')
+(
+    CHARACTER, CHARACTER_STAT, NODE, NODE_STAT, THING, PORTAL, PORTAL_STAT
+) = range(7)
+# codes that aren't symbols: nothing there, or deleted; and exists
+NONE = -1
+EXISTS = -2
+NODE_SPECIAL_STATS = {
+    'name', 'character', 'location', 'arrival_time', 'next_arrival_time',
+    'rulebook'
+}
+CHARACTER_SPECIAL_STATS = {
+    'nodes', 'edges', 'node_val', 'edge_val', 'character_rulebook',
+    'avatar_rulebook', 'character_thing_rulebook',
+    'character_place_rulebook', 'character_portal_rulebook'
+}
+
+
+def available():
+    """Return whether snapshots can be used in this Python."""
+    return SharedMemory is not None
+
+
+def _open(name):
+    shm = SharedMemory(name)
+    try:
+        # only the writer should unlink the segment
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except (ImportError, AttributeError):
+        pass
+    return shm
+
+
+def _unwrapped(stats):
+    """Return a dictionary of ``stats``, with lists and dictionaries as
+    they'd be in a delta, rather than wrapped.
+
+    """
+    return {
+        k: v._v if isinstance(v, (JSONReWrapper, JSONListReWrapper)) else v
+        for (k, v) in stats
+    }
+
+
+def character_state(char):
+    """Return ``char``'s stats, its nodes' stats, its things' locations,
+    and its portals' stats, keyed by origin, then destination.
+
+    """
+    node = {}
+    thing = {}
+    for name, n in char.node.items():
+        stats = node[name] = {}
+        for k, v in _unwrapped(n.items()).items():
+            if k == 'location':
+                thing[name] = v
+            elif k not in NODE_SPECIAL_STATS and v is not None:
+                stats[k] = v
+    portal = {}
+    for p in char.portals():
+        portal.setdefault(p.orig, {})[p.dest] = _unwrapped(p.items())
+    return _unwrapped(char.stat.items()), node, thing, portal
+
+
+class SnapshotWriter(object):
+    """Publish snapshots of ``engine`` under the name ``name``."""
+    def __init__(self, engine, name):
+        if not available():
+            raise RuntimeError("Shared memory snapshots need Python 3.8 or later")
+        self.engine = engine
+        if len(name.encode('utf-8')) > 30:
+            raise ValueError("Snapshot names can't be longer than 30 bytes")
+        self.name = name
+        self.version = 0
+        self._dump = PickleSerializer(engine).dump
+        self._header = SharedMemory(name, create=True, size=HEADER.size)
+        HEADER.pack_into(self._header.buf, 0, 0, 0, 0, 0, 0, 0, b'')
+        self._data = None
+        self._segments = 0
+        self._btt = None
+        # what the snapshot says now, with values pickled, so I can
+        # compare them to what's new, and start a new segment
+        self._live = {}
+
+    def publish(self):
+        """Write a new version of the snapshot and point readers at it.
+
+        Return the version number.
+
+        """
+        engine = self.engine
+        btt = engine.btt()
+        last = self._btt
+        if last is None or btt[0] != last[0] or btt[1:] < last[1:]:
+            self._live = {}
+            for name, char in engine.character.items():
+                stat, node, thing, portal = character_state(char)
+                self._live[name] = self._dumped(stat, node, thing, portal)
+            self._rewrite(btt)
+        else:
+            if btt == last:
+                rows = []
+            else:
+                rows = self._changes(engine.get_delta(
+                    btt[0], last[1], last[2], btt[1], btt[2]
+                ))
+            if not self._write(*self._encode(rows, btt)):
+                self._rewrite(btt)
+        self._btt = btt
+        return self.version
+
+    def _dumped(self, stat, node, thing, portal):
+        dump = self._dump
+        return (
+            {k: dump(v) for (k, v) in stat.items()},
+            {n: {k: dump(v) for (k, v) in stats.items()}
+             for (n, stats) in node.items()},
+            {n: dump(loc) for (n, loc) in thing.items()},
+            {orig: {
+                dest: {k: dump(v) for (k, v) in stats.items()}
+                for (dest, stats) in dests.items()
+            } for (orig, dests) in portal.items()}
+        )
+
+    def _put(self, rows, d, k, v, row):
+        """Set ``d[k]`` to ``v``, or delete it if ``v`` is ``None``, and
+        record that as a row, unless nothing changed.
+
+        """
+        if v is None:
+            if d.pop(k, None) is not None:
+                rows.append(row + (NONE,))
+            return
+        v = self._dump(v)
+        if d.get(k) != v:
+            d[k] = v
+            rows.append(row + (v,))
+
+    def _changes(self, delta):
+        """Apply ``delta`` to my copy of the world, and return a list of
+        rows that describe the changes.
+
+        """
+        live = self._live
+        chars = self.engine.character
+        put = self._put
+        rows = []
+        for name in list(live):
+            if name not in chars:
+                del live[name]
+                rows.append((CHARACTER, name, None, None, None, NONE))
+        for name in chars:
+            if name not in live:
+                live[name] = ({}, {}, {}, {})
+                rows.append((CHARACTER, name, None, None, None, EXISTS))
+        for name, chard in delta.items():
+            if name not in live:
+                continue
+            stat, node, thing, portal = live[name]
+            for n, exists in chard.get('nodes', {}).items():
+                if exists:
+                    if n not in node:
+                        node[n] = {}
+                        rows.append((NODE, name, n, None, None, EXISTS))
+                elif n in node:
+                    del node[n]
+                    thing.pop(n, None)
+                    rows.append((NODE, name, n, None, None, NONE))
+            for n, stats in chard.get('node_val', {}).items():
+                if n not in node:
+                    continue
+                for k, v in stats.items():
+                    if k == 'location':
+                        put(rows, thing, n, v, (THING, name, n, None, None))
+                    elif k not in NODE_SPECIAL_STATS:
+                        put(rows, node[n], k, v, (NODE_STAT, name, n, None, k))
+            for orig, dests in chard.get('edges', {}).items():
+                for dest, exists in dests.items():
+                    if exists:
+                        if dest not in portal.get(orig, {}):
+                            portal.setdefault(orig, {})[dest] = {}
+                            rows.append((PORTAL, name, orig, dest, None, EXISTS))
+                    elif dest in portal.get(orig, {}):
+                        del portal[orig][dest]
+                        if not portal[orig]:
+                            del portal[orig]
+                        rows.append((PORTAL, name, orig, dest, None, NONE))
+            for orig, dests in chard.get('edge_val', {}).items():
+                for dest, stats in dests.items():
+                    if dest not in portal.get(orig, {}):
+                        continue
+                    for k, v in stats.items():
+                        if k != 'rulebook':
+                            put(rows, portal[orig][dest], k, v,
+                                (PORTAL_STAT, name, orig, dest, k))
+            for k, v in chard.items():
+                if k not in CHARACTER_SPECIAL_STATS:
+                    put(rows, stat, k, v, (CHARACTER_STAT, name, None, None, k))
+        return rows
+
+    def _rows(self):
+        """Iterate over rows that describe my whole copy of the world."""
+        for name, (stat, node, thing, portal) in self._live.items():
+            yield CHARACTER, name, None, None, None, EXISTS
+            for k, v in stat.items():
+                yield CHARACTER_STAT, name, None, None, k, v
+            for n, stats in node.items():
+                yield NODE, name, n, None, None, EXISTS
+                for k, v in stats.items():
+                    yield NODE_STAT, name, n, None, k, v
+            for n, loc in thing.items():
+                yield THING, name, n, None, None, loc
+            for orig, dests in portal.items():
+                for dest, stats in dests.items():
+                    yield PORTAL, name, orig, dest, None, EXISTS
+                    for k, v in stats.items():
+                        yield PORTAL_STAT, name, orig, dest, k, v
+
+    def _encode(self, rows, btt):
+        """Return the codes for ``rows`` as a flat array, the symbols
+        that are new, and the code for ``btt``.
+
+        Names are pickled here; values already are. New symbols get
+        codes in my dictionary right away, so if they don't get written,
+        I need a new segment.
+
+        """
+        codes = self._codes
+        new = []
+        dump = self._dump
+
+        def code(b):
+            if b not in codes:
+                codes[b] = len(codes)
+                new.append(b)
+            return codes[b]
+
+        flat = array('i')
+        for kind, char, a, b, key, value in rows:
+            flat.extend((
+                kind,
+                code(dump(char)),
+                NONE if a is None else code(dump(a)),
+                NONE if b is None else code(dump(b)),
+                NONE if key is None else code(dump(key)),
+                value if isinstance(value, int) else code(value)
+            ))
+        return flat, new, code(dump(btt))
+
+    def _write(self, flat, new, btt_code):
+        """Append ``flat`` rows and ``new`` symbols to the data segment,
+        and publish them as a new version.
+
+        Return ``False`` if they don't fit.
+
+        """
+        nsyms, nbytes, nrows = self._counts
+        syms_cap, bytes_cap, rows_cap = self._capacity
+        new_bytes = b''.join(new)
+        rows = len(flat) * flat.itemsize // ROW.size
+        if (
+            nsyms + len(new) > syms_cap
+            or nbytes + len(new_bytes) > bytes_cap
+            or nrows + rows > rows_cap
+        ):
+            return False
+        buf = self._data.buf
+        offsets = array('Q')
+        end = nbytes
+        for sym in new:
+            end += len(sym)
+            offsets.append(end)
+        at = CAPACITY.size + 8 * nsyms
+        buf[at:at+8*len(new)] = offsets.tobytes()
+        at = CAPACITY.size + 8 * syms_cap + nbytes
+        buf[at:at+len(new_bytes)] = new_bytes
+        at = CAPACITY.size + 8 * syms_cap + bytes_cap + ROW.size * nrows
+        raw = flat.tobytes()
+        buf[at:at+len(raw)] = raw
+        self._counts = (nsyms + len(new), end, nrows + rows)
+        self.version += 1
+        # seqlock: readers retry while the sequence number is odd,
+        # or if it changed while they read the header
+        hbuf = self._header.buf
+        seq = HEADER.unpack_from(hbuf)[0]
+        struct.pack_into('=Q', hbuf, 0, seq + 1)
+        encoded = self._data_name.encode('utf-8')
+        HEADER.pack_into(
+            hbuf, 0, seq + 1, self.version, self._counts[0],
+            self._counts[2], btt_code, len(encoded), encoded
+        )
+        struct.pack_into('=Q', hbuf, 0, seq + 2)
+        return True
+
+    def _rewrite(self, btt):
+        """Put my whole copy of the world in a new data segment, with
+        room for about as much again, and publish it.
+
+        """
+        self._codes = {}
+        self._counts = (0, 0, 0)
+        flat, new, btt_code = self._encode(self._rows(), btt)
+        nbytes = sum(map(len, new))
+        self._capacity = (
+            2 * len(new) + 64,
+            (2 * nbytes + 4096) // 8 * 8,
+            2 * len(flat) * flat.itemsize // ROW.size + 256
+        )
+        syms_cap, bytes_cap, rows_cap = self._capacity
+        self._segments += 1
+        self._data_name = '{}-{}'.format(self.name, self._segments)
+        old, self._data = self._data, SharedMemory(
+            self._data_name, create=True, size=CAPACITY.size
+            + 8 * syms_cap + bytes_cap + ROW.size * rows_cap
+        )
+        CAPACITY.pack_into(self._data.buf, 0, *self._capacity)
+        self._write(flat, new, btt_code)
+        # readers that already opened the old segment keep their mapping
+        if old is not None:
+            old.close()
+            old.unlink()
+
+    def close(self):
+        for shm in (self._data, self._header):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._data = self._header = None
+
+
+def _set_code(d, k, v):
+    if v == NONE:
+        d.pop(k, None)
+    else:
+        d[k] = v
+
+
+class _Decoded(Mapping):
+    """A dictionary of codes, read as what they stand for.
+
+    Keys are decoded all at once, the first time I'm looked in; values
+    when they're asked for.
+
+    """
+    __slots__ = ['_codes', '_symbol', '_keys']
+
+    def __init__(self, codes, symbol):
+        self._codes = codes
+        self._symbol = symbol
+        self._keys = None
+
+    def _decoded_keys(self):
+        if self._keys is None:
+            symbol = self._symbol
+            self._keys = {symbol(code): code for code in self._codes}
+        return self._keys
+
+    def __iter__(self):
+        return iter(self._decoded_keys())
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, k):
+        return k in self._decoded_keys()
+
+    def __getitem__(self, k):
+        v = self._codes[self._decoded_keys()[k]]
+        if isinstance(v, dict):
+            return _Decoded(v, self._symbol)
+        return self._symbol(v)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CharacterSnapshot(object):
+    """One character in a snapshot.
+
+    ``stat`` is a mapping of the character's stats, ``node`` of each
+    node's stats, ``thing`` of each thing's location, and ``portal``
+    of each portal's stats, keyed by origin, then destination.
+
+    """
+    __slots__ = ['name', 'stat', 'node', 'thing', 'portal']
+
+    def __init__(self, name, stat, node, thing, portal):
+        self.name = name
+        self.stat = stat
+        self.node = node
+        self.thing = thing
+        self.portal = portal
+
+
+class WorldSnapshot(object):
+    """Read the snapshot that the engine's process published as ``name``.
+
+    I stay on the same version until you call :meth:`refresh`, and so
+    do the characters I've given you. LiSE entities in stats come back
+    in their listified form. Values are shared between reads, so don't
+    change them.
+
+    """
+    def __init__(self, name):
+        if not available():
+            raise RuntimeError("Shared memory snapshots need Python 3.8 or later")
+        self.name = name
+        self.version = 0
+        self._header = _open(name)
+        self._data = None
+        self._data_name = None
+        self.btt = None
+        self.refresh()
+
+    @staticmethod
+    def _load(data):
+        unpickler = pickle.Unpickler(BytesIO(data))
+        unpickler.persistent_load = lambda pid: pid
+        return unpickler.load()
+
+    def _read_header(self):
+        hbuf = self._header.buf
+        while True:
+            seq, version, nsyms, nrows, btt, n, name = HEADER.unpack_from(hbuf)
+            if seq % 2 == 0 and HEADER.unpack_from(hbuf)[0] == seq:
+                return version, nrows, btt, name[:n].decode('utf-8')
+
+    def refresh(self):
+        """Switch to the latest version, and return whether it's new."""
+        while True:
+            version, nrows, btt, data_name = self._read_header()
+            if version == self.version:
+                return False
+            if data_name == self._data_name:
+                break
+            try:
+                data = _open(data_name)
+            except FileNotFoundError:
+                # the writer moved on already
+                continue
+            if self._data is not None:
+                self._data.close()
+            self._data = data
+            self._data_name = data_name
+            syms_cap, bytes_cap, rows_cap = CAPACITY.unpack_from(data.buf)
+            self._bytes_at = CAPACITY.size + 8 * syms_cap
+            self._rows_at = self._bytes_at + bytes_cap
+            self._nrows = 0
+            self._symbols = {}
+            # character code: its stats, nodes, things, and portals,
+            # all in codes
+            self._index = {}
+            # codes of characters I gave out, which mustn't change
+            self._given = set()
+            break
+        self._apply(self._nrows, nrows)
+        self._nrows = nrows
+        self.version = version
+        self.btt = self._symbol(btt)
+        self._chars = {}
+        self._names = None
+        return True
+
+    def _apply(self, start, stop):
+        index = self._index
+        given = self._given
+        at = self._rows_at
+        with self._data.buf[
+            at + ROW.size * start:at + ROW.size * stop
+        ] as rows:
+            for kind, char, a, b, key, value in ROW.iter_unpack(rows):
+                if kind == CHARACTER:
+                    if value == EXISTS:
+                        index.setdefault(char, ({}, {}, {}, {}))
+                    else:
+                        index.pop(char, None)
+                    continue
+                if char in given:
+                    index[char] = deepcopy(index[char])
+                    given.discard(char)
+                stat, node, thing, portal = index[char]
+                if kind == CHARACTER_STAT:
+                    _set_code(stat, key, value)
+                elif kind == NODE:
+                    if value == EXISTS:
+                        node.setdefault(a, {})
+                    else:
+                        node.pop(a, None)
+                        thing.pop(a, None)
+                elif kind == NODE_STAT:
+                    _set_code(node[a], key, value)
+                elif kind == THING:
+                    _set_code(thing, a, value)
+                elif kind == PORTAL:
+                    if value == EXISTS:
+                        portal.setdefault(a, {}).setdefault(b, {})
+                    else:
+                        portal[a].pop(b, None)
+                        if not portal[a]:
+                            del portal[a]
+                else:
+                    _set_code(portal[a][b], key, value)
+
+    def _symbol(self, code):
+        if code in self._symbols:
+            return self._symbols[code]
+        buf = self._data.buf
+        if code:
+            start, end = struct.unpack_from(
+                '=QQ', buf, CAPACITY.size + 8 * (code - 1))
+        else:
+            start = 0
+            end = struct.unpack_from('=Q', buf, CAPACITY.size)[0]
+        at = self._bytes_at
+        with buf[at+start:at+end] as data:
+            ret = self._symbols[code] = self._load(data)
+        return ret
+
+    def characters(self):
+        """Return a list of the names of the characters."""
+        return list(map(self._symbol, self._index))
+
+    def character(self, name):
+        """Return a :class:`CharacterSnapshot` of the character ``name``."""
+        if name not in self._chars:
+            if self._names is None:
+                self._names = {
+                    self._symbol(code): code for code in self._index
+                }
+            code = self._names[name]
+            self._given.add(code)
+            symbol = self._symbol
+            self._chars[name] = CharacterSnapshot(name, *(
+                _Decoded(codes, symbol) for codes in self._index[code]
+            ))
+        return self._chars[name]
+
+    def close(self):
+        for shm in (self._data, self._header):
+            if shm is not None:
+                shm.close()
+        self._data = self._header = None
+
+
+class LocalSnapshot(object):
+    """A snapshot of the world kept in ordinary memory, for threads
+    in the engine's own process.
+
+    Has the same ``btt`` and ``character`` as :class:`WorldSnapshot`,
+    but stats hold the actual values, not their listified forms.
+
+    """
+    __slots__ = ['btt', '_chars']
+
+    def __init__(self, btt, chars):
+        self.btt = btt
+        self._chars = chars
+
+    def characters(self):
+        return list(self._chars)
+
+    def character(self, name):
+        return self._chars[name]
+
+
+def take(engine):
+    """Return a :class:`LocalSnapshot` of ``engine`` as it is now."""
+    return LocalSnapshot(engine.btt(), {
+        name: CharacterSnapshot(name, *character_state(char))
+        for (name, char) in engine.character.items()
+    })
@@ -1,5 +1,10 @@
 import unittest
 import re
+import os
+import shutil
+import tempfile
+from random import Random
+from uuid import uuid4
 from functools import reduce
 from collections import defaultdict
 from allegedb.cache import StructuredDefaultDict, WindowDict
@@ -371,6 +376,321 @@ class SimTest(TestCase):
                                 )
 
 
+def full_scan_node_rules(eng):
+    """Find unhandled node rules by looking at every node, as the rules
+    engine did before it had an index of rulebook users.
+
+    """
+    cache = eng._node_rules_handled_cache
+    btt = eng.btt()
+    for character, char in eng.character.items():
+        for node in char.node:
+            try:
+                rulebook = cache.get_rulebook(character, node, *btt)
+                rules = cache.unhandled_rulebook_rules((character, node), rulebook, *btt)
+            except KeyError:
+                continue
+            for rule in rules:
+                yield character, node, rulebook, rule
+
+
+def poke(node):
+    pass
+
+
+def prod(node):
+    pass
+
+
+def test_node_rules_index():
+    eng = Engine(':memory:', random_seed=69105)
+    created = []
+    for charn in ('physical', 'other'):
+        char = eng.new_character(charn)
+        for i in range(6):
+            char.new_place(i)
+            created.append((charn, i))
+    phys = eng.character['physical']
+    other = eng.character['other']
+    phys.place[1].rule(poke, always=True)
+    phys.place[4].rulebook.append('poke')
+    other.place[3].rule(prod, always=True)
+    cache = eng._node_rules_handled_cache
+    rbcache = eng._nodes_rulebooks_cache
+
+    def check(expected):
+        found = list(cache.iter_unhandled_rules(*eng.btt()))
+        # nodes in the order they were made, whatever order they iterate in
+        assert found == sorted(
+            full_scan_node_rules(eng), key=lambda rule: created.index(rule[:2]))
+        assert {(char, node, rule) for (char, node, rulebook, rule) in found} == expected
+    check({
+        ('physical', 1, 'poke'), ('physical', 4, 'poke'), ('other', 3, 'prod')
+    })
+    eng.turn = 1
+    phys.place[2].rulebook = ('other', 3)
+    phys.place[4].rulebook = ('other', 3)
+    check({
+        ('physical', 1, 'poke'), ('physical', 2, 'prod'), ('physical', 4, 'prod'),
+        ('other', 3, 'prod')
+    })
+    assert ('physical', 4) not in rbcache.users[('physical', 4)]
+    eng.turn = 2
+    phys.place[1].delete()
+    phys.place[4].rulebook = ('physical', 4)
+    check({
+        ('physical', 2, 'prod'), ('physical', 4, 'poke'), ('other', 3, 'prod')
+    })
+    # deleted and reassigned nodes aren't looked at anymore
+    assert ('physical', 1) not in rbcache.users[('physical', 1)]
+    assert list(rbcache.users[('other', 3)]) == [('other', 3), ('physical', 2)]
+    del eng.rulebook[('physical', 1)][0]
+    assert ('physical', 1) not in eng._rulebooks_cache.nonempty
+    # another branch, from before the deletion
+    eng.turn = 1
+    eng.branch = 'before'
+    check({
+        ('physical', 1, 'poke'), ('physical', 2, 'prod'), ('physical', 4, 'prod'),
+        ('other', 3, 'prod')
+    })
+    eng.close()
+
+
+def fainting(node):
+    return node['hp'] < 3
+
+
+def faint(node):
+    node['fainted'] = True
+
+
+def test_skip_unchanged_triggers():
+    eng = Engine(':memory:', random_seed=69105, track_reads=True)
+    phys = eng.new_character('physical')
+    for i in range(3):
+        phys.new_place(i)['hp'] = 10
+    rule = phys.place[0].rule(faint)
+    rule.trigger(fainting)
+    phys.place[1].rulebook.append('faint')
+    phys.place[2].rulebook.append('faint')
+    eng.next_turn()
+    assert eng.skipped_rules == 0
+    # nothing the trigger looked at has changed
+    eng.next_turn()
+    assert eng.skipped_rules == 3
+    phys.place[1]['hp'] = 1
+    phys.place[2]['mp'] = 1
+    eng.next_turn()
+    assert eng.skipped_rules == 5
+    assert phys.place[1]['fainted']
+    assert 'fainted' not in phys.place[0]
+    assert 'fainted' not in phys.place[2]
+    eng.close()
+
+
+def hungry(node):
+    return node['hp'] > 0
+
+
+def unlucky(node):
+    return node['hp'] < 10 and node.engine.coinflip()
+
+
+def starve(node):
+    node['hp'] -= node.engine.roll_die(3)
+
+
+def starving_world(**kwargs):
+    eng = Engine(':memory:', random_seed=69105, rule_random_streams=True, **kwargs)
+    phys = eng.new_character('physical')
+    for i in range(8):
+        phys.new_place(i)['hp'] = 6 + i
+    rule = phys.place[0].rule(starve)
+    rule.trigger(unlucky)
+    rule.prereq(hungry)
+    for i in range(1, 8):
+        phys.place[i].rulebook.append('starve')
+    return eng
+
+
+def test_trigger_workers():
+    serial = starving_world()
+    parallel = starving_world(trigger_workers=2)
+
+    def hps(eng):
+        return {
+            name: place['hp'] for (name, place)
+            in eng.character['physical'].place.items()
+        }
+    start = hps(serial)
+    serial.next_turn()
+    parallel.next_turn()
+    assert hps(parallel) == hps(serial)
+    pool = parallel._trigger_pool
+    assert pool is not None
+    for eng in (serial, parallel):
+        place = eng.character['physical'].new_place(8)
+        place['hp'] = 9
+        place.rulebook.append('starve')
+    for i in range(3):
+        serial.next_turn()
+        parallel.next_turn()
+        assert hps(parallel) == hps(serial)
+    # the same workers, caught up on what happened since they forked
+    assert parallel._trigger_pool is pool
+    assert any(hps(serial)[name] < hp for (name, hp) in start.items())
+    for eng in (serial, parallel):
+        eng.new_character('other')
+    serial.next_turn()
+    parallel.next_turn()
+    assert hps(parallel) == hps(serial)
+    assert parallel._trigger_pool is not pool
+    procs = [proc for (proc, conn) in parallel._trigger_pool]
+    serial.close()
+    parallel.close()
+    assert not any(proc.is_alive() for proc in procs)
+
+
+def roll_stats(node):
+    node['rolls'] = list(node.engine.dice(3, 6))
+
+
+def test_rule_random_streams():
+    def run(meddle):
+        eng = Engine(':memory:', random_seed=69105, rule_random_streams=True)
+        phys = eng.new_character('physical')
+        for i in range(3):
+            phys.new_place(i)
+        phys.place[0].rule(roll_stats, always=True)
+        phys.place[1].rulebook.append('roll_stats')
+        phys.place[2].rulebook.append('roll_stats')
+        rolls = []
+        for i in range(3):
+            if meddle:
+                # something else uses the randomizer the rules don't
+                eng.roll_die(20)
+            eng.next_turn()
+            rolls.append({name: place['rolls'] for (name, place) in phys.place.items()})
+        eng.close()
+        return rolls
+    rolls = run(False)
+    assert rolls == run(True)
+    # each place, each turn, gets its own numbers
+    assert len({tuple(r) for turn in rolls for r in turn.values()}) > 1
+    eng = Engine(':memory:', random_seed=69105)
+    eng.rando = Random(1)
+    dice = eng.dice(3, 6)
+    eng.rando = Random(2)
+    expected = Random(1)
+    assert list(dice) == [expected.randint(1, 6) for i in range(3)]
+    eng.close()
+
+
+def test_serializers():
+    from LiSE.serialize import serializers, negotiate
+    eng = Engine(':memory:', random_seed=69105)
+    phys = eng.new_character('physical')
+    phys.new_place((0, 0))
+    phys.new_place('there')
+    phys.new_thing('it', (0, 0))
+    msg = {
+        'command': 'things_moved',
+        'character': phys,
+        'places': [phys.place[0, 0], phys.place['there']],
+        'thing': phys.thing['it'],
+        'where': (0, 0),
+        'stats': {'hp': 10, 'mp': 2.5, 'name': 'it', 'nothing': None}
+    }
+    tried = []
+    for name, cls in serializers.items():
+        if not cls.available():
+            continue
+        tried.append(name)
+        serializer = cls(eng)
+        data = serializer.dump(msg)
+        assert isinstance(data, bytes)
+        got = serializer.load(data)
+        assert got['character'] is phys
+        assert got['places'] == msg['places']
+        assert got['thing'] == msg['thing']
+        assert got['where'] == (0, 0)
+        assert isinstance(got['where'], tuple)
+        assert got['stats'] == msg['stats']
+    assert 'pickle' in tried and 'json' in tried
+    assert negotiate(['nonsense', 'pickle', 'json']) == 'pickle'
+    assert negotiate() == tried[0]
+    try:
+        negotiate('nonsense')
+    except ValueError:
+        pass
+    else:
+        assert False, "Negotiated a serializer that doesn't exist"
+    eng.close()
+
+
+def test_command_pipe():
+    import asyncio
+    import pickle
+    from concurrent.futures import ThreadPoolExecutor
+    from multiprocessing import Pipe
+    from threading import Thread
+    from LiSE.proxy import CommandPipe
+
+    class Pickler:
+        dump = staticmethod(pickle.dumps)
+        load = staticmethod(pickle.loads)
+    out_recv, out_send = Pipe(duplex=False)
+    in_recv, in_send = Pipe(duplex=False)
+
+    def engine_process():
+        # wait for every command to be in flight, then answer
+        # them backward
+        cmds = [pickle.loads(out_recv.recv_bytes()) for i in range(5)]
+        cmds.sort(key=lambda cmd: cmd['id'], reverse=True)
+        for cmd in cmds:
+            if cmd['command'] == 'fail':
+                reply = (cmd['id'], 'fail', ['KeyError', cmd['x']])
+            else:
+                reply = (cmd['id'], cmd['command'], 'trunk', 0, 0, cmd['x'] * 2)
+            in_send.send_bytes(pickle.dumps(reply))
+        # hang up on the next one
+        out_recv.recv_bytes()
+        in_send.close()
+    engine_thread = Thread(target=engine_process)
+    engine_thread.start()
+    pipe = CommandPipe(out_send, in_recv, Pickler)
+
+    def double(x):
+        return pipe.submit({'command': 'double', 'x': x}).result()[-1]
+
+    def fail(x):
+        try:
+            pipe.submit({'command': 'fail', 'x': x}).result()
+        except KeyError as ex:
+            return ex.args[0]
+
+    async def doubles():
+        return await asyncio.gather(*(
+            asyncio.wrap_future(pipe.submit({'command': 'double', 'x': x}))
+            for x in (10, 20)
+        ))
+    with ThreadPoolExecutor(4) as pool:
+        doubled = pool.map(double, (1, 2))
+        failed = pool.submit(fail, 'nope')
+        coro = pool.submit(asyncio.run, doubles())
+        assert list(doubled) == [2, 4]
+        assert failed.result() == 'nope'
+        assert [received[-1] for received in coro.result()] == [20, 40]
+    hung_up = pipe.submit({'command': 'double', 'x': 0})
+    try:
+        hung_up.result(timeout=10)
+    except EOFError:
+        pass
+    else:
+        assert False, "Got a result from nobody"
+    engine_thread.join()
+
+
 def test_fast_delta():
     from LiSE.examples.kobold import inittest
     from LiSE.handle import EngineHandle
@@ -386,5 +706,358 @@ def test_fast_delta():
     assert diff2 == slowd2
 
 
+def test_delta_chunks():
+    from copy import deepcopy
+    from LiSE.examples.kobold import inittest
+    eng = Engine(':memory:', random_seed=69105)
+    inittest(eng, shrubberies=20, kobold_sprint_chance=.9)
+    ret, delta = eng.next_turn()
+    expected = deepcopy(delta)
+    units = len(list(eng._delta_units(deepcopy(delta))))
+    assert units > 1
+    chunks = list(eng.delta_chunks(delta, 1))
+    assert len(chunks) == units
+    assert not delta
+    merged = {}
+    for chunk in chunks:
+        eng._merge_delta(merged, chunk)
+    assert merged == {k: v for (k, v) in expected.items() if v}
+    eng.close()
+
+
+def test_turn_delta_rules():
+    eng = Engine(':memory:', random_seed=69105)
+    phys = eng.new_character('physical')
+    place = phys.new_place(0)
+    place['hp'] = 10
+    rule = place.rule(faint)
+    rule.trigger(fainting)
+    eng.next_turn()
+    rule.action(starve)
+    delta = eng.get_turn_delta()
+    assert delta['rules'] == {'faint': {'actions': ['faint', 'starve']}}
+    eng.next_turn()
+    rule.trigger(hungry)
+    delta = eng.get_turn_delta()
+    assert delta['rules'] == {
+        'faint': {'triggers': ['fainting', 'hungry']}
+    }
+    eng.close()
+
+
+def test_snapshot():
+    from LiSE import snapshot
+    if not snapshot.available():
+        return
+    from LiSE.examples.kobold import inittest
+    eng = Engine(':memory:', random_seed=69105)
+    inittest(eng, shrubberies=20, kobold_sprint_chance=.9)
+    other = eng.new_character('other')
+    other.add_places_from(['p', 'q'])
+    other.add_portal('p', 'q', weight=3)
+    name = 'LiSE-test-' + uuid4().hex[:8]
+
+    def plain(reader):
+        ret = {}
+        for charn in reader.characters():
+            char = reader.character(charn)
+            ret[charn] = (
+                dict(char.stat),
+                {node: dict(stats) for (node, stats) in char.node.items()},
+                dict(char.thing),
+                {orig: {dest: dict(stats) for (dest, stats) in dests.items()}
+                 for (orig, dests) in char.portal.items()}
+            )
+        return ret
+
+    def published_whole():
+        writer = snapshot.SnapshotWriter(eng, name + 'w')
+        try:
+            writer.publish()
+            reader = snapshot.WorldSnapshot(name + 'w')
+            try:
+                return plain(reader)
+            finally:
+                reader.close()
+        finally:
+            writer.close()
+    writer = snapshot.SnapshotWriter(eng, name)
+    try:
+        writer.publish()
+        reader = snapshot.WorldSnapshot(name)
+        try:
+            assert reader.btt == eng.btt()
+            phys = reader.character('physical')
+            assert phys.thing['kobold'] == \
+                eng.character['physical'].thing['kobold']['location']
+            before = plain(reader)
+            eng.next_turn()
+            assert not reader.refresh()
+            writer.publish()
+            assert reader.refresh()
+            assert reader.btt == eng.btt()
+            # characters from before the refresh stay as they were
+            assert phys.thing['kobold'] == before['physical'][2]['kobold']
+            other.stat['foo'] = [1]
+            other.portal['p']['q']['weight'] = 9
+            other.new_thing('rock', 'p', heavy=True)
+            writer.publish()
+            eng.next_turn()
+            del other.stat['foo']
+            other.thing['rock'].delete()
+            del other.portal['p']['q']
+            writer.publish()
+            # those were appended to the first segment
+            assert writer._segments == 1
+            assert reader.refresh()
+            assert plain(reader) == published_whole()
+            assert plain(reader)['other'] == ({}, {'p': {}, 'q': {}}, {}, {})
+            eng.turn = 1
+            writer.publish()
+            assert writer._segments == 2
+            assert reader.refresh()
+            assert plain(reader) == published_whole()
+        finally:
+            reader.close()
+    finally:
+        writer.close()
+        eng.close()
+
+
+def test_batch():
+    from LiSE.handle import EngineHandle
+    hand = EngineHandle((':memory:',), {'random_seed': 69105})
+    hand._real.new_character('physical')
+    r = hand.batch([
+        {'command': 'set_character_stat',
+         'kwargs': {'char': 'physical', 'k': 'foo', 'v': 1}},
+        {'command': 'del_character_stat',
+         'kwargs': {'char': 'physical', 'k': 'nope'}},
+        {'command': 'set_character_stat',
+         'kwargs': {'char': 'physical', 'k': 'bar', 'v': 2}}
+    ])
+    assert r['results'] == [None, None, None]
+    assert [err[:2] for err in r['errors']] == [[1, 'KeyError']]
+    assert hand._real.character['physical'].stat['bar'] == 2
+    r = hand.batch([
+        {'command': 'del_character_stat',
+         'kwargs': {'char': 'physical', 'k': 'nope'}},
+        {'command': 'set_character_stat',
+         'kwargs': {'char': 'physical', 'k': 'baz', 'v': 3}}
+    ], stop_on_error=True)
+    assert r['results'] == [None]
+    assert 'baz' not in hand._real.character['physical'].stat
+
+
+def test_web_service():
+    from LiSE.server import LiSEHandleWebService
+
+    def setup(eng):
+        phys = eng.new_character('physical')
+        phys.add_place('here')
+        phys.add_thing('it', 'here')
+    service = LiSEHandleWebService(':memory:', random_seed=69105, setup=setup)
+    submit = service.submit
+    submit({'command': 'set_character_stat', 'char': 'physical', 'k': 'foo', 'v': 1})
+    assert submit({'command': 'get_thing_location', 'char': 'physical', 'thing': 'it'}) == 'here'
+    # now there's a snapshot to read from
+    assert service._snapshot is not None
+    assert submit({'command': 'get_thing_location', 'char': 'physical', 'thing': 'it'}) == 'here'
+    submit({'command': 'set_character_stat', 'char': 'physical', 'k': 'foo', 'v': 2, 'silent': True})
+    assert service._snapshot is None
+    stats = submit({'command': 'character_stat_copy', 'char': 'physical'})
+    assert ['foo', 2] in stats[1:]
+    assert submit({'command': 'get_thing_location', 'char': 'physical', 'thing': 'it'}) == 'here'
+    snap = service._snapshot
+    # reads that change nothing don't cost a new snapshot
+    submit({'command': 'character_stat_copy', 'char': 'physical'})
+    submit({'command': 'get_thing_location', 'char': 'physical', 'thing': 'it'})
+    assert service._snapshot is snap
+    service.shutdown()
+
+
+def test_historical_query():
+    eng = Engine(':memory:', random_seed=69105)
+    phys = eng.new_character('physical')
+    here = phys.new_place('here')
+    phys.add_place('there')
+    it = phys.new_thing('it', 'here')
+    here['hp'] = 1
+    eng.turn = 3
+    here['hp'] = 10
+    eng.turn = 5
+    it['location'] = 'there'
+    eng.turn = 8
+    here['hp'] = 2
+    eng.turn = 12
+    healthy = eng.ticks_when(here.historical('hp') > 4)
+    assert healthy.windows == [(3, 7)]
+    assert list(healthy) == [3, 4, 5, 6, 7]
+    assert list(eng.ticks_when(
+        (here.historical('hp') > 4).between(5, 20))) == [5, 6, 7]
+    there = eng.ticks_when(it.historical('location') == eng.alias('there'))
+    assert there.windows == [(5, None)]
+    assert 4 not in there
+    assert 5 in there
+    assert 50 in there
+    assert 3 in healthy
+    assert 7 in healthy
+    assert 8 not in healthy
+    assert not eng.ticks_when(here.historical('hp') > 100)
+    eng.close()
+
+
+def test_query_composition():
+    eng = Engine(':memory:', random_seed=69105)
+    phys = eng.new_character('physical')
+    a = phys.new_place('a')
+    b = phys.new_place('b')
+    a['hp'] = 1
+    b['hp'] = 0
+    for turn, node, hp in [
+        (3, a, 10), (5, b, 7), (8, a, 2), (12, b, 0), (15, b, 9)
+    ]:
+        eng.turn = turn
+        node['hp'] = hp
+    eng.turn = 20
+    a_up = a.historical('hp') > 4
+    b_up = b.historical('hp') > 4
+    assert eng.ticks_when(a_up & b_up).windows == [(5, 7)]
+    assert eng.ticks_when(a_up | b_up).windows == [(3, 11), (15, None)]
+    assert eng.ticks_when(~a_up).windows == [(0, 2), (8, None)]
+    assert list(eng.ticks_when(a_up & ~b_up)) == [3, 4]
+    assert eng.ticks_when((a_up | b_up).between(6, 13)).windows == [(6, 11)]
+    both_down = eng.ticks_when(~(a_up | b_up))
+    assert 13 in both_down and 4 not in both_down
+    eng.close()
+
+
+def low_hp(hp):
+    return hp < 3
+
+
+def is_there(loc):
+    return loc == 'there'
+
+
+class DiskWorldTest(TestCase):
+    """Tests that close the engine and load the world again from disk"""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'world.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_query_pushdown(self):
+        eng = Engine(self.path, random_seed=69105)
+        phys = eng.new_character('physical')
+        phys.add_place('here')
+        phys.add_place('there')
+        phys.add_thing('it', 'here')
+        for turn in range(1, 30):
+            eng.turn = turn
+            phys.place['here']['hp'] = turn % 10
+            if turn == 12:
+                phys.thing['it']['location'] = 'there'
+        eng.close()
+        eng = Engine(self.path, load_window=5)
+        here = eng.character['physical'].place['here']
+        it = eng.character['physical'].thing['it']
+        high = here.historical('hp') >= 8
+        assert 'SQL on node_val' in high.explain()
+        assert eng.ticks_when(high).windows == [(8, 9), (18, 19), (28, None)]
+        there = it.historical('location') == 'there'
+        assert 'SQL on location' in there.explain()
+        assert eng.ticks_when(there).windows == [(12, None)]
+        assert eng.ticks_when(high & there).windows == [(18, 19), (28, None)]
+        eng.close()
+
+    def test_materialized_view(self):
+        eng = Engine(self.path, random_seed=69105)
+        phys = eng.new_character('physical')
+        phys.add_place('here')
+        phys.add_place('there')
+        phys.add_thing('it', 'here')
+        weak = eng.new_view('weak', 'hp', low_hp)
+        arrived = eng.new_view('arrived', 'location', is_there)
+        changes = []
+
+        def changed(view, **kwargs):
+            changes.append((view.name, kwargs['member'], kwargs['added'], kwargs['turn']))
+        weak.connect(changed)
+        arrived.connect(changed)
+        here = phys.place['here']
+        here['hp'] = 10
+        for turn, hp in [(2, 1), (4, 5), (6, 0)]:
+            eng.turn = turn
+            here['hp'] = hp
+            if turn == 4:
+                phys.thing['it']['location'] = 'there'
+        assert ('physical', 'here') in weak
+        assert weak.members('trunk', 5, 0) == set()
+        assert weak.members('trunk', 6, 1) == {('physical', 'here')}
+        assert arrived.members('trunk', 3, 0) == set()
+        assert set(arrived) == {('physical', 'it')}
+        assert changes == [
+            ('weak', ('physical', 'here'), True, 2),
+            ('weak', ('physical', 'here'), False, 4),
+            ('arrived', ('physical', 'it'), True, 4),
+            ('weak', ('physical', 'here'), True, 6)
+        ]
+        eng.close()
+        eng = Engine(self.path)
+        weak = eng.view['weak']
+        # not worked out until it's used
+        assert not weak._built
+        assert weak.members('trunk', 5, 0) == set()
+        assert len(weak.members('trunk', 6, 1)) == 1
+        assert eng.view['arrived'].members('trunk', 5, 0) == {('physical', 'it')}
+        eng.del_view('arrived')
+        assert 'views' in eng.eternal and 'arrived' not in eng.eternal['views']
+        eng.close()
+
+    def test_contents_index(self):
+        eng = Engine(self.path, random_seed=69105)
+        phys = eng.new_character('physical')
+        here = phys.new_place('here')
+        there = phys.new_place('there')
+        for i in range(5):
+            phys.add_thing(i, 'here')
+        eng.turn = 1
+        phys.thing[0]['location'] = 'there'
+        phys.thing[1]['location'] = 'there'
+        phys.thing[2]['next_location'] = 'there'
+        eng.turn = 2
+        phys.thing[1]['location'] = 'here'
+        phys.thing[4].delete()
+        eng.turn = 3
+        assert set(here.content) == {1, 2, 3}
+        assert len(here.content) == 3
+        assert 4 not in here.content and 0 in there.content
+        assert set(thing.name for thing in there.contents()) == {0}
+        eng.branch = 'other'
+        eng.turn = 4
+        for thing in here.contents():
+            thing['location'] = 'there'
+        assert len(here.content) == 0
+        assert set(there.content) == {0, 1, 2, 3}
+        eng.branch = 'trunk'
+        assert set(here.content) == {1, 2, 3}
+        eng.turn = 1
+        assert set(here.content) == {2, 3, 4}
+        assert set(there.content) == {0, 1}
+        eng.close()
+        eng = Engine(self.path)
+        phys = eng.character['physical']
+        eng.turn = 3
+        eng.branch = 'other'
+        eng.turn = 4
+        assert set(phys.place['there'].content) == {0, 1, 2, 3}
+        eng.branch = 'trunk'
+        eng.turn = 1
+        assert set(phys.place['here'].content) == {2, 3, 4}
+        eng.close()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,179 @@
+# This file is part of LiSE, a framework for life simulation games.
+# Copyright (c) Zachary Spector,  zacharyspector@gmail.com
+"""Materialized views: sets of nodes that have a stat passing some test.
+
+Make one with ``Engine.new_view``. It's worked out from the history in
+the caches the first time it's used, and after that it's kept up to
+date whenever the stat is written, in every branch, so looking at it
+any time costs no more than the number of nodes in it.
+
+"""
+from blinker import Signal
+
+from .cache import EntitylessCache
+
+LOCATION_STATS = ('location', 'next_location')
+"""Stats that are kept in the things cache, rather than with the others"""
+
+
+class View(Signal):
+    """The nodes whose ``stat`` passes a test, at any time.
+
+    Members are ``(character, node)`` pairs. If I have a ``character``,
+    I only look at the nodes in that one. ``test`` is the name of a
+    function in ``engine.function``, which gets the value of the stat
+    and returns whether the node should be in me. Nodes that don't have
+    the stat at all aren't.
+
+    Iterate over me, or use ``in`` or ``len``, to look at the current
+    time; call ``members`` to look at another.
+
+    I'm a ``Signal``. Whenever a node joins or leaves, I send myself,
+    with the keyword arguments ``member``, ``added``, ``branch``,
+    ``turn``, and ``tick``.
+
+    I don't scan the history for my members until something looks at
+    me or connects to me, so an engine with many views starts up no
+    slower for them.
+
+    """
+    def __init__(self, engine, name, stat, test, character=None):
+        super().__init__()
+        self.engine = engine
+        self.name = name
+        self.stat = stat
+        self.test = test
+        self.character = character
+        self._members = EntitylessCache(engine)
+        self._built = False
+
+    @property
+    def source(self):
+        """The cache that my stat is stored in"""
+        if self.stat in LOCATION_STATS:
+            return self.engine._things_cache
+        return self.engine._node_val_cache
+
+    def _member(self, key):
+        """Return the member that ``key`` in my source cache is about, or
+        ``None`` if it's not about my stat.
+
+        """
+        if self.stat in LOCATION_STATS:
+            character, node = key
+        else:
+            character, node, stat = key
+            if stat != self.stat:
+                return None
+        if self.character is not None and character != self.character:
+            return None
+        return character, node
+
+    def _value(self, value):
+        """Return ``True`` if the value from my source cache means
+        membership, or ``None`` if it doesn't.
+
+        """
+        if value is not None and self.stat in LOCATION_STATS:
+            value = value[LOCATION_STATS.index(self.stat)]
+        if value is None:
+            return None
+        return True if getattr(self.engine.function, self.test)(value) else None
+
+    def _build(self):
+        if not self._built:
+            self.rebuild()
+
+    def reset(self):
+        """Forget my members until I'm next used."""
+        self._members.clear()
+        self._built = False
+
+    def rebuild(self):
+        """Work out my members again from all the history in the caches."""
+        self._members.clear()
+        self._built = True
+        rows = []
+        for key, branches in list(self.source.branches.items()):
+            member = self._member(key)
+            if member is None:
+                continue
+            for branch, turns in branches.items():
+                for turn, ticks in turns.items():
+                    for tick, value in ticks.items():
+                        rows.append((member, branch, turn, tick, self._value(value)))
+        self._members.load(rows)
+
+    def stored(self, *args, planning=False):
+        """Note that a value was stored in my source cache.
+
+        The arguments are the same as the cache's ``store``.
+
+        """
+        if not self._built:
+            # it'll be in the cache when I am
+            return
+        member = self._member(args[:-4])
+        if member is None:
+            return
+        branch, turn, tick, value = args[-4:]
+        engine = self.engine
+        members = self._members
+        try:
+            was = members.retrieve(member, branch, turn, tick) is not None
+        except KeyError:
+            was = False
+        now = self._value(value)
+        members.store(
+            member, branch, turn, tick, now,
+            planning=planning, forward=engine.forward or engine._loading
+        )
+        if not engine._loading and was != (now is not None):
+            self.send(
+                self, member=member, added=now is not None,
+                branch=branch, turn=turn, tick=tick
+            )
+
+    def members(self, branch=None, turn=None, tick=None):
+        """Return a set of my members at the given time, by default the
+        current one.
+
+        """
+        b, r, t = self.engine.btt()
+        branch = b if branch is None else branch
+        turn = r if turn is None else turn
+        tick = t if tick is None else tick
+        self._build()
+        exists = self.engine._nodes_cache.contains_entity
+        return {
+            member for member in self._members.iter_keys(branch, turn, tick)
+            if exists(*member, branch, turn, tick)
+        }
+
+    def __iter__(self):
+        return iter(self.members())
+
+    def __len__(self):
+        return len(self.members())
+
+    def connect(self, *args, **kwargs):
+        # I only notice changes once I'm built
+        self._build()
+        return super().connect(*args, **kwargs)
+
+    def __contains__(self, member):
+        self._build()
+        btt = self.engine.btt()
+        try:
+            if self._members.retrieve(member, *btt) is None:
+                return False
+        except KeyError:
+            return False
+        return self.engine._nodes_cache.contains_entity(*member, *btt)
+
+    def __repr__(self):
+        return "<View {} of nodes{} with {} passing {}>".format(
+            self.name,
+            '' if self.character is None else ' in ' + repr(self.character),
+            self.stat, self.test
+        )
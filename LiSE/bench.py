@@ -0,0 +1,83 @@
+"""Compare the performance of the ways the engine proxy can talk to
+the engine.
+
+Run with ``python bench.py``.
+
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+from LiSE.proxy import EngineProcessManager
+from LiSE.serialize import serializers
+
+
+def serializer_bench(turns=10, deltas=10):
+    """Time ``next_turn`` and ``get_slow_delta`` round trips through
+    the engine proxy with each available serializer, on the college
+    example.
+
+    """
+    for name, cls in serializers.items():
+        if not cls.available():
+            print("{}: not available".format(name))
+            continue
+        prefix = tempfile.mkdtemp()
+        manager = EngineProcessManager()
+        engine = manager.start(
+            os.path.join(prefix, 'world.db'), alchemy=False, random_seed=0,
+            serializer=name, install_modules=['LiSE.examples.college'],
+            loglevel='warning'
+        )
+        start = perf_counter()
+        for i in range(turns):
+            engine.next_turn()
+        turned = perf_counter() - start
+        start = perf_counter()
+        for i in range(deltas):
+            engine.handle('get_slow_delta', chars='all', store=False)
+        delta = perf_counter() - start
+        manager.shutdown()
+        shutil.rmtree(prefix)
+        print("{}: next_turn {:.4f}s, get_slow_delta {:.4f}s".format(
+            name, turned / turns, delta / deltas
+        ))
+
+
+def pipeline_bench(queries=100):
+    """Time a batch of stat queries through the engine proxy, first one
+    round trip at a time, then all in flight at once with ``ahandle``.
+
+    """
+    prefix = tempfile.mkdtemp()
+    manager = EngineProcessManager()
+    engine = manager.start(
+        os.path.join(prefix, 'world.db'), alchemy=False, random_seed=0,
+        install_modules=['LiSE.examples.college'], loglevel='warning'
+    )
+    char = next(iter(engine.character))
+    start = perf_counter()
+    for i in range(queries):
+        engine.handle('character_stat_copy', char=char)
+    sequential = perf_counter() - start
+
+    async def batch():
+        await asyncio.gather(*(
+            engine.ahandle('character_stat_copy', char=char)
+            for i in range(queries)
+        ))
+    start = perf_counter()
+    asyncio.get_event_loop().run_until_complete(batch())
+    pipelined = perf_counter() - start
+    manager.shutdown()
+    shutil.rmtree(prefix)
+    print("{} queries: sequential {:.4f}s, pipelined {:.4f}s".format(
+        queries, sequential, pipelined
+    ))
+
+
+if __name__ == '__main__':
+    serializer_bench()
+    pipeline_bench()
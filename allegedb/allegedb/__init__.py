@@ -1,6 +1,6 @@
 # This file is part of allegedb, an object relational mapper for versioned graphs.
 # Copyright (C) Zachary Spector.
-from collections import defaultdict
+from collections import defaultdict, deque
 from functools import partial
 from blinker import Signal
 from .graph import (
@@ -69,6 +69,39 @@ class AdvancingContext(object):
         self.orm.forward = False
 
 
+class ReadTrackingContext(object):
+    """A context manager for finding out what a block of code looks at.
+
+    Start a block of code like:
+
+    with orm.tracking_reads as reads:
+        ...
+
+    and ``reads`` will be a set of everything that was looked up in
+    the caches within that block. Pass it to ``changed_since`` later to
+    find out if any of it has been written to since.
+
+    Only works if the ORM was made with ``track_reads=True``.
+
+    """
+    __slots__ = ['orm', 'reads', 'prev']
+
+    def __init__(self, orm):
+        self.orm = orm
+
+    def __enter__(self):
+        if self.orm._written is None:
+            raise ValueError("Not tracking reads")
+        self.prev = self.orm._reads
+        self.reads = self.orm._reads = set()
+        return self.reads
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.orm._reads = self.prev
+        if self.prev is not None:
+            self.prev.update(self.reads)
+
+
 class TimeSignal(Signal):
     """Acts like a tuple of the time in (branch, turn) for the most part.
 
@@ -151,13 +184,17 @@ class TimeSignalDescriptor:
                     "the branch {}".format(turn_now, branch_now)
                 )
             if not e.planning and (turn_now > turn_end or tick_now > tick_end):
+                e._maybe_snap_keyframe(branch_now, turn_end, turn_now)
                 branches[branch_now] = parent, turn_start, tick_start, turn_now, tick_now
         else:
             branches[branch_now] = (
                 branch_then, turn_now, tick_now, turn_now, tick_now
             )
             e.query.new_branch(branch_now, branch_then, turn_now, tick_now)
+            if e._loaded is not None:
+                e._loaded[branch_now] = (turn_now, None)
         e._obranch, e._oturn = branch, turn = val
+        e._load_at(branch, turn)
 
         if turn > e._turn_end_plan[val]:
             e._turn_end_plan[val] = turn
@@ -225,6 +262,110 @@ def setedgeval(delta, is_multigraph, graph, orig, dest, idx, key, value):
             .setdefault(orig, {}).setdefault(dest, {})[key] = value
 
 
+def matcher(spec):
+    """Return a function telling whether something is in ``spec``, or
+    ``None`` if ``spec`` is ``None``, meaning everything is.
+
+    ``spec`` may already be such a function.
+
+    """
+    if spec is None or callable(spec):
+        return spec
+    return frozenset(spec).__contains__
+
+
+def filtered(pred, updfun):
+    """Return a version of ``updfun`` that ignores changes ``pred`` rejects."""
+    if pred is None:
+        return updfun
+
+    def upd(*change):
+        if pred(*change):
+            updfun(*change)
+    return upd
+
+
+def filtered_changes(pred, changes):
+    """Return the changes that ``pred`` accepts."""
+    if pred is None:
+        return changes
+    return [change for change in changes if pred(*change)]
+
+
+class DeltaFilter(object):
+    """Which parts of the world a delta should describe.
+
+    ``graphs`` and ``stats`` are collections of graph names and keys,
+    or functions that take one and return whether it's wanted.
+    ``nodes`` may be a dictionary of collections of node names keyed
+    by graph, where graphs left out keep all their nodes, or a
+    function taking a graph and a node. Edges are wanted when either
+    of their nodes is. ``None`` means everything.
+
+    Each of the ``for_`` methods returns a function that takes a change
+    as the caches record it, and tells whether it's wanted; or ``None``
+    when all are.
+
+    """
+    def __init__(self, graphs=None, nodes=None, stats=None):
+        self.graph = matcher(graphs)
+        if isinstance(nodes, dict):
+            nodes = {graph: frozenset(ns) for (graph, ns) in nodes.items()}
+
+            def node(graph, n):
+                return graph not in nodes or n in nodes[graph]
+            self.node = node
+        else:
+            self.node = nodes
+        self.stat = matcher(stats)
+
+    def _want(self, graph, node=None, key=None):
+        """Return whether a change to the given entity and key is wanted.
+
+        ``node`` may be a pair of an edge's nodes.
+
+        """
+        if self.graph is not None and not self.graph(graph):
+            return False
+        if node is not None and self.node is not None:
+            if isinstance(node, tuple):
+                orig, dest = node
+                if not (self.node(graph, orig) or self.node(graph, dest)):
+                    return False
+            elif not self.node(graph, node):
+                return False
+        if key is not None and self.stat is not None:
+            return self.stat(key)
+        return True
+
+    def for_graph_val(self):
+        if self.graph is None and self.stat is None:
+            return None
+        return lambda graph, key, val: self._want(graph, key=key)
+
+    def for_nodes(self):
+        if self.graph is None and self.node is None:
+            return None
+        return lambda graph, node, exists: self._want(graph, node)
+
+    def for_node_val(self):
+        if self.graph is None and self.node is None and self.stat is None:
+            return None
+        return lambda graph, node, key, val: self._want(graph, node, key)
+
+    def for_edges(self):
+        if self.graph is None and self.node is None:
+            return None
+        return lambda graph, orig, dest, idx, exists: self._want(
+            graph, (orig, dest))
+
+    def for_edge_val(self):
+        if self.graph is None and self.node is None and self.stat is None:
+            return None
+        return lambda graph, orig, dest, idx, key, val: self._want(
+            graph, (orig, dest), key)
+
+
 def update_window(turn_from, tick_from, turn_to, tick_to, updfun, branchd):
     if branchd.has_exact_rev(turn_from):
         # Not including the exact tick you started from because deltas are *changes*
@@ -248,10 +389,79 @@ def update_backward_window(turn_from, tick_from, turn_to, tick_to, updfun, branc
             for future_state in reversed(branchd[midturn][:]):
                 updfun(*future_state)
     if branchd.has_exact_rev(turn_to):
-        for future_state in reversed(branchd[turn_to][tick_to:]):
+        # the state at tick_to already has the change made then
+        for future_state in reversed(branchd[turn_to][tick_to+1:]):
             updfun(*future_state)
 
 
+def merge_delta(into, more, depth):
+    """Update the nested dictionary ``into`` with ``more``, going
+    ``depth`` levels deep before values are simply replaced.
+
+    """
+    if depth <= 1:
+        into.update(more)
+        return
+    for k, v in more.items():
+        if isinstance(into.get(k), dict) and isinstance(v, dict):
+            merge_delta(into[k], v, depth - 1)
+        else:
+            into[k] = v
+
+
+def delta_leaves(prefix, d, depth):
+    """Iterate over ``(path, value)`` for everything in the nested
+    dictionary ``d``, no more than ``depth`` levels deep, with each path
+    starting with the tuple ``prefix``.
+
+    """
+    for k, v in d.items():
+        if depth <= 1 or not isinstance(v, dict):
+            yield prefix + (k,), v
+        else:
+            yield from delta_leaves(prefix + (k,), v, depth - 1)
+
+
+def widen_window(window, branch, turn_from, turn_to):
+    """Make the range of turns for ``branch`` in ``window`` cover
+    ``turn_from`` through ``turn_to``.
+
+    ``window`` is a dictionary of ``(turn_from, turn_to)`` pairs, keyed
+    by branch, where ``turn_to`` may be ``None`` to mean the end of it.
+
+    """
+    if branch in window:
+        was_from, was_to = window[branch]
+        turn_from = min((was_from, turn_from))
+        turn_to = None if None in (was_to, turn_to) else max((was_to, turn_to))
+    window[branch] = (turn_from, turn_to)
+
+
+class PlanEndDict(defaultdict):
+    """The last tick planned in each ``(branch, turn)``, zero if none.
+
+    Also keeps the last turn with any plan in each branch, in
+    ``branch_end``, so that finding it doesn't mean looking through
+    every turn there is.
+
+    """
+    def __init__(self):
+        super().__init__(lambda: 0)
+        self.branch_end = {}
+
+    def __setitem__(self, key, value):
+        branch, turn = key
+        branch_end = self.branch_end
+        if branch not in branch_end or turn > branch_end[branch]:
+            branch_end[branch] = turn
+        super().__setitem__(key, value)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
 class ORM(object):
     """Instantiate this with the same string argument you'd use for a
     SQLAlchemy ``create_engine`` call. This will be your interface to
@@ -263,6 +473,10 @@ class ORM(object):
     query_engine_cls = QueryEngine
     illegal_graph_names = ['global']
     illegal_node_names = ['nodes', 'node_val', 'edges', 'edge_val']
+    # how deeply nested the special keys of a graph's delta are
+    _graph_delta_depths = {'nodes': 1, 'node_val': 2, 'edges': 2, 'edge_val': 3}
+    # top-level keys of deltas that aren't graphs, and how deeply nested they are
+    _special_delta_depths = {}
     time = TimeSignalDescriptor()
 
     @property
@@ -275,7 +489,27 @@ class ORM(object):
         return AdvancingContext(self)
     advancing.__doc__ = AdvancingContext.__doc__
 
-    def get_delta(self, branch, turn_from, tick_from, turn_to, tick_to):
+    @property
+    def tracking_reads(self):
+        return ReadTrackingContext(self)
+    tracking_reads.__doc__ = ReadTrackingContext.__doc__
+
+    @property
+    def write_serial(self):
+        """A number that goes up whenever anything is written to the caches."""
+        return self._write_serial
+
+    def changed_since(self, reads, serial):
+        """Return whether anything in ``reads`` was written to after ``serial``.
+
+        ``reads`` is a set from ``tracking_reads``, and ``serial`` is
+        a past ``write_serial``.
+
+        """
+        written = self._written
+        return any(written.get(read, 0) > serial for read in reads)
+
+    def get_delta(self, branch, turn_from, tick_from, turn_to, tick_to, delta_filter=None):
         """Get a dictionary describing changes to all graphs.
 
         The keys are graph names. Their values are dictionaries of the graphs'
@@ -284,9 +518,12 @@ class ORM(object):
         to node and edge attributes, and 'nodes' and 'edges' full of booleans
         indicating whether a node or edge exists.
 
+        With a :class:`DeltaFilter`, changes it doesn't want are skipped.
+
         """
         if turn_from == turn_to:
-            return self.get_turn_delta(branch, turn_from, tick_from, tick_to)
+            return self.get_turn_delta(branch, turn_from, tick_from, tick_to, delta_filter)
+        filt = delta_filter or DeltaFilter()
         delta = {}
         graph_objs = self._graph_objs
         if turn_to < turn_from:
@@ -302,26 +539,32 @@ class ORM(object):
             nbranches = self._nodes_cache.settings
             nvbranches = self._node_val_cache.settings
             ebranches = self._edges_cache.settings
-            evbranches = self._edges_cache.settings
+            evbranches = self._edge_val_cache.settings
 
         if branch in gvbranches:
-            updater(partial(setgraphval, delta), gvbranches[branch])
+            updater(filtered(filt.for_graph_val(), partial(setgraphval, delta)), gvbranches[branch])
 
         if branch in nbranches:
-            updater(partial(setnode, delta), nbranches[branch])
+            updater(filtered(filt.for_nodes(), partial(setnode, delta)), nbranches[branch])
 
         if branch in nvbranches:
-            updater(partial(setnodeval, delta), nvbranches[branch])
+            updater(filtered(filt.for_node_val(), partial(setnodeval, delta)), nvbranches[branch])
 
         if branch in ebranches:
-            updater(partial(setedge, delta, lambda g: graph_objs[g].is_multigraph()), ebranches[branch])
+            updater(filtered(
+                filt.for_edges(),
+                partial(setedge, delta, lambda g: graph_objs[g].is_multigraph())
+            ), ebranches[branch])
 
         if branch in evbranches:
-            updater(partial(setedgeval, delta, lambda g: graph_objs[g].is_multigraph()), evbranches[branch])
+            updater(filtered(
+                filt.for_edge_val(),
+                partial(setedgeval, delta, lambda g: graph_objs[g].is_multigraph())
+            ), evbranches[branch])
 
         return delta
 
-    def get_turn_delta(self, branch=None, turn=None, tick_from=0, tick_to=None):
+    def get_turn_delta(self, branch=None, turn=None, tick_from=0, tick_to=None, delta_filter=None):
         """Get a dictionary describing changes made on a given turn.
 
         If ``tick_to`` is not supplied, report all changes after ``tick_from``
@@ -333,10 +576,13 @@ class ORM(object):
         to node and edge attributes, and 'nodes' and 'edges' full of booleans
         indicating whether a node or edge exists.
 
+        With a :class:`DeltaFilter`, changes it doesn't want are skipped.
+
         """
         branch = branch or self.branch
-        turn = turn or self.turn
-        tick_to = tick_to or self.tick
+        turn = self.turn if turn is None else turn
+        tick_to = self.tick if tick_to is None else tick_to
+        filt = delta_filter or DeltaFilter()
         delta = {}
         if tick_from < tick_to:
             gvbranches = self._graph_val_cache.settings
@@ -344,6 +590,9 @@ class ORM(object):
             nvbranches = self._node_val_cache.settings
             ebranches = self._edges_cache.settings
             evbranches = self._edge_val_cache.settings
+
+            def window(branchd):
+                return branchd[turn][tick_from:tick_to]
         else:
             gvbranches = self._graph_val_cache.presettings
             nbranches = self._nodes_cache.presettings
@@ -351,19 +600,25 @@ class ORM(object):
             ebranches = self._edges_cache.presettings
             evbranches = self._edge_val_cache.presettings
 
+            def window(branchd):
+                return [
+                    change for (tick, change) in reversed(list(branchd[turn].items()))
+                    if tick_to < tick <= tick_from
+                ]
+
         if branch in gvbranches and gvbranches[branch].has_exact_rev(turn):
-            for graph, key, value in gvbranches[branch][turn][tick_from:tick_to]:
+            for graph, key, value in filtered_changes(filt.for_graph_val(), window(gvbranches[branch])):
                 if graph in delta:
                     delta[graph][key] = value
                 else:
                     delta[graph] = {key: value}
 
         if branch in nbranches and nbranches[branch].has_exact_rev(turn):
-            for graph, node, exists in nbranches[branch][turn][tick_from:tick_to]:
+            for graph, node, exists in filtered_changes(filt.for_nodes(), window(nbranches[branch])):
                 delta.setdefault(graph, {}).setdefault('nodes', {})[node] = bool(exists)
 
         if branch in nvbranches and nvbranches[branch].has_exact_rev(turn):
-            for graph, node, key, value in nvbranches[branch][turn][tick_from:tick_to]:
+            for graph, node, key, value in filtered_changes(filt.for_node_val(), window(nvbranches[branch])):
                 if (
                     graph in delta and 'nodes' in delta[graph] and
                     node in delta[graph]['nodes'] and not delta[graph]['nodes'][node]
@@ -377,7 +632,7 @@ class ORM(object):
 
         graph_objs = self._graph_objs
         if branch in ebranches and ebranches[branch].has_exact_rev(turn):
-            for graph, orig, dest, idx, exists in ebranches[branch][turn][tick_from:tick_to]:
+            for graph, orig, dest, idx, exists in filtered_changes(filt.for_edges(), window(ebranches[branch])):
                 if graph_objs[graph].is_multigraph():
                     if (
                         graph in delta and 'edges' in delta[graph] and
@@ -399,7 +654,7 @@ class ORM(object):
                         .setdefault(orig, {})[dest] = bool(exists)
 
         if branch in evbranches and evbranches[branch].has_exact_rev(turn):
-            for graph, orig, dest, idx, key, value in evbranches[branch][turn][tick_from:tick_to]:
+            for graph, orig, dest, idx, key, value in filtered_changes(filt.for_edge_val(), window(evbranches[branch])):
                 edgevd = delta.setdefault(graph, {}).setdefault('edge_val', {})\
                     .setdefault(orig, {}).setdefault(dest, {})
                 if graph_objs[graph].is_multigraph():
@@ -412,6 +667,79 @@ class ORM(object):
 
         return delta
 
+    def _merge_delta(self, delta, more):
+        """Update ``delta`` with the later changes in ``more``, in place."""
+        graph_objs = self._graph_objs
+        for k, v in more.items():
+            if k in self._special_delta_depths:
+                merge_delta(delta.setdefault(k, {}), v, self._special_delta_depths[k])
+                continue
+            multi = k in graph_objs and graph_objs[k].is_multigraph()
+            graphd = delta.setdefault(k, {})
+            for key, val in v.items():
+                if key in self._graph_delta_depths:
+                    depth = self._graph_delta_depths[key]
+                    if multi and key in ('edges', 'edge_val'):
+                        depth += 1
+                    merge_delta(graphd.setdefault(key, {}), val, depth)
+                else:
+                    graphd[key] = val
+
+    def _branch_lineage(self, branch, turn, tick):
+        """Return a list of ``(branch, turn, tick)`` starting with the arguments,
+        then each ancestor of ``branch`` at the time its child forked from it.
+
+        """
+        lineage = [(branch, turn, tick)]
+        while branch in self._branches:
+            branch, turn, tick = self._branches[branch][:3]
+            if branch is None:
+                break
+            lineage.append((branch, turn, tick))
+        return lineage
+
+    def get_branch_delta(
+            self, branch_from, turn_from, tick_from, branch_to, turn_to, tick_to, delta_filter=None
+    ):
+        """Get a dictionary describing changes between two times, possibly in
+        different branches.
+
+        Rewinds ``branch_from`` back to where it shares history with
+        ``branch_to``, then plays ``branch_to`` forward, using only the
+        changes recorded in each branch. The format and ``delta_filter``
+        are the same as for ``get_delta``.
+
+        """
+        if branch_from == branch_to:
+            return self.get_delta(branch_to, turn_from, tick_from, turn_to, tick_to, delta_filter)
+        lineage_from = self._branch_lineage(branch_from, turn_from, tick_from)
+        lineage_to = self._branch_lineage(branch_to, turn_to, tick_to)
+        branches_to = [b for (b, r, t) in lineage_to]
+        for i, (common, _, _) in enumerate(lineage_from):
+            if common in branches_to:
+                break
+        else:
+            raise ValueError("{} and {} have no common ancestor".format(branch_from, branch_to))
+        j = branches_to.index(common)
+        # with load_window, the history back to the fork needs to be loaded
+        if self._loaded is not None:
+            ranges = {}
+            for lineage, k in ((lineage_from, i), (lineage_to, j)):
+                for (b, r, t), (_, fork_r, fork_t) in zip(lineage[:k], lineage[1:k+1]):
+                    widen_window(ranges, b, fork_r, r)
+            widen_window(ranges, common, *sorted((lineage_from[i][1], lineage_to[j][1])))
+            self._load_ranges(ranges)
+        delta = {}
+        for (b, r, t), (_, fork_r, fork_t) in zip(lineage_from[:i], lineage_from[1:i+1]):
+            self._merge_delta(delta, self.get_delta(b, r, t, fork_r, fork_t, delta_filter))
+        self._merge_delta(delta, self.get_delta(
+            common, *(lineage_from[i][1:] + lineage_to[j][1:]), delta_filter=delta_filter))
+        for k in range(j - 1, -1, -1):
+            b, r, t = lineage_to[k]
+            _, fork_r, fork_t = lineage_to[k+1]
+            self._merge_delta(delta, self.get_delta(b, fork_r, fork_t, r, t, delta_filter))
+        return delta
+
     def _init_caches(self):
         self._global_cache = self.query._global_cache = {}
         self._node_objs = {}
@@ -428,13 +756,15 @@ class ORM(object):
         self._childbranch = defaultdict(set)
         self._branches = {}
         self._turn_end = defaultdict(lambda: 0)
-        self._turn_end_plan = defaultdict(lambda: 0)
+        self._turn_end_plan = PlanEndDict()
         self._graph_val_cache = Cache(self)
         self._nodes_cache = NodesCache(self)
         self._edges_cache = EdgesCache(self)
         self._node_val_cache = Cache(self)
         self._edge_val_cache = Cache(self)
         self._graph_objs = {}
+        self._graph_mappings = {}
+        """Mappings for the stats, nodes, and edges of my graphs, keyed by kind and graph name"""
 
     def _load_graphs(self):
         for (graph, typ) in self.query.graphs_types():
@@ -450,19 +780,64 @@ class ORM(object):
             dbstring,
             alchemy=True,
             connect_args={},
-            validate=False
+            validate=False,
+            memo_size=None,
+            load_window=None,
+            keyframe_interval=None,
+            turn_granular=(),
+            track_reads=False
     ):
         """Make a SQLAlchemy engine if possible, else a sqlite3 connection. In
         either case, begin a transaction.
 
+        With ``memo_size``, each cache will remember no more than that
+        many of the values it's looked up. Check ``memo_stats()`` to see
+        how well that's working.
+
+        With ``load_window``, don't load all of history at startup, only
+        that many turns before the present, and whatever values were
+        current at the start of them. Load more when you look further back.
+
+        With ``keyframe_interval``, every that many turns, record the
+        current state of each branch, so that loading a window of its
+        history can start there instead of searching all of the turns
+        before.
+
+        Stats whose keys are in ``turn_granular`` only have their
+        value at the end of each turn saved to the database. Their
+        history within a turn is forgotten when you reload.
+
+        With ``track_reads=True``, keep track of when each part of each
+        cache was last written, so that ``tracking_reads`` and
+        ``changed_since`` can tell if what some code looked at has changed.
+
         """
         self.planning = False
+        self.memo_size = memo_size
+        self.load_window = load_window
+        self._loaded = None if load_window is None else {}
+        """Ranges of turns loaded into the caches, keyed by branch"""
+        self._loading = False
+        self.keyframe_interval = keyframe_interval
+        self._reads = None
+        """What's been looked up in the caches, while ``tracking_reads``"""
+        self._written = {} if track_reads else None
+        """The ``write_serial`` of the latest write to each part of each cache"""
+        self._write_serial = 0
+        self._journal = None
+        """Every ``store`` to a cache, as ``(cache, args, planning, forward)``,
+        while someone's keeping a list. Anything that changes the caches
+        some other way sets it back to ``None``.
+
+        """
         self.forward = False
         if not hasattr(self, 'query'):
             self.query = self.query_engine_cls(
                 dbstring, connect_args, alchemy,
                 getattr(self, 'json_dump', None), getattr(self, 'json_load', None)
             )
+        if turn_granular:
+            self.query.turn_granular = frozenset(turn_granular)
         self.query.initdb()
         # in case this is the first startup
         self._otick = self._oturn = 0
@@ -476,24 +851,27 @@ class ORM(object):
         if 'trunk' not in self._branches:
             self._branches['trunk'] = None, 0, 0, 0, 0
         self._load_graphs()
-        self._init_load(validate=validate)
+        if self._loaded is None:
+            self._init_load(validate=validate)
+        else:
+            self._load_at(self._obranch, self._oturn)
 
-    def _init_load(self, validate=False):
+    def _init_load(self, validate=False, window=None):
         noderows = [
             (graph, node, branch, turn, tick, ex if ex else None)
             for (graph, node, branch, turn, tick, ex)
-            in self.query.nodes_dump()
+            in self.query.nodes_dump(window)
         ]
         self._nodes_cache.load(noderows, validate=validate)
         edgerows = [
             (graph, orig, dest, idx, branch, turn, tick, ex if ex else None)
             for (graph, orig, dest, idx, branch, turn, tick, ex)
-            in self.query.edges_dump()
+            in self.query.edges_dump(window)
         ]
         self._edges_cache.load(edgerows, validate=validate)
-        self._graph_val_cache.load(self.query.graph_val_dump(), validate=validate)
-        self._node_val_cache.load(self.query.node_val_dump(), validate=validate)
-        self._edge_val_cache.load(self.query.edge_val_dump(), validate=validate)
+        self._graph_val_cache.load(self.query.graph_val_dump(window), validate=validate)
+        self._node_val_cache.load(self.query.node_val_dump(window), validate=validate)
+        self._edge_val_cache.load(self.query.edge_val_dump(window), validate=validate)
         if not hasattr(self, 'graph'):
             self.graph = self._graph_objs
         for graph, node, branch, turn, tick, ex in noderows:
@@ -501,6 +879,217 @@ class ORM(object):
         for graph, orig, dest, idx, branch, turn, tick, ex in edgerows:
             self._edge_objs[(graph, orig, dest, idx)] = self._make_edge(self.graph[graph], orig, dest, idx)
 
+    def _reset_caches(self):
+        for cache in (
+                self._graph_val_cache, self._nodes_cache, self._edges_cache,
+                self._node_val_cache, self._edge_val_cache
+        ):
+            cache.clear()
+        self._journal = None
+
+    def _branch_end(self, branch):
+        """Return the last turn of ``branch``, including any plans."""
+        return max((
+            self._branches[branch][3] if branch in self._branches else 0,
+            self._turn_end_plan.branch_end.get(branch, 0)
+        ))
+
+    def _window_for(self, *times):
+        """Return the ranges of turns to load to look at all the given
+        ``(branch, turn)`` times.
+
+        They're in a dictionary of ``(turn_from, turn_to)`` pairs, keyed
+        by branch. ``turn_to`` is ``None`` when the range reaches the end
+        of the branch, meaning its whole future.
+
+        """
+        window = {}
+        for (branch, turn) in times:
+            turn_from = turn - self.load_window
+            turn_to = turn + self.load_window
+            if turn_to >= self._branch_end(branch):
+                turn_to = None
+            widen_window(window, branch, turn_from, turn_to)
+            for (b, r, t) in self._iter_parent_btt(branch, turn, 0):
+                if b is None:
+                    break
+                if b != branch:
+                    widen_window(window, b, min((turn_from, r)), r)
+        return window
+
+    def _is_loaded(self, branch, turn_from, turn_to=None):
+        """Return whether the caches have the history of ``branch`` from
+        ``turn_from`` to ``turn_to``, by default just the one turn.
+
+        """
+        loaded = self._loaded
+        if loaded is None:
+            return True
+        if branch not in loaded:
+            return False
+        if turn_to is None:
+            turn_to = turn_from
+        was_from, was_to = loaded[branch]
+        return was_from <= turn_from and (was_to is None or turn_to <= was_to)
+
+    def _load_at(self, branch, turn):
+        """Make sure the caches have the history they need to look at this time.
+
+        Only does anything with ``load_window``. Moving forward through
+        history, a little past what's loaded, just loads the next
+        stretch of it. Otherwise, the caches are reset, and loaded with
+        only the window around the time you want, so they never hold
+        much more than ``load_window`` turns on either side of it.
+
+        Return whether it loaded anything.
+
+        """
+        loaded = self._loaded
+        if loaded is None or self._loading or self._is_loaded(branch, turn):
+            return False
+        window = self._window_for((branch, turn))
+        if branch in loaded:
+            turn_from, turn_to = loaded[branch]
+            if (
+                    turn_to is not None and turn_to < turn <= turn_to + self.load_window
+                    and turn_from >= turn - 3 * self.load_window
+            ):
+                new_to = window[branch][1]
+                loaded[branch] = (turn_from, new_to)
+                self._load_window({branch: (turn_to + 1, new_to)}, snapshot=False)
+                return True
+        loaded.clear()
+        loaded.update(window)
+        self._load_window(window)
+        return True
+
+    def _load_ranges(self, ranges):
+        """Make sure the caches have the history of each branch in
+        ``ranges``, a dictionary of ``(turn_from, turn_to)`` pairs.
+
+        Like ``_load_at``, but for a span of time that might be longer
+        than ``load_window``. Return whether it loaded anything.
+
+        """
+        loaded = self._loaded
+        if loaded is None or self._loading or all(
+            self._is_loaded(b, turn_from, turn_to)
+            for b, (turn_from, turn_to) in ranges.items()
+        ):
+            return False
+        window = self._window_for(*(
+            (b, turn_from) for b, (turn_from, turn_to) in ranges.items()
+        ))
+        for b, (turn_from, turn_to) in ranges.items():
+            widen_window(window, b, turn_from, turn_to)
+        loaded.clear()
+        loaded.update(window)
+        self._load_window(window)
+        return True
+
+    def _load_window(self, window, snapshot=True):
+        """Load the history in ``window``, from ``_window_for``, into the caches.
+
+        With ``snapshot``, reset the caches first, and load what was
+        current at the start of each range too. Without, the history
+        before each range must already be loaded.
+
+        """
+        stretches = []
+        for b, (turn_from, turn_to) in window.items():
+            if turn_to is None:
+                turn_to = self._branch_end(b)
+            stretches.append((b, turn_from, turn_to, snapshot))
+        self.query.flush()
+        if snapshot:
+            self._reset_caches()
+        self._journal = None
+        self._loading = True
+        try:
+            self._init_load(window=stretches)
+        finally:
+            self._loading = False
+
+    def export_history(self, path, window=None, snapshot=True, format=None):
+        """Write my history to ``path`` in columns.
+
+        See :func:`allegedb.columnar.export_history`. Return the format used.
+
+        """
+        from .columnar import export_history
+        return export_history(self.query, path, window, snapshot, format)
+
+    def import_history(self, path):
+        """Add the history that ``export_history`` wrote to ``path``.
+
+        It goes straight into the database. If I have no history in my
+        caches yet, and no ``load_window``, the caches are then built
+        from the imported columns, a whole turn of each key at a time,
+        without replaying any writes. Otherwise they're reset and
+        loaded from the database again, a row at a time, the same as
+        when I start up.
+
+        """
+        from .columnar import import_history, cache_turns, to_rows
+        tables = import_history(self.query, path)
+        if 'branches' in tables:
+            for (branch, parent, parent_turn, parent_tick, end_turn, end_tick) in to_rows('branches', tables['branches']):
+                self._branches[branch] = (parent, parent_turn, parent_tick, end_turn, end_tick)
+                if parent is not None:
+                    self._childbranch[parent].add(branch)
+        if 'turns' in tables:
+            for (branch, turn, end_tick, plan_end_tick) in to_rows('turns', tables['turns']):
+                self._turn_end[branch, turn] = end_tick
+                self._turn_end_plan[branch, turn] = plan_end_tick
+        graph_objs = self._graph_objs
+        old_graphs = dict(graph_objs)
+        self._load_graphs()
+        # keep the graph objects people might already have
+        graph_objs.update(old_graphs)
+        caches = {
+            'nodes': self._nodes_cache,
+            'edges': self._edges_cache,
+            'graph_val': self._graph_val_cache,
+            'node_val': self._node_val_cache,
+            'edge_val': self._edge_val_cache
+        }
+        if self._loaded is None and not any(
+                any(cache.settings.values()) for cache in caches.values()
+        ):
+            branch_rank = {}
+            branch2do = deque(['trunk'])
+            while branch2do:
+                branch = branch2do.popleft()
+                branch_rank[branch] = len(branch_rank)
+                branch2do.extend(self._childbranch.get(branch, ()))
+            for table, cache in caches.items():
+                if table in tables:
+                    cache.load_turns(cache_turns(
+                        table, tables[table], self.query.json_load, branch_rank))
+            return
+        self._reset_caches()
+        if self._loaded is None:
+            self._init_load()
+        else:
+            self._loaded = {}
+            self._load_at(self.branch, self.turn)
+
+    def _maybe_snap_keyframe(self, branch, turn_end, turn):
+        """Make a keyframe if extending the branch from ``turn_end`` to ``turn`` passes a multiple of ``keyframe_interval``."""
+        interval = self.keyframe_interval
+        if interval and turn // interval > turn_end // interval:
+            self.query.snap_keyframe(branch, turn)
+
+    def memo_stats(self):
+        """Return the hits, misses, evictions, and size of all my caches' memos, summed."""
+        ret = dict.fromkeys(('hits', 'misses', 'evictions', 'size'), 0)
+        for cache in vars(self).values():
+            if isinstance(cache, Cache):
+                for memo in (cache.shallowest, cache.shallower):
+                    for k, v in memo.stats().items():
+                        ret[k] += v
+        return ret
+
     def __enter__(self):
         """Enable the use of the ``with`` keyword"""
         return self
@@ -536,6 +1125,9 @@ class ORM(object):
             # assumes the present turn in the parent branch has
             # been finalized.
             self.query.new_branch(v, curbranch, curturn, curtick)
+            self._journal = None
+            if self._loaded is not None:
+                self._loaded[v] = (curturn, None)
             if not self.planning:
                 self._branches[v] = curbranch, curturn, curtick, curturn, curtick
         # make sure I'll end up within the revision range of the
@@ -555,6 +1147,7 @@ class ORM(object):
             else:
                 self._branches[v] = (curbranch, curturn, curtick, curturn, curtick)
         self._obranch = v
+        self._load_at(v, curturn)
     branch = property(lambda self: self._obranch, _set_branch)  # easier to override this way
 
     def _set_turn(self, v):
@@ -577,9 +1170,11 @@ class ORM(object):
                     "the branch {}".format(v, branch)
                 )
         if not self.planning and v > turn_end:
+            self._maybe_snap_keyframe(branch, turn_end, v)
             self._branches[branch] = parent, turn_start, tick_start, v, tick
         self._otick = tick
         self._oturn = v
+        self._load_at(branch, v)
     turn = property(lambda self: self._oturn, _set_turn)  # easier to override this way
 
     def _set_tick(self, v):
@@ -674,6 +1269,7 @@ class ORM(object):
         if name in self.illegal_graph_names:
             raise GraphNameError("Illegal name")
         self.query.new_graph(name, type_s)
+        self._journal = None
 
     def new_graph(self, name, data=None, **attr):
         """Return a new instance of type Graph, initialized with the given
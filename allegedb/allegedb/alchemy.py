@@ -14,6 +14,7 @@ from sqlalchemy import (
     ForeignKey,
     select,
     func,
+    exists,
 )
 
 
@@ -136,6 +137,14 @@ def tables_for_meta(meta):
             ['edges.graph', 'edges.orig', 'edges.dest', 'edges.idx']
         )
     )
+    Table(
+        'keyframes', meta,
+        Column('tbl', TEXT, primary_key=True),
+        Column('branch', TEXT, ForeignKey('branches.branch'),
+               primary_key=True, default='trunk'),
+        Column('turn', INT, primary_key=True, default=0),
+        Column('rows', TEXT)
+    )
     return meta.tables
 
 
@@ -260,6 +269,16 @@ def queries_for_table_dict(table):
             end_turn=bindparam('end_turn'),
             end_tick=bindparam('end_tick')
         ).where(table['branches'].c.branch == bindparam('branch')),
+        'keyframe_before': select([func.MAX(table['keyframes'].c.turn)]).where(and_(
+            table['keyframes'].c.tbl == bindparam('tbl'),
+            table['keyframes'].c.branch == bindparam('branch'),
+            table['keyframes'].c.turn <= bindparam('turn')
+        )),
+        'keyframe_rows': select([table['keyframes'].c.rows]).where(and_(
+            table['keyframes'].c.tbl == bindparam('tbl'),
+            table['keyframes'].c.branch == bindparam('branch'),
+            table['keyframes'].c.turn == bindparam('turn')
+        )),
         'update_turns': table['turns'].update().values(
             end_tick=bindparam('end_tick'),
             plan_end_tick=bindparam('plan_end_tick')
@@ -272,6 +291,35 @@ def queries_for_table_dict(table):
         r[t.name + '_dump'] = select(list(t.c.values())).order_by(*t.primary_key)
         r[t.name + '_insert'] = t.insert().values(tuple(bindparam(cname) for cname in t.c.keys()))
         r[t.name + '_count'] = select([func.COUNT()]).select_from(t)
+        if not {'branch', 'turn', 'tick'}.issubset(t.c.keys()):
+            continue
+        r[t.name + '_window'] = select(list(t.c.values())).where(and_(
+            t.c.branch == bindparam('branch'),
+            t.c.turn >= bindparam('turn_from'),
+            t.c.turn <= bindparam('turn_to')
+        )).order_by(*t.primary_key)
+        if not {'branch', 'turn', 'tick'}.issubset(c.name for c in t.primary_key):
+            continue
+        # the latest row for each key, before the given turn
+        later = t.alias('later')
+        r[t.name + '_snapshot'] = select(list(t.c.values())).where(and_(
+            t.c.branch == bindparam('branch'),
+            t.c.turn < bindparam('turn'),
+            ~exists().where(and_(*[
+                later.c[c.name] == c for c in t.primary_key
+                if c.name not in ('branch', 'turn', 'tick')
+            ] + [
+                later.c.branch == t.c.branch,
+                later.c.turn < bindparam('turn'),
+                or_(
+                    later.c.turn > t.c.turn,
+                    and_(
+                        later.c.turn == t.c.turn,
+                        later.c.tick > t.c.tick
+                    )
+                )
+            ]))
+        )).order_by(*t.primary_key)
     return r
 
 
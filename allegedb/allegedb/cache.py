@@ -7,8 +7,10 @@ methods. But if you need to store historical data some other way,
 you might want to store it in a ``WindowDict``.
 
 """
+from array import array
+from bisect import bisect_left, bisect_right
 from operator import itemgetter
-from collections import defaultdict, deque, Mapping, MutableMapping, KeysView, ItemsView, ValuesView
+from collections import defaultdict, deque, OrderedDict, Mapping, MutableMapping, KeysView, ItemsView, ValuesView
 
 
 class HistoryError(KeyError):
@@ -473,27 +475,314 @@ class WindowDict(MutableMapping):
         return "{}({})".format(self.__class__.__name__, ret)
 
 
-class FuturistWindowDict(WindowDict):
-    """A WindowDict that does not let you rewrite the past."""
+def bisect_slice_bounds(revs, start, stop):
+    """Return the indices of ``revs`` that fall between ``start`` and ``stop``, inclusive.
 
-    def __setitem__(self, rev, v):
-        if not self._past and not self._future:
-            self._past.append((rev, v))
+    Either bound may be ``None``, meaning unbounded on that side.
+
+    """
+    if None not in (start, stop) and start > stop:
+        start, stop = stop, start
+    lo = 0 if start is None else bisect_left(revs, start)
+    hi = len(revs) if stop is None else bisect_right(revs, stop)
+    return lo, hi
+
+
+class BisectWindowDictKeysView(KeysView):
+    """Look through all the keys a BisectWindowDict contains."""
+    def __contains__(self, rev):
+        revs = self._mapping._revs
+        i = bisect_left(revs, rev)
+        return i < len(revs) and revs[i] == rev
+
+    def __iter__(self):
+        return iter(self._mapping._revs)
+
+
+class BisectWindowDictItemsView(ItemsView):
+    """Look through everything a BisectWindowDict contains."""
+    def __contains__(self, item):
+        (rev, v) = item
+        revs = self._mapping._revs
+        i = bisect_left(revs, rev)
+        return i < len(revs) and revs[i] == rev \
+            and self._mapping._vals[i] == v
+
+    def __iter__(self):
+        return zip(self._mapping._revs, self._mapping._vals)
+
+
+class BisectWindowDictValuesView(ValuesView):
+    """Look through all the values that a BisectWindowDict contains."""
+    def __contains__(self, value):
+        return value in self._mapping._vals
+
+    def __iter__(self):
+        return iter(self._mapping._vals)
+
+
+class BisectWindowDictPastView(Mapping):
+    """The revisions up to a BisectWindowDict's cursor, latest first."""
+    __slots__ = ['dict', 'stop']
+
+    def __init__(self, dic):
+        self.dict = dic
+        self.stop = dic._cur
+
+    def __iter__(self):
+        return reversed(self.dict._revs[:self.stop])
+
+    def __len__(self):
+        return self.stop
+
+    def __getitem__(self, key):
+        revs = self.dict._revs
+        i = bisect_left(revs, key, 0, self.stop)
+        if i < self.stop and revs[i] == key:
+            return self.dict._vals[i]
+        raise KeyError(key)
+
+
+class BisectWindowDictFutureView(Mapping):
+    """The revisions after a BisectWindowDict's cursor, earliest first."""
+    __slots__ = ['dict', 'start']
+
+    def __init__(self, dic):
+        self.dict = dic
+        self.start = dic._cur
+
+    def __iter__(self):
+        return iter(self.dict._revs[self.start:])
+
+    def __len__(self):
+        return len(self.dict._revs) - self.start
+
+    def __getitem__(self, key):
+        revs = self.dict._revs
+        i = bisect_left(revs, key, self.start)
+        if i < len(revs) and revs[i] == key:
+            return self.dict._vals[i]
+        raise KeyError(key)
+
+
+class BisectWindowDictSlice:
+    __slots__ = ['dict', 'slice']
+
+    def __init__(self, dict, slice):
+        self.dict = dict
+        self.slice = slice
+
+    def __reversed__(self):
+        return BisectWindowDictReverseSlice(self.dict, self.slice)
+
+    def __iter__(self):
+        dic = self.dict
+        slic = self.slice
+        if slic.step is not None:
+            for i in range(slic.start or dic.beginning, slic.stop or dic.end, slic.step):
+                yield dic[i]
+            return
+        if slic.start is not None and slic.start == slic.stop:
+            yield dic[slic.stop]
+            return
+        lo, hi = bisect_slice_bounds(dic._revs, slic.start, slic.stop)
+        yield from dic._vals[lo:hi]
+
+
+class BisectWindowDictReverseSlice:
+    __slots__ = ['dict', 'slice']
+
+    def __init__(self, dict, slice):
+        self.dict = dict
+        self.slice = slice
+
+    def __reversed__(self):
+        return BisectWindowDictSlice(self.dict, self.slice)
+
+    def __iter__(self):
+        dic = self.dict
+        slic = self.slice
+        if slic.step is not None:
+            for i in range(slic.start or dic.end, slic.stop or dic.beginning, slic.step):
+                yield dic[i]
+            return
+        if slic.start is not None and slic.start == slic.stop:
+            yield dic[slic.stop]
             return
+        lo, hi = bisect_slice_bounds(dic._revs, slic.start, slic.stop)
+        yield from reversed(dic._vals[lo:hi])
+
+
+class BisectWindowDict(MutableMapping):
+    """A ``WindowDict`` that keeps its history in a sorted array.
+
+    Revisions must be integers. They're stored in an ``array('q')``
+    alongside a list of values, so looking up a revision far from the
+    last one costs a binary search, rather than a walk through every
+    revision in between, as it does in ``WindowDict``.
+
+    A cursor remembers the last revision sought, so looking up
+    the same revision again, or one of its neighbors, is about as
+    cheap as it is in ``WindowDict``.
+
+    """
+    __slots__ = ['_revs', '_vals', '_cur']
+
+    def future(self):
+        """Return a Mapping of future values."""
+        return BisectWindowDictFutureView(self)
+
+    def past(self):
+        """Return a Mapping of past values."""
+        return BisectWindowDictPastView(self)
+
+    def seek(self, rev):
+        """Move the cursor to just after the given revision."""
+        revs = self._revs
+        cur = self._cur
+        if cur < len(revs) and revs[cur] <= rev:
+            if cur + 1 == len(revs) or revs[cur + 1] > rev:
+                self._cur = cur + 1
+                return
+        elif cur == 0 or revs[cur - 1] <= rev:
+            return
+        elif cur == 1 or revs[cur - 2] <= rev:
+            self._cur = cur - 1
+            return
+        self._cur = bisect_right(revs, rev)
+
+    def has_exact_rev(self, rev):
+        """Return whether I have a value at this exact revision."""
         self.seek(rev)
-        if self._future:
+        return self._cur > 0 and self._revs[self._cur - 1] == rev
+
+    def rev_before(self, rev):
+        """Return the latest past rev on which the value changed."""
+        self.seek(rev)
+        if self._cur:
+            return self._revs[self._cur - 1]
+
+    def rev_after(self, rev):
+        """Return the earliest future rev on which the value will change."""
+        self.seek(rev)
+        if self._cur < len(self._revs):
+            return self._revs[self._cur]
+
+    def truncate(self, rev):
+        """Delete everything after the given revision."""
+        self.seek(rev)
+        del self._revs[self._cur:]
+        del self._vals[self._cur:]
+
+    @property
+    def beginning(self):
+        if not self._revs:
+            raise HistoryError("No history yet")
+        return self._revs[0]
+
+    @property
+    def end(self):
+        if not self._revs:
+            raise HistoryError("No history yet")
+        return self._revs[-1]
+
+    def keys(self):
+        return BisectWindowDictKeysView(self)
+
+    def items(self):
+        return BisectWindowDictItemsView(self)
+
+    def values(self):
+        return BisectWindowDictValuesView(self)
+
+    def __bool__(self):
+        return bool(self._revs)
+
+    def __init__(self, data={}):
+        items = sorted(data.items())
+        self._revs = array('q', map(itemgetter(0), items))
+        self._vals = list(map(itemgetter(1), items))
+        self._cur = len(self._revs)
+
+    @classmethod
+    def from_sorted(cls, revs, vals):
+        """Make one from revisions already in ascending order, and their values.
+
+        ``revs`` may be an ``array('q')``, or bytes in that format.
+
+        """
+        self = cls.__new__(cls)
+        self._revs = array('q', revs)
+        self._vals = list(vals)
+        self._cur = len(self._revs)
+        return self
+
+    def __iter__(self):
+        return iter(self._revs)
+
+    def __contains__(self, item):
+        return bool(self._revs) and item >= self._revs[0]
+
+    def __len__(self):
+        return len(self._revs)
+
+    def __getitem__(self, rev):
+        if isinstance(rev, slice):
+            if None not in (rev.start, rev.stop) and rev.start > rev.stop:
+                return BisectWindowDictReverseSlice(self, rev)
+            return BisectWindowDictSlice(self, rev)
+        self.seek(rev)
+        if not self._cur:
             raise HistoryError(
-                "Already have some history after {}".format(rev)
+                "Revision {} is before the start of history".format(rev)
             )
-        if not self._past or rev > self._past[-1][0]:
-            self._past.append((rev, v))
-        elif rev == self._past[-1][0]:
-            self._past[-1] = (rev, v)
+        ret = self._vals[self._cur - 1]
+        if ret is None:
+            raise HistoryError("Set, then deleted", deleted=True)
+        return ret
+
+    def __setitem__(self, rev, v):
+        self.seek(rev)
+        cur = self._cur
+        if cur and self._revs[cur - 1] == rev:
+            self._vals[cur - 1] = v
         else:
+            self._revs.insert(cur, rev)
+            self._vals.insert(cur, v)
+            self._cur = cur + 1
+
+    def __delitem__(self, rev):
+        if not self._revs or not self._revs[0] <= rev <= self._revs[-1]:
+            raise HistoryError("Rev outside of history: {}".format(rev))
+        if not self.has_exact_rev(rev):
+            raise HistoryError("Rev not present: {}".format(rev))
+        self._cur -= 1
+        del self._revs[self._cur]
+        del self._vals[self._cur]
+
+    def __repr__(self):
+        return "{}({})".format(
+            self.__class__.__name__, dict(zip(self._revs, self._vals))
+        )
+
+
+class FuturistWindowDict(BisectWindowDict):
+    """A ``BisectWindowDict`` that does not let you rewrite the past."""
+    __slots__ = []
+
+    def __setitem__(self, rev, v):
+        self.seek(rev)
+        cur = self._cur
+        if cur < len(self._revs):
             raise HistoryError(
-                "Already have some history after {} "
-                "(and my seek function is broken?)".format(rev)
+                "Already have some history after {}".format(rev)
             )
+        if cur and self._revs[cur - 1] == rev:
+            self._vals[cur - 1] = v
+        else:
+            self._revs.append(rev)
+            self._vals.append(v)
+            self._cur = cur + 1
 
 
 class TurnDict(FuturistWindowDict):
@@ -502,6 +791,7 @@ class TurnDict(FuturistWindowDict):
     Only used for storing turns that contain ticks.
 
     """
+    __slots__ = []
     cls = FuturistWindowDict
 
     def __getitem__(self, rev):
@@ -601,6 +891,125 @@ class StructuredDefaultDict(dict):
         raise TypeError("Can't set layer {}".format(self.layer))
 
 
+class Memo(MutableMapping):
+    """A dict that forgets its least recently used entries past a size limit.
+
+    Keys are tuples that end with a time: the last ``timelen`` elements,
+    eg. turn and tick. What comes before the time is the key's prefix,
+    and ``forget_after`` can drop every entry with a given prefix that's
+    later than a given time.
+
+    With ``maxsize=None``, nothing is forgotten except by ``forget_after``.
+
+    Counts ``hits``, ``misses``, and ``evictions``, so you can tell
+    whether ``maxsize`` is any good.
+
+    """
+    __slots__ = ['_data', '_index', '_latest', 'maxsize', 'timelen',
+                 'hits', 'misses', 'evictions']
+
+    def __init__(self, maxsize=None, timelen=2):
+        self._data = OrderedDict()
+        self._index = {}
+        """Sets of times, keyed by prefix"""
+        self._latest = {}
+        """Upper bound on the times in ``_index``, keyed by prefix"""
+        self.maxsize = maxsize
+        self.timelen = timelen
+        self.hits = self.misses = self.evictions = 0
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, k):
+        return k in self._data
+
+    def __getitem__(self, k):
+        data = self._data
+        if k in data:
+            self.hits += 1
+            data.move_to_end(k)
+            return data[k]
+        self.misses += 1
+        raise KeyError(k)
+
+    def peek(self, k):
+        """Return what's stored at ``k``, or ``None``.
+
+        Doesn't count as a hit or a miss; meant for writers.
+
+        """
+        data = self._data
+        if k in data:
+            data.move_to_end(k)
+            return data[k]
+
+    def __setitem__(self, k, v):
+        data = self._data
+        if k in data:
+            data.move_to_end(k)
+            data[k] = v
+            return
+        data[k] = v
+        prefix = k[:-self.timelen]
+        time = k[-self.timelen:]
+        if prefix in self._index:
+            self._index[prefix].add(time)
+            if time > self._latest[prefix]:
+                self._latest[prefix] = time
+        else:
+            self._index[prefix] = {time}
+            self._latest[prefix] = time
+        if self.maxsize is not None:
+            while len(data) > self.maxsize:
+                self._unindex(data.popitem(last=False)[0])
+                self.evictions += 1
+
+    def __delitem__(self, k):
+        del self._data[k]
+        self._unindex(k)
+
+    def _unindex(self, k):
+        prefix = k[:-self.timelen]
+        times = self._index[prefix]
+        times.discard(k[-self.timelen:])
+        if not times:
+            del self._index[prefix]
+            del self._latest[prefix]
+
+    def forget_after(self, prefix, time):
+        """Forget everything about ``prefix`` later than ``time``."""
+        if prefix not in self._latest or self._latest[prefix] <= time:
+            return
+        data = self._data
+        times = self._index[prefix]
+        for t in [t for t in times if t > time]:
+            del data[prefix + t]
+            times.remove(t)
+        if times:
+            self._latest[prefix] = time
+        else:
+            del self._index[prefix]
+            del self._latest[prefix]
+
+    def clear(self):
+        self._data.clear()
+        self._index.clear()
+        self._latest.clear()
+
+    def stats(self):
+        """Return a dict of hits, misses, evictions, and present size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data)
+        }
+
+
 class Cache(object):
     """A data store that's useful for tracking graph revisions."""
     __slots__ = ['db', 'parents', 'keys', 'keycache', 'branches',
@@ -608,6 +1017,7 @@ class Cache(object):
 
     def __init__(self, db):
         self.db = db
+        memo_size = getattr(db, 'memo_size', None)
         self.parents = StructuredDefaultDict(3, TurnDict)
         """Entity data keyed by the entities' parents.
 
@@ -640,15 +1050,24 @@ class Cache(object):
         """
         self.shallow = PickyDefaultDict(TurnDict)
         """Less structured alternative to ``branches`` ."""
-        self.shallower = PickyDefaultDict(WindowDict)
-        """Even less structured alternative to ``shallow``."""
-        self.shallowest = {}
-        """A dictionary for plain, unstructured hinting."""
+        self.shallower = Memo(memo_size, timelen=1)
+        """Even less structured alternative to ``shallow``.
+
+        Holds ``WindowDict`` of ticks, keyed by entity, key, branch, and turn.
+        It's a ``Memo``, so it may forget things.
+
+        """
+        self.shallowest = Memo(memo_size)
+        """A ``Memo`` for plain, unstructured hinting."""
         self.settings = PickyDefaultDict(TurnDict)
         """All the ``entity[key] = value`` operations that were performed on some turn"""
         self.presettings = PickyDefaultDict(TurnDict)
         """The values prior to ``entity[key] = value`` operations performed on some turn"""
 
+    def clear(self):
+        """Forget everything I've stored."""
+        self.__init__(self.db)
+
     def load(self, data, validate=False):
         """Add a bunch of data. It doesn't need to be in chronological order.
 
@@ -657,32 +1076,79 @@ class Cache(object):
 
         """
         dd3 = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-        branch_end = defaultdict(lambda: 0)
-        turn_end = defaultdict(lambda: 0)
         for row in data:
             entity, key, branch, turn, tick, value = row[-6:]
-            branch_end[branch] = max((turn, branch_end[branch]))
-            turn_end[branch, turn] = max((tick, turn_end[branch, turn]))
             dd3[branch][turn][tick].append(row)
         # Make keycaches and valcaches. Must be done chronologically
-        # to make forwarding work.
+        # to make forwarding work. Only visit the turns and ticks
+        # that have something in them, so that loading a window late
+        # in a long history doesn't cost the whole history.
         childbranch = self.db._childbranch
         branch2do = deque(['trunk'])
         store = self._store
         update_keycache = self._update_keycache
         while branch2do:
             branch = branch2do.popleft()
-            turns = branch_end[branch] + 1
-            for turn in range(turns):
-                ticks = turn_end[branch, turn] + 1
-                for tick in range(ticks):
-                    for row in dd3[branch][turn][tick]:
-                        store(*row)
-                        update_keycache(*row, validate=validate, forward=True)
+            if branch in dd3:
+                turns = dd3[branch]
+                for turn in sorted(turns):
+                    ticks = turns[turn]
+                    for tick in sorted(ticks):
+                        for row in ticks[tick]:
+                            store(*row)
+                            update_keycache(*row, validate=validate, forward=True)
             if branch in childbranch:
                 branch2do.extend(childbranch[branch])
 
+    def load_turns(self, turns):
+        """Add history a whole turn of one key at a time, while I'm empty.
+
+        ``turns`` is an iterable of ``(path, branch, turn, ticks, values)``,
+        where ``path`` is the entity and key, as in ``store``, ``ticks``
+        an ``array('q')`` of the ticks in ascending order, and ``values``
+        a list of what's stored at them, with ``None`` for deletion.
+        Each key's turns in a branch must be together and in order,
+        after those in the branch it forked from.
+
+        Each turn goes into my dictionaries as it is, rather than a
+        tick at a time, as with ``load``. Keycaches are worked out
+        when they're wanted.
+
+        """
+        settings = defaultdict(dict)
+        presettings = defaultdict(dict)
+        written = self.db._written
+        if written is not None:
+            serial = self.db._write_serial = self.db._write_serial + 1
+        last_path = last_branch = last = None
+        for path, branch, turn, ticks, values in turns:
+            if path != last_path or branch != last_branch:
+                try:
+                    last = self.retrieve(*path, branch, turn, ticks[0])
+                except KeyError:
+                    last = None
+                if written is not None and path != last_path:
+                    for i in range(len(path) + 1):
+                        written[self, path[:i]] = serial
+                last_path, last_branch = path, branch
+            parent = path[:-2]
+            entity, key = path[-2:]
+            new = FuturistWindowDict.from_sorted(ticks, values)
+            self.branches[path][branch][turn] \
+                = self.keys[parent+(entity,)][key][branch][turn] \
+                = self.shallow[path+(branch,)][turn] = new
+            if parent:
+                self.parents[parent][entity][key][branch][turn] = new
+            settings[branch, turn].update(zip(ticks, [path + (v,) for v in values]))
+            presettings[branch, turn].update(zip(ticks, [path + (v,) for v in [last] + values[:-1]]))
+            last = values[-1]
+        for (branch, turn) in sorted(settings, key=itemgetter(1)):
+            self.settings[branch][turn] = settings[branch, turn]
+            self.presettings[branch][turn] = presettings[branch, turn]
+        self.db._journal = None
+
     def _valcache_lookup(self, cache, branch, turn, tick):
+        self._note_read()
         if branch in cache:
             branc = cache[branch]
             if branc.has_exact_rev(turn):
@@ -734,6 +1200,7 @@ class Cache(object):
         return ret
 
     def _get_keycache(self, parentity, branch, turn, tick, *, forward=False):
+        self.db._load_at(branch, turn)
         return self._get_keycachelike(
             self.keycache, self.keys, self._slow_iter_keys,
             parentity, branch, turn, tick, forward=forward
@@ -788,6 +1255,9 @@ class Cache(object):
         """
         self._store(*args, planning=planning)
         self._update_keycache(*args, validate=validate, forward=forward)
+        journal = self.db._journal
+        if journal is not None:
+            journal.append((self, args, planning, forward))
 
     def _update_keycache(self, *args, validate=False, forward=False):
         entity, key, branch, turn, tick, value = args[-6:]
@@ -816,7 +1286,18 @@ class Cache(object):
     def _store(self, *args, planning=False):
         entity, key, branch, turn, tick, value = args[-6:]
         parent = args[:-6]
+        # This may load the history around the time, resetting me,
+        # so look up my dictionaries only after.
+        try:
+            prev = self.retrieve(*args[:-1])
+        except KeyError:
+            prev = None
         settings_turns = self.settings[branch]
+        if settings_turns.has_exact_rev(turn) and \
+                settings_turns[turn].has_exact_rev(tick) and \
+                settings_turns[turn][tick] == parent + (entity, key, value):
+            # loading brought this very write back from the database
+            return
         presettings_turns = self.presettings[branch]
         branches = self.branches[parent+(entity, key)][branch]
         keys = self.keys[parent+(entity,)][key][branch]
@@ -858,10 +1339,6 @@ class Cache(object):
                             turn, branch
                         )
                     )
-        try:
-            prev = self.retrieve(*args[:-1])
-        except KeyError:
-            prev = None
         if settings_turns.has_exact_rev(turn):
             assert presettings_turns.has_exact_rev(turn)
             setticks = settings_turns[turn]
@@ -928,8 +1405,39 @@ class Cache(object):
                 new = FuturistWindowDict()
                 new[tick] = value
             branches[turn] = keys[turn] = shallow[turn] = new
-        self.shallower[parent+(entity, key, branch, turn)][tick] = value
+        # any hints about the time after this one are now wrong
+        self.shallowest.forget_after(parent+(entity, key, branch), (turn, tick))
+        self.shallower.forget_after(parent+(entity, key, branch), (turn,))
+        shallowerturn = self.shallower.peek(parent+(entity, key, branch, turn))
+        if shallowerturn is None:
+            self.shallower[parent+(entity, key, branch, turn)] = WindowDict({tick: value})
+        else:
+            shallowerturn.truncate(tick)
+            shallowerturn[tick] = value
         self.shallowest[parent+(entity, key, branch, turn, tick)] = value
+        written = self.db._written
+        if written is not None:
+            # Planned values may come true any time later, so whatever
+            # reads them can never be assumed unchanged.
+            if planning:
+                serial = float('inf')
+            else:
+                serial = self.db._write_serial = self.db._write_serial + 1
+            path = parent + (entity, key)
+            for i in range(len(path) + 1):
+                written[self, path[:i]] = serial
+
+    def _note_read(self, *path):
+        """If the ORM is tracking reads, record that I've been asked about ``path``.
+
+        ``path`` identifies an entity, or a key in one. With no
+        ``path``, I've been asked about something that might depend on
+        anything I hold.
+
+        """
+        reads = self.db._reads
+        if reads is not None:
+            reads.add((self, path))
 
     def retrieve(self, *args):
         """Get a value previously .store(...)'d.
@@ -941,6 +1449,9 @@ class Cache(object):
         the entity that the key is in.
 
         """
+        reads = self.db._reads
+        if reads is not None:
+            reads.add((self, args[:-3]))
         try:
             ret = self.shallowest[args]
             if ret is None:
@@ -950,18 +1461,25 @@ class Cache(object):
             pass
         entity = args[:-4]
         key, branch, turn, tick = args[-4:]
-        if entity+(key, branch, turn) in self.shallower and \
-                self.shallower[entity+(key, branch, turn)].has_exact_rev(tick):
-            ret = self.shallowest[args] \
-                = self.shallower[entity+(key, branch, turn)][tick]
-            return ret
+        try:
+            shallowerturn = self.shallower[entity+(key, branch, turn)]
+            if shallowerturn.has_exact_rev(tick):
+                ret = self.shallowest[args] = shallowerturn[tick]
+                return ret
+        except KeyError:
+            shallowerturn = None
         if entity+(key, branch) in self.shallow and \
                 self.shallow[entity+(key, branch)].has_exact_rev(turn) and \
                 tick in self.shallow[entity+(key, branch)][turn]:
             ret = self.shallowest[args] \
-                = self.shallower[entity+(key, branch, turn)][tick] \
                 = self.shallow[entity + (key, branch)][turn].get(tick)
+            if shallowerturn is None:
+                self.shallower[entity+(key, branch, turn)] = WindowDict({tick: ret})
+            else:
+                shallowerturn[tick] = ret
             return ret
+        if self.db._load_at(branch, turn):
+            return self.retrieve(*args)
         for (b, r, t) in self.db._iter_parent_btt(branch):
             if (
                     b in self.branches[entity+(key,)]
@@ -989,6 +1507,7 @@ class Cache(object):
         """
         entity = args[:-3]
         branch, turn, tick = args[-3:]
+        self._note_read(*entity)
         yield from self._get_keycache(entity, branch, turn, tick, forward=forward)
     iter_entities = iter_keys = iter_entity_keys = iter_entities_or_keys
 
@@ -1003,6 +1522,7 @@ class Cache(object):
         """
         entity = args[:-3]
         branch, turn, tick = args[-3:]
+        self._note_read(*entity)
         return len(self._get_keycache(entity, branch, turn, tick, forward=forward))
     count_entities = count_keys = count_entity_keys = count_entities_or_keys
 
@@ -1015,6 +1535,7 @@ class Cache(object):
         Any that come before that will be taken to identify the entity.
 
         """
+        self._note_read(*args[:-4])
         try:
             return self.shallowest[args] is not None
         except KeyError:
@@ -1058,6 +1579,21 @@ class NodesCache(Cache):
             ex = None
         return super()._update_keycache(graph, node, branch, turn, tick, ex, validate=validate, forward=forward)
 
+    def load_turns(self, turns):
+        """Add whole turns of history, as ``Cache.load_turns``, and
+        create objects for the nodes.
+
+        """
+        node_objs = self.db._node_objs
+
+        def make_nodes():
+            for turn in turns:
+                (graph, node) = turn[0]
+                if (graph, node) not in node_objs:
+                    node_objs[graph, node] = self._make_node(self.db.graph[graph], node)
+                yield turn
+        super().load_turns(make_nodes())
+
 
 class EdgesCache(Cache):
     """A cache for remembering whether edges exist at a given time."""
@@ -1087,6 +1623,8 @@ class EdgesCache(Cache):
                 break
 
     def _get_destcache(self, graph, orig, branch, turn, tick, *, forward=False):
+        self._note_read(graph, orig)
+        self.db._load_at(branch, turn)
         return self._get_keycachelike(
             self.destcache, self.successors, self._slow_iter_successors, (graph, orig),
             branch, turn, tick, forward=forward
@@ -1101,6 +1639,9 @@ class EdgesCache(Cache):
         return kc
 
     def _get_origcache(self, graph, dest, branch, turn, tick, *, forward=False):
+        # predecessors aren't a prefix of the edges' keys, so any edge might matter
+        self._note_read()
+        self.db._load_at(branch, turn)
         return self._get_keycachelike(
             self.origcache, self.predecessors, self._slow_iter_predecessors, (graph, dest),
             branch, turn, tick, forward=forward
@@ -1132,6 +1673,8 @@ class EdgesCache(Cache):
 
     def has_successor(self, graph, orig, dest, branch, turn, tick, *, forward=False):
         """Return whether an edge connects the origin to the destination at the given time."""
+        self._note_read(graph, orig)
+        self.db._load_at(branch, turn)
         return dest in self._get_keycachelike(
             self.destcache, self.successors, self._slow_iter_successors, (graph, orig),
             branch, turn, tick, forward=forward
@@ -1139,6 +1682,8 @@ class EdgesCache(Cache):
     
     def has_predecessor(self, graph, dest, orig, branch, turn, tick, forward=False):
         """Return whether an edge connects the destination to the origin at the given time."""
+        self._note_read()
+        self.db._load_at(branch, turn)
         return orig in self._get_keycachelike(
             self.origcache, self.predecessors, self._slow_iter_predecessors, (graph, dest),
             branch, turn, tick, forward=forward
@@ -1159,6 +1704,24 @@ class EdgesCache(Cache):
             newp[tick] = ex
             preds[turn] = newp
 
+    def load_turns(self, turns):
+        """Add whole turns of history, as ``Cache.load_turns``, and
+        create objects for the edges.
+
+        """
+        edge_objs = self.db._edge_objs
+
+        def make_edges():
+            for turn in turns:
+                (path, branch, r, ticks, values) = turn
+                (graph, orig, dest, idx) = path
+                if path not in edge_objs:
+                    edge_objs[path] = self.db._make_edge(self.db.graph[graph], orig, dest, idx)
+                self.predecessors[(graph, dest)][orig][idx][branch][r] \
+                    = FuturistWindowDict.from_sorted(ticks, values)
+                yield turn
+        super().load_turns(make_edges())
+
     def _forward_valcaches(self, graph, orig, dest, key, branch, turn, tick, ex, *, validate=False):
         if not ex:
             ex = None
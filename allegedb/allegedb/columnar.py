@@ -0,0 +1,345 @@
+# This file is part of allegedb, an object relational mapper for versioned graphs.
+# Copyright (C) Zachary Spector. zacharyspector@gmail.com
+"""Bulk export and import of history, in columns.
+
+Rows are read from the database as they're stored, without decoding
+their JSON. Columns of names and values are dictionary-encoded: each
+becomes an array of integer codes into a list of the distinct strings,
+with -1 for null. Turns, ticks, and the like are integer arrays, with
+-1 for null as well; none of them go negative otherwise.
+
+If pyarrow is installed, each table is written to a Parquet file of
+its own in a directory. Otherwise, with numpy, all the tables go in
+one ``.npz`` file, as arrays named ``table/column``, plus
+``table/column/dict`` for the strings of encoded columns.
+
+Imported columns are grouped by key, branch, and turn with ``cache_turns``,
+so that the caches can take a whole turn of a key at once, decoding
+each distinct name and value only once.
+
+"""
+import os
+from array import array
+
+# the columns of each table, in the order the queries use; the ones
+# in INT_COLUMNS are numbers, the rest are strings
+TABLES = {
+    'graphs': ('graph', 'type'),
+    'branches': ('branch', 'parent', 'parent_turn', 'parent_tick', 'end_turn', 'end_tick'),
+    'turns': ('branch', 'turn', 'end_tick', 'plan_end_tick'),
+    'graph_val': ('graph', 'key', 'branch', 'turn', 'tick', 'value'),
+    'nodes': ('graph', 'node', 'branch', 'turn', 'tick', 'extant'),
+    'node_val': ('graph', 'node', 'key', 'branch', 'turn', 'tick', 'value'),
+    'edges': ('graph', 'orig', 'dest', 'idx', 'branch', 'turn', 'tick', 'extant'),
+    'edge_val': ('graph', 'orig', 'dest', 'idx', 'key', 'branch', 'turn', 'tick', 'value')
+}
+HISTORY_TABLES = ('graph_val', 'nodes', 'node_val', 'edges', 'edge_val')
+INT_COLUMNS = frozenset({
+    'turn', 'tick', 'idx', 'extant', 'parent_turn', 'parent_tick',
+    'end_turn', 'end_tick', 'plan_end_tick'
+})
+
+
+# the columns of each history table that name the entity and key, in
+# the order the caches want them, and the column of the value
+CACHE_COLUMNS = {
+    'graph_val': (('graph', 'key'), 'value'),
+    'nodes': (('graph', 'node'), 'extant'),
+    'node_val': (('graph', 'node', 'key'), 'value'),
+    'edges': (('graph', 'orig', 'dest', 'idx'), 'extant'),
+    'edge_val': (('graph', 'orig', 'dest', 'idx', 'key'), 'value')
+}
+
+
+def have_arrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+def dict_encode(values):
+    """Return an array of codes for ``values`` and a list of the distinct
+    values, so that ``dictionary[codes[i]] == values[i]``.
+
+    ``None`` gets the code -1.
+
+    """
+    import numpy as np
+    values = np.array(values, dtype=object)
+    null = np.equal(values, None)
+    codes = np.full(len(values), -1, dtype=np.int32)
+    dictionary, inverse = np.unique(
+        values[~null].astype(np.str_), return_inverse=True)
+    codes[~null] = inverse.reshape(-1)
+    return codes, dictionary.tolist()
+
+
+def dict_decode(codes, dictionary):
+    """Invert ``dict_encode``, giving an array of objects."""
+    import numpy as np
+    # the extra None at the end is what code -1 gets
+    lookup = np.empty(len(dictionary) + 1, dtype=object)
+    lookup[:-1] = dictionary
+    return lookup[np.asarray(codes)]
+
+
+def int_column(values):
+    """Return an array of the integers in ``values``, with -1 for ``None``."""
+    import numpy as np
+    values = np.array(values, dtype=object)
+    values[np.equal(values, None)] = -1
+    return values.astype(np.int64)
+
+
+def to_columns(table, rows):
+    """Turn the rows of ``table`` into a dictionary of columns.
+
+    Numeric columns are arrays from ``int_column``; the others are
+    ``(codes, dictionary)`` pairs from ``dict_encode``.
+
+    """
+    names = TABLES[table]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    return {
+        name: int_column(col) if name in INT_COLUMNS else dict_encode(col)
+        for (name, col) in zip(names, columns)
+    }
+
+
+def to_rows(table, columns):
+    """Invert ``to_columns``, giving a list of row tuples."""
+    import numpy as np
+    cols = []
+    for name in TABLES[table]:
+        col = columns[name]
+        if name in INT_COLUMNS:
+            col = np.asarray(col)
+            objs = col.astype(object)
+            objs[col < 0] = None
+            cols.append(objs.tolist())
+        else:
+            cols.append(dict_decode(*col).tolist())
+    return list(zip(*cols))
+
+
+def write_columns(path, tables, format=None):
+    """Write a dictionary of ``to_columns`` output, keyed by table name,
+    to ``path``.
+
+    ``format`` is ``'parquet'`` or ``'npz'``; by default, Parquet if
+    pyarrow is installed. Return the format used.
+
+    """
+    if format is None:
+        format = 'parquet' if have_arrow() else 'npz'
+    if format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        os.makedirs(path, exist_ok=True)
+        for table, columns in tables.items():
+            arrays = []
+            for name in TABLES[table]:
+                col = columns[name]
+                if name in INT_COLUMNS:
+                    arrays.append(pa.array(col, type=pa.int64(), mask=col < 0))
+                else:
+                    codes, dictionary = col
+                    arrays.append(pa.DictionaryArray.from_arrays(
+                        pa.array(codes, type=pa.int32(), mask=codes < 0),
+                        pa.array(dictionary, type=pa.string())
+                    ))
+            pq.write_table(
+                pa.Table.from_arrays(arrays, names=list(TABLES[table])),
+                os.path.join(path, table + '.parquet')
+            )
+    elif format == 'npz':
+        import numpy as np
+        arrays = {}
+        for table, columns in tables.items():
+            for name in TABLES[table]:
+                col = columns[name]
+                key = table + '/' + name
+                if name in INT_COLUMNS:
+                    arrays[key] = col
+                else:
+                    codes, dictionary = col
+                    arrays[key] = codes
+                    arrays[key + '/dict'] = np.array(dictionary, dtype=np.str_)
+        # numpy adds the .npz extension if it's missing
+        np.savez_compressed(path, **arrays)
+    else:
+        raise ValueError("Unknown format: {}".format(format))
+    return format
+
+
+def read_columns(path):
+    """Read what ``write_columns`` wrote to ``path``.
+
+    Return a dictionary of ``to_columns``-style column dictionaries,
+    keyed by table name.
+
+    """
+    tables = {}
+    if os.path.isdir(path):
+        import pyarrow.parquet as pq
+        for table in TABLES:
+            fn = os.path.join(path, table + '.parquet')
+            if not os.path.exists(fn):
+                continue
+            arrow = pq.read_table(fn)
+            columns = tables[table] = {}
+            for name in TABLES[table]:
+                col = arrow.column(name)
+                if name in INT_COLUMNS:
+                    columns[name] = col.fill_null(-1).to_numpy()
+                    continue
+                col = col.combine_chunks()
+                if hasattr(col, 'dictionary'):
+                    columns[name] = (
+                        col.indices.fill_null(-1).to_numpy(),
+                        col.dictionary.to_pylist()
+                    )
+                else:
+                    columns[name] = dict_encode(col.to_pylist())
+        return tables
+    import numpy as np
+    if not os.path.exists(path) and os.path.exists(path + '.npz'):
+        path += '.npz'
+    with np.load(path) as npz:
+        for key in npz.files:
+            parts = key.split('/')
+            if len(parts) != 2:
+                continue
+            table, name = parts
+            columns = tables.setdefault(table, {})
+            if name in INT_COLUMNS:
+                columns[name] = npz[key]
+            else:
+                columns[name] = (npz[key], npz[key + '/dict'].tolist())
+    return tables
+
+
+def export_history(query, path, window=None, snapshot=True, format=None):
+    """Write the history in ``query``'s database to ``path``.
+
+    ``window`` and ``snapshot`` limit the history tables as in
+    ``QueryEngine._dump``. The graphs, branches, and turns are always
+    written whole. Return the format used.
+
+    """
+    query.flush()
+    tables = {
+        'graphs': to_columns('graphs', query.sql('graphs_dump').fetchall()),
+        'branches': to_columns('branches', query.sql('branches_dump').fetchall()),
+        'turns': to_columns('turns', query.sql('turns_dump').fetchall())
+    }
+    for table in HISTORY_TABLES:
+        tables[table] = to_columns(
+            table, list(map(tuple, query._dump(table, window, snapshot))))
+    return write_columns(path, tables, format)
+
+
+def decoded_dictionary(dictionary, json_load):
+    """Return an array of the strings in ``dictionary`` decoded with
+    ``json_load``, and ``None`` on the end, for code -1.
+
+    """
+    import numpy as np
+    ret = np.empty(len(dictionary) + 1, dtype=object)
+    for i, s in enumerate(dictionary):
+        ret[i] = json_load(s)
+    return ret
+
+
+def cache_turns(table, columns, json_load, branch_rank):
+    """Group the rows of a history table by key, branch, and turn, for
+    ``Cache.load_turns``.
+
+    ``columns`` are as ``read_columns`` gives them. ``branch_rank``
+    maps each branch to its place in an order where every branch
+    comes after the one it forked from. Names and values are decoded
+    with ``json_load``.
+
+    Yield ``(path, branch, turn, ticks, values)`` tuples, with ``ticks``
+    an ``array('q')``.
+
+    """
+    import numpy as np
+    turns = columns['turn']
+    if not len(turns):
+        return
+    names, value_name = CACHE_COLUMNS[table]
+    codes = []
+    lookups = []
+    for name in names:
+        if name in INT_COLUMNS:
+            codes.append(columns[name])
+            lookups.append(None)
+        else:
+            codes.append(columns[name][0])
+            lookups.append(decoded_dictionary(columns[name][1], json_load))
+    # number each distinct entity and key, and decode each once
+    keys, key_ids = np.unique(np.stack(codes), axis=1, return_inverse=True)
+    key_ids = key_ids.reshape(-1)
+    paths = list(zip(*(
+        keycodes.tolist() if lookup is None else lookup[keycodes].tolist()
+        for (keycodes, lookup) in zip(keys, lookups)
+    )))
+    branch_codes, branch_names = columns['branch']
+    ranks = np.array([branch_rank[b] for b in branch_names], dtype=np.int64)[branch_codes]
+    ticks = columns['tick']
+    order = np.lexsort((ticks, turns, ranks, key_ids))
+    key_ids = key_ids[order]
+    ranks = ranks[order]
+    turns = turns[order]
+    ticks = np.ascontiguousarray(ticks[order], dtype=np.int64)
+    if value_name in INT_COLUMNS:
+        values = np.where(columns[value_name][order] != 0, True, None)
+    else:
+        values_codes, dictionary = columns[value_name]
+        values = decoded_dictionary(dictionary, json_load)[values_codes[order]]
+    values = values.tolist()
+    starts = np.flatnonzero(np.concatenate((
+        [True],
+        (key_ids[1:] != key_ids[:-1]) | (ranks[1:] != ranks[:-1])
+        | (turns[1:] != turns[:-1])
+    )))
+    ends = np.append(starts[1:], len(order))
+    for key_id, branch, turn, start, end in zip(
+            key_ids[starts].tolist(), branch_codes[order][starts].tolist(),
+            turns[starts].tolist(), starts.tolist(), ends.tolist()
+    ):
+        yield (
+            paths[key_id], branch_names[branch], turn,
+            array('q', ticks[start:end].tobytes()), values[start:end]
+        )
+
+
+def import_history(query, path):
+    """Put the history from ``path`` into ``query``'s database.
+
+    The history tables are inserted in bulk, so they shouldn't already
+    have rows for the same keys and times. Branches and turns are
+    updated if they exist. Return the columns imported, as
+    ``read_columns`` does, for ``cache_turns``.
+
+    """
+    query.flush()
+    tables = read_columns(path)
+    for table, columns in tables.items():
+        rows = to_rows(table, columns)
+        if table == 'graphs':
+            for graph, typ in rows:
+                if not query.sql('graphs_named', graph).fetchone()[0]:
+                    query.sql('graphs_insert', graph, typ)
+        elif table == 'branches':
+            for row in rows:
+                query.set_branch(*row)
+        elif table == 'turns':
+            for row in rows:
+                query.set_turn(*row)
+        elif rows:
+            query.sqlmany(table + '_insert', *rows)
+    return tables
@@ -976,7 +976,6 @@ class AllegedGraph(object):
 
     """
     _succs = {}
-    _statmaps = {}
 
     def __init__(self, db, name, data=None, **attr):
         self._name = name
@@ -987,24 +986,31 @@ class AllegedGraph(object):
             convert_to_networkx_graph(data, create_using=self)
         self.graph.update(attr)
 
+    def _mapping(self, kind, cls):
+        """Return my mapping of the given kind, making it with ``cls`` if need be.
+
+        They're kept in the ORM, so that every object for the same graph
+        shares them, without sharing them with other ORMs.
+
+        """
+        key = (kind, self._name)
+        maps = self.db._graph_mappings
+        if key not in maps:
+            maps[key] = cls(self)
+        return maps[key]
+
     @property
     def graph(self):
-        if self._name not in self._statmaps:
-            self._statmaps[self._name] = GraphMapping(self)
-        return self._statmaps[self._name]
+        return self._mapping('graph', GraphMapping)
 
     @graph.setter
     def graph(self, v):
         self.graph.clear()
         self.graph.update(v)
 
-    _nodemaps = {}
-
     @property
     def node(self):
-        if self._name not in self._nodemaps:
-            self._nodemaps[self._name] = GraphNodeMapping(self)
-        return self._nodemaps[self._name]
+        return self._mapping('node', GraphNodeMapping)
 
     @node.setter
     def node(self, v):
@@ -1012,13 +1018,9 @@ class AllegedGraph(object):
         self.node.update(v)
     _node = node
 
-    _succmaps = {}
-
     @property
     def adj(self):
-        if self._name not in self._succmaps:
-            self._succmaps[self._name] = self.adj_cls(self)
-        return self._succmaps[self._name]
+        return self._mapping('adj', self.adj_cls)
 
     @adj.setter
     def adj(self, v):
@@ -1026,15 +1028,11 @@ class AllegedGraph(object):
         self.adj.update(v)
     edge = succ = _succ = _adj = adj
 
-    _predmaps = {}
-
     @property
     def pred(self):
         if not hasattr(self, 'pred_cls'):
             raise TypeError("Undirected graph")
-        if self._name not in self._predmaps:
-            self._predmaps[self._name] = self.pred_cls(self)
-        return self._predmaps[self._name]
+        return self._mapping('pred', self.pred_cls)
 
     @pred.setter
     def pred(self, v):
@@ -14,6 +14,7 @@ except ImportError:
     # python 3
     from allegedb import xjson
 import os
+from json import dumps, loads
 xjpath = os.path.dirname(xjson.__file__)
 alchemyIntegError = None
 try:
@@ -70,6 +71,10 @@ class QueryEngine(object):
 
     """
     json_path = xjpath
+    turn_granular = frozenset()
+    """Keys of graph, node, and edge stats whose history is only saved at the end of each turn"""
+    keyframe_tables = {'graph_val': 2, 'nodes': 2, 'node_val': 3, 'edges': 4, 'edge_val': 5}
+    """Tables to include in keyframes made by ``snap_keyframe``, with how many key columns come before the branch"""
 
     def __init__(
             self, dbstring, connect_args, alchemy,
@@ -109,9 +114,9 @@ class QueryEngine(object):
             if isinstance(dbstring, Connection):
                 self.connection = dbstring
             else:
-                if dbstring.startswith('sqlite:'):
-                    slashidx = dbstring.rindex('/')
-                    dbstring = dbstring[slashidx+1:]
+                if dbstring.startswith('sqlite:///'):
+                    # four slashes make an absolute path, as in SQLAlchemy
+                    dbstring = dbstring[len('sqlite:///'):]
                 self.connection = connect(dbstring)
 
         if alchemy:
@@ -124,13 +129,18 @@ class QueryEngine(object):
 
         self.globl = GlobalKeyValueStore(self)
         self._branches = {}
-        self._nodevals2set = []
-        self._edgevals2set = []
-        self._graphvals2set = []
-        self._nodes2set = []
-        self._edges2set = []
-        self.json_dump = json_dump or xjson.json_dump
-        self.json_load = json_load or xjson.json_load
+        self._nodevals2set = {}
+        self._edgevals2set = {}
+        self._graphvals2set = {}
+        self._nodes2set = {}
+        self._edges2set = {}
+        self._turn_final = {}
+        self._flushes = self._inserted = self._coalesced = 0
+        self.json_memo = xjson.JSONMemo(
+            json_dump or xjson.json_dump, json_load or xjson.json_load
+        )
+        self.json_dump = self.json_memo.dump
+        self.json_load = self.json_memo.load
 
     def sql(self, stringname, *args, **kwargs):
         """Wrapper for the various prewritten or compiled SQL calls.
@@ -163,6 +173,123 @@ class QueryEngine(object):
         s = self.strings[stringname]
         return self.connection.cursor().executemany(s, args)
 
+    def _dump(self, table, window=None, snapshot=True):
+        """Iterate over the rows of a table.
+
+        With ``window``, a list of ``(branch, turn_from, turn_to)``,
+        only get the rows in those branches from those turns. With
+        ``snapshot``, also get the latest row for every key from
+        before ``turn_from``. An item of ``window`` may have a fourth
+        element, ``False`` to leave out the snapshot for that branch,
+        when what came before is already loaded.
+
+        """
+        if window is None:
+            yield from self.sql(table + '_dump')
+            return
+        for (branch, turn_from, turn_to, *snap) in window:
+            if snapshot and (not snap or snap[0]):
+                yield from self._snapshot(table, branch, turn_from)
+            yield from self.sql(table + '_window', branch, turn_from, turn_to)
+
+    def _snapshot(self, table, branch, turn):
+        """Return the latest row for every key in the table, before the turn.
+
+        Starts from the nearest keyframe, if there is one, and only looks
+        at the rows after it.
+
+        """
+        if table not in self.keyframe_tables:
+            return self.sql(table + '_snapshot', branch, turn, turn)
+        (kf_turn,) = self.sql('keyframe_before', table, branch, turn).fetchone()
+        if kf_turn is None:
+            return self.sql(table + '_snapshot', branch, turn, turn)
+        (kf_rows,) = self.sql('keyframe_rows', table, branch, kf_turn).fetchone()
+        keylen = self.keyframe_tables[table]
+        latest = {}
+        for row in loads(kf_rows):
+            # keyframes leave out the branch
+            row = tuple(row[:keylen]) + (branch,) + tuple(row[keylen:])
+            latest[row[:keylen]] = row
+        for row in self.sql(table + '_window', branch, kf_turn, turn - 1):
+            # the window is in primary key order, so later rows win
+            latest[row[:keylen]] = row
+        return latest.values()
+
+    def snap_keyframe(self, branch, turn):
+        """Record the latest row for every key in my ``keyframe_tables``, before the turn.
+
+        Afterward, loading this branch from this turn or later doesn't
+        need to look at the history before it.
+
+        """
+        self.flush()
+        for table, keylen in self.keyframe_tables.items():
+            rows = [
+                row[:keylen] + row[keylen+1:]
+                for row in map(tuple, self._snapshot(table, branch, turn))
+            ]
+            self.sql('keyframes_insert', table, branch, turn, dumps(rows))
+
+    def _buffer(self, table, buf, key, values, turn_granular=False):
+        """Put a row in a write buffer, replacing any it supersedes.
+
+        ``key`` is the start of the row, ending with branch, turn, and
+        tick, and ``values`` is a tuple of the rest. Rows for the same
+        key and time replace each other. With ``turn_granular``, so do
+        rows for the same key in the same turn.
+
+        """
+        if key in buf:
+            self._coalesced += 1
+        elif turn_granular:
+            turnkey = key[:-1]
+            tick = key[-1]
+            final = self._turn_final.setdefault(table, {})
+            if turnkey in final:
+                first_tick, last_tick = final[turnkey]
+                if turnkey + (last_tick,) in buf:
+                    del buf[turnkey + (last_tick,)]
+                    self._coalesced += 1
+                final[turnkey] = (min((first_tick, tick)), max((last_tick, tick)))
+            else:
+                final[turnkey] = (tick, tick)
+        buf[key] = values
+
+    def _flush_buffer(self, table, buf):
+        """Send a write buffer to the database, after deleting the history it overwrites."""
+        if not buf:
+            return
+        delafter = {}
+        for key in buf:
+            dkey = key[:-2]
+            time = key[-2:]
+            if dkey in delafter:
+                delafter[dkey] = min((time, delafter[dkey]))
+            else:
+                delafter[dkey] = time
+        # history overwritten by rows that were coalesced away
+        for turnkey, (first_tick, last_tick) in self._turn_final.pop(table, {}).items():
+            dkey = turnkey[:-1]
+            time = (turnkey[-1], first_tick)
+            if dkey in delafter:
+                delafter[dkey] = min((time, delafter[dkey]))
+        self.sqlmany(
+            'del_{}_after'.format(table),
+            *(dkey + (turn, turn, tick) for (dkey, (turn, tick)) in delafter.items())
+        )
+        self.sqlmany(table + '_insert', *(key + values for (key, values) in buf.items()))
+        self._inserted += len(buf)
+        buf.clear()
+
+    def flush_stats(self):
+        """Return how many times I've flushed, how many rows that inserted, and how many rows were coalesced into others beforehand."""
+        return {
+            'flushes': self._flushes,
+            'inserted': self._inserted,
+            'coalesced': self._coalesced
+        }
+
     def have_graph(self, graph):
         """Return whether I have a graph by this name."""
         graph = self.json_dump(graph)
@@ -259,10 +386,10 @@ class QueryEngine(object):
     def turns_dump(self):
         return self.sql('turns_dump')
 
-    def graph_val_dump(self):
+    def graph_val_dump(self, window=None):
         """Yield the entire contents of the graph_val table."""
         self._flush_graph_val()
-        for (graph, key, branch, turn, tick, value) in self.sql('graph_val_dump'):
+        for (graph, key, branch, turn, tick, value) in self._dump('graph_val', window):
             yield (
                 self.json_load(graph),
                 self.json_load(key),
@@ -274,28 +401,12 @@ class QueryEngine(object):
 
     def _flush_graph_val(self):
         """Send all new and changed graph values to the database."""
-        if not self._graphvals2set:
-            return
-        delafter = {}
-        for graph, key, branch, turn, tick, value in self._graphvals2set:
-            if (graph, key, branch) in delafter:
-                delafter[graph, key, branch] = min((
-                    (turn, tick),
-                    delafter[graph, key, branch]
-                ))
-            else:
-                delafter[graph, key, branch] = (turn, tick)
-        self.sqlmany(
-            'del_graph_val_after',
-            *((graph, key, branch, turn, turn, tick)
-              for ((graph, key, branch), (turn, tick)) in delafter.items())
-        )
-        self.sqlmany('graph_val_insert', *self._graphvals2set)
-        self._graphvals2set = []
+        self._flush_buffer('graph_val', self._graphvals2set)
 
     def graph_val_set(self, graph, key, branch, turn, tick, value):
+        granular = key in self.turn_granular
         graph, key, value = map(self.json_dump, (graph, key, value))
-        self._graphvals2set.append((graph, key, branch, turn, tick, value))
+        self._buffer('graph_val', self._graphvals2set, (graph, key, branch, turn, tick), (value,), granular)
 
     def graph_val_del(self, graph, key, branch, turn, tick):
         """Indicate that the key is unset."""
@@ -306,20 +417,7 @@ class QueryEngine(object):
             yield (self.json_load(graph), typ)
 
     def _flush_nodes(self):
-        if not self._nodes2set:
-            return
-        # delete history that is to be overwritten due to paradox
-        cleanups = {}
-        for graph, node, branch, turn, tick, extant in self._nodes2set:
-            if (graph, node, branch) in cleanups:
-                cleanups[graph, node, branch] = min((
-                    (turn, tick), cleanups[graph, node, branch]
-                ))
-            else:
-                cleanups[graph, node, branch] = (turn, tick)
-        self.sqlmany('del_nodes_after', *(k + (turn, turn, tick) for k, (turn, tick) in cleanups.items()))
-        self.sqlmany('nodes_insert', *self._nodes2set)
-        self._nodes2set = []
+        self._flush_buffer('nodes', self._nodes2set)
 
     def exist_node(self, graph, node, branch, turn, tick, extant):
         """Declare that the node exists or doesn't.
@@ -327,12 +425,12 @@ class QueryEngine(object):
         Inserts a new record or updates an old one, as needed.
 
         """
-        self._nodes2set.append((self.json_dump(graph), self.json_dump(node), branch, turn, tick, extant))
+        self._buffer('nodes', self._nodes2set, (self.json_dump(graph), self.json_dump(node), branch, turn, tick), (extant,))
 
-    def nodes_dump(self):
+    def nodes_dump(self, window=None):
         """Dump the entire contents of the nodes table."""
         self._flush_nodes()
-        for (graph, node, branch, turn,tick, extant) in self.sql('nodes_dump'):
+        for (graph, node, branch, turn,tick, extant) in self._dump('nodes', window):
             yield (
                 self.json_load(graph),
                 self.json_load(node),
@@ -342,12 +440,12 @@ class QueryEngine(object):
                 bool(extant)
             )
 
-    def node_val_dump(self):
+    def node_val_dump(self, window=None):
         """Yield the entire contents of the node_val table."""
         self._flush_node_val()
         for (
                 graph, node, key, branch, turn, tick, value
-        ) in self.sql('node_val_dump'):
+        ) in self._dump('node_val', window):
             yield (
                 self.json_load(graph),
                 self.json_load(node),
@@ -359,42 +457,24 @@ class QueryEngine(object):
             )
 
     def _flush_node_val(self):
-        if not self._nodevals2set:
-            return
-        delafter = {}
-        for graph, node, key, branch, turn, tick, value in self._nodevals2set:
-            if (graph, node, key, branch) in delafter:
-                delafter[graph, node, key, branch] = min((
-                    (turn, tick),
-                    delafter[graph, node, key, branch]
-                ))
-            else:
-                delafter[graph, node, key, branch] = (turn, tick)
-        if delafter:
-            self.sqlmany(
-                'del_node_val_after',
-                *((graph, node, key, branch, turn, turn, tick)
-                  for ((graph, node, key, branch), (turn, tick)) in
-                  delafter.items())
-            )
-        self.sqlmany('node_val_insert', *self._nodevals2set)
-        self._nodevals2set = []
+        self._flush_buffer('node_val', self._nodevals2set)
 
     def node_val_set(self, graph, node, key, branch, turn, tick, value):
         """Set a key-value pair on a node at a specific branch and revision"""
+        granular = key in self.turn_granular
         graph, node, key, value = map(self.json_dump, (graph, node, key, value))
-        self._nodevals2set.append((graph, node, key, branch, turn, tick, value))
+        self._buffer('node_val', self._nodevals2set, (graph, node, key, branch, turn, tick), (value,), granular)
 
     def node_val_del(self, graph, node, key, branch, turn, tick):
         """Delete a key from a node at a specific branch and revision"""
         self.node_val_set(graph, node, key, branch, turn, tick, None)
 
-    def edges_dump(self):
+    def edges_dump(self, window=None):
         """Dump the entire contents of the edges table."""
         self._flush_edges()
         for (
                 graph, orig, dest, idx, branch, turn, tick, extant
-        ) in self.sql('edges_dump'):
+        ) in self._dump('edges', window):
             yield (
                 self.json_load(graph),
                 self.json_load(orig),
@@ -407,39 +487,19 @@ class QueryEngine(object):
             )
 
     def _flush_edges(self):
-        if not self._edges2set:
-            return
-        delafter = {}
-        for graph, orig, dest, idx, branch, turn, tick, extant in self._edges2set:
-            key = graph, orig, dest, idx, branch
-            if key in delafter:
-                delafter[key] = min((
-                    (turn, tick),
-                    delafter[key]
-                ))
-            else:
-                delafter[key] = (turn, tick)
-        if delafter:
-            self.sqlmany(
-                'del_edges_after',
-                *((graph, orig, dest, idx, branch, turn, turn, tick)
-                  for ((graph, orig, dest, idx, branch), (turn, tick)) in
-                  delafter.items())
-            )
-        self.sqlmany('edges_insert', *self._edges2set)
-        self._edges2set = []
+        self._flush_buffer('edges', self._edges2set)
 
     def exist_edge(self, graph, orig, dest, idx, branch, turn, tick, extant):
         """Declare whether or not this edge exists."""
         graph, orig, dest = map(self.json_dump, (graph, orig, dest))
-        self._edges2set.append((graph, orig, dest, idx, branch, turn, tick, extant))
+        self._buffer('edges', self._edges2set, (graph, orig, dest, idx, branch, turn, tick), (extant,))
 
-    def edge_val_dump(self):
+    def edge_val_dump(self, window=None):
         """Yield the entire contents of the edge_val table."""
         self._flush_edge_val()
         for (
                 graph, orig, dest, idx, key, branch, turn, tick, value
-        ) in self.sql('edge_val_dump'):
+        ) in self._dump('edge_val', window):
             yield (
                 self.json_load(graph),
                 self.json_load(orig),
@@ -453,31 +513,15 @@ class QueryEngine(object):
             )
 
     def _flush_edge_val(self):
-        if not self._edgevals2set:
-            return
-        delafter = {}
-        for graph, orig, dest, idx, key, branch, turn, tick, value in self._edgevals2set:
-            dkey = graph, orig, dest, idx, key, branch
-            if dkey in delafter:
-                delafter[dkey] = min((
-                    (turn, tick), delafter[dkey]
-                ))
-            else:
-                delafter[dkey] = (turn, tick)
-        self.sqlmany(
-            'del_edge_val_after',
-            *((graph, orig, dest, idx, key, branch, turn, turn, tick)
-              for ((graph, orig, dest, idx, key, branch), (turn, tick))
-              in delafter.items())
-        )
-        self.sqlmany('edge_val_insert', *self._edgevals2set)
-        self._edgevals2set = []
+        self._flush_buffer('edge_val', self._edgevals2set)
 
     def edge_val_set(self, graph, orig, dest, idx, key, branch, turn, tick, value):
         """Set this key of this edge to this value."""
+        granular = key in self.turn_granular
         graph, orig, dest, key, value = map(self.json_dump, (graph, orig, dest, key, value))
-        self._edgevals2set.append(
-            (graph, orig, dest, idx, key, branch, turn, tick, value)
+        self._buffer(
+            'edge_val', self._edgevals2set,
+            (graph, orig, dest, idx, key, branch, turn, tick), (value,), granular
         )
 
     def edge_val_del(self, graph, orig, dest, idx, key, branch, turn, tick):
@@ -541,9 +585,14 @@ class QueryEngine(object):
             cursor.execute('SELECT * FROM edge_val;')
         except OperationalError:
             cursor.execute(self.strings['create_edge_val'])
+        try:
+            cursor.execute('SELECT * FROM keyframes;')
+        except OperationalError:
+            cursor.execute(self.strings['create_keyframes'])
 
     def flush(self):
         """Put all pending changes into the SQL transaction."""
+        self._flushes += 1
         self._flush_nodes()
         self._flush_edges()
         self._flush_graph_val()
@@ -1,6 +1,10 @@
+import os
+import shutil
+import tempfile
 import unittest
 from copy import deepcopy
 import allegedb
+from allegedb.cache import WindowDict, BisectWindowDict, FuturistWindowDict, TurnDict, HistoryError, Memo
 
 
 testkvs = [0, 1, 10, 10**10, 10**10**4, 'spam', 'eggs', 'ham',  '💧', '🔑', '𐦖',('spam', 'eggs', 'ham')]
@@ -184,5 +188,348 @@ class CompiledQueriesTest(AllegedTest):
             )
 
 
+class BisectWindowDictTest(unittest.TestCase):
+    def runTest(self):
+        """Test that BisectWindowDict agrees with WindowDict however it's sought."""
+        data = {rev: rev * 10 for rev in range(0, 100, 3)}
+        wd = WindowDict(data)
+        bwd = BisectWindowDict(data)
+        for rev in [50, 0, 99, 3, 4, 5, 6, 98, 1, 2, 45, 46, 47]:
+            self.assertEqual(wd[rev], bwd[rev])
+            self.assertEqual(wd.rev_before(rev), bwd.rev_before(rev))
+            self.assertEqual(wd.rev_after(rev), bwd.rev_after(rev))
+            self.assertEqual(wd.has_exact_rev(rev), bwd.has_exact_rev(rev))
+            self.assertEqual(list(wd.past()), list(bwd.past()))
+            self.assertEqual(list(wd.future()), list(bwd.future()))
+        self.assertEqual(list(wd[10:40]), list(bwd[10:40]))
+        self.assertEqual(list(bwd[40:10]), list(reversed(list(wd[10:40]))))
+        for d in (wd, bwd):
+            d[4] = 'four'
+            del d[6]
+            d.truncate(60)
+        self.assertEqual(list(wd.items()), list(bwd.items()))
+        self.assertRaises(HistoryError, bwd.__getitem__, -1)
+        fwd = FuturistWindowDict({0: 0, 5: 5})
+        fwd[6] = 6
+        self.assertRaises(HistoryError, fwd.__setitem__, 2, 2)
+        td = TurnDict()
+        td[0][0] = 'zero'
+        self.assertIsInstance(td[0], FuturistWindowDict)
+        self.assertIsInstance(td[0], BisectWindowDict)
+        self.assertEqual(td[3][0], 'zero')
+
+
+class MemoTest(unittest.TestCase):
+    def runTest(self):
+        """Test that a Memo stays within its size, and forgets the future on request."""
+        memo = Memo(3)
+        for tick in range(5):
+            memo['spam', 'trunk', 0, tick] = tick
+        self.assertEqual(len(memo), 3)
+        self.assertEqual(memo.evictions, 2)
+        self.assertNotIn(('spam', 'trunk', 0, 0), memo)
+        self.assertEqual(memo['spam', 'trunk', 0, 4], 4)
+        self.assertRaises(KeyError, memo.__getitem__, ('spam', 'trunk', 0, 0))
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+        memo.forget_after(('spam', 'trunk'), (0, 2))
+        self.assertEqual(list(memo), [('spam', 'trunk', 0, 2)])
+
+
+class LoadWindowTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.dbstring = 'sqlite:///' + os.path.join(self.tempdir, 'world.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def runTest(self):
+        """Test that loading history a window at a time gets the same values as loading all of it."""
+        engine = allegedb.ORM(self.dbstring)
+        g = engine.new_graph('g')
+        g.add_node(0)
+        for turn in range(1, 30):
+            engine.turn = turn
+            g.node[0]['turn'] = turn
+            g.graph['turn'] = turn
+        engine.close()
+        engine = allegedb.ORM(self.dbstring, load_window=5)
+        g = engine.graph['g']
+        # back and forth, near and far, and forward a turn at a time
+        for turn in [29, 20, 3, 1, 12] + list(range(13, 30)):
+            engine.turn = turn
+            self.assertEqual(g.node[0]['turn'], turn)
+            self.assertEqual(g.graph['turn'], turn)
+        engine.close()
+
+
+class UnloadedStoreTest(LoadWindowTest):
+    def runTest(self):
+        """Test that storing at a time that isn't loaded keeps the value."""
+        engine = allegedb.ORM(self.dbstring)
+        # in a branch, whose end turn gets saved, so it can be written to after loading
+        engine.branch = 'b'
+        g = engine.new_graph('g')
+        g.add_node(0)
+        for turn in range(1, 20):
+            engine.turn = turn
+            g.node[0]['turn'] = turn
+        engine.close()
+        engine = allegedb.ORM(self.dbstring, load_window=2)
+        g = engine.graph['g']
+        self.assertEqual(engine.btt()[:2], ('b', 19))
+        # looking at the distant past moves the window away from now
+        self.assertEqual(engine._node_val_cache.retrieve('g', 0, 'turn', 'b', 1, 1), 1)
+        self.assertFalse(engine._is_loaded('b', 19))
+        # write the way the graphs do, with no read to load the window first
+        branch, turn, tick = engine.nbtt()
+        engine.query.node_val_set('g', 0, 'later', branch, turn, tick, 'yes')
+        engine._node_val_cache.store('g', 0, 'later', branch, turn, tick, 'yes')
+        self.assertTrue(engine._is_loaded('b', 19))
+        self.assertEqual(g.node[0]['later'], 'yes')
+        self.assertEqual(g.node[0]['turn'], 19)
+        self.assertIn('later', g.node[0])
+        # and once more with nothing in the database to load
+        engine._node_val_cache.retrieve('g', 0, 'turn', 'b', 1, 1)
+        branch, turn, tick = engine.nbtt()
+        cache = engine._node_val_cache
+        cache.store('g', 0, 'cached', branch, turn, tick, 'yes')
+        # the memos may forget; the history mustn't
+        cache.shallowest.clear()
+        cache.shallower.clear()
+        self.assertEqual(g.node[0]['cached'], 'yes')
+        self.assertEqual(g.node[0]['later'], 'yes')
+        engine.close()
+        engine = allegedb.ORM(self.dbstring, load_window=2)
+        self.assertEqual(engine.graph['g'].node[0]['later'], 'yes')
+        engine.close()
+
+
+class KeyframeTest(unittest.TestCase):
+    def runTest(self):
+        """Test that keyframes get the same values as searching all of history."""
+        engine = allegedb.ORM('sqlite:///:memory:', keyframe_interval=5)
+        g = engine.new_graph('g')
+        g.add_nodes_from(range(3))
+        for turn in range(1, 23):
+            engine.turn = turn
+            g.node[turn % 3]['turn'] = turn
+            g.graph['turn'] = turn
+        query = engine.query
+        query.flush()
+        self.assertEqual(
+            sorted(turn for (tbl, branch, turn, rows) in query.sql('keyframes_dump') if tbl == 'node_val'),
+            [5, 10, 15, 20]
+        )
+        for table in query.keyframe_tables:
+            for turn in (5, 12, 22):
+                self.assertEqual(
+                    sorted(map(tuple, query._snapshot(table, 'trunk', turn))),
+                    sorted(map(tuple, query.sql(table + '_snapshot', 'trunk', turn, turn)))
+                )
+        engine.close()
+
+
+class CoalesceTest(unittest.TestCase):
+    def runTest(self):
+        """Test that only the last value in each turn of a turn-granular stat gets saved."""
+        engine = allegedb.ORM('sqlite:///:memory:', turn_granular=['hp'])
+        g = engine.new_graph('g')
+        g.add_node(0)
+        for turn in range(1, 4):
+            engine.turn = turn
+            for i in range(3):
+                g.node[0]['hp'] = g.node[0]['mp'] = turn * 10 + i
+        query = engine.query
+        query.flush()
+        self.assertEqual(query.flush_stats()['coalesced'], 6)
+        saved = sorted(
+            (key, turn, value) for (graph, node, key, branch, turn, tick, value) in query.node_val_dump()
+        )
+        self.assertEqual([row for row in saved if row[0] == 'hp'], [('hp', 1, 12), ('hp', 2, 22), ('hp', 3, 32)])
+        self.assertEqual(len([row for row in saved if row[0] == 'mp']), 9)
+        engine.close()
+
+
+class ReadTrackingTest(unittest.TestCase):
+    def runTest(self):
+        """Test that tracked reads only count as changed when what they read is written."""
+        engine = allegedb.ORM('sqlite:///:memory:', track_reads=True)
+        g = engine.new_graph('tracked')
+        g.add_nodes_from(range(3))
+        g.node[0]['hp'] = g.node[1]['hp'] = 10
+        serial = engine.write_serial
+        with engine.tracking_reads as reads:
+            g.node[0]['hp']
+        self.assertFalse(engine.changed_since(reads, serial))
+        engine.turn = 1
+        g.node[1]['hp'] = 5
+        g.node[0]['mp'] = 5
+        self.assertFalse(engine.changed_since(reads, serial))
+        g.node[0]['hp'] = 5
+        self.assertTrue(engine.changed_since(reads, serial))
+        serial = engine.write_serial
+        with engine.tracking_reads as reads:
+            list(g.node[2])
+        self.assertFalse(engine.changed_since(reads, serial))
+        g.node[2]['hp'] = 1
+        self.assertTrue(engine.changed_since(reads, serial))
+        engine.close()
+
+
+class BranchDeltaTest(unittest.TestCase):
+    def runTest(self):
+        """Test that deltas between branches rewind one and play the other forward."""
+        engine = allegedb.ORM('sqlite:///:memory:')
+        g = engine.new_digraph('g')
+        g.add_node(0)
+        g.node[0]['x'] = 0
+        engine.turn = 1
+        g.node[0]['x'] = 1
+        g.node[0]['y'] = 1
+        engine.branch = 'b'
+        engine.turn = 2
+        g.node[0]['x'] = 2
+        g.node[0]['y'] = 2
+        g.add_node(1)
+        b_time = engine.btt()
+        # trunk's still at turn 1
+        engine.turn = 1
+        engine.branch = 'trunk'
+        engine.turn = 2
+        g.node[0]['x'] = 3
+        g.node[0]['z'] = 3
+        trunk_time = engine.btt()
+        # b's changes are undone back to where it forked, then trunk's
+        # are played forward; x changed in both, so trunk's wins
+        self.assertEqual(
+            engine.get_branch_delta(*(b_time + trunk_time)),
+            {'g': {'nodes': {1: False}, 'node_val': {0: {'x': 3, 'y': 1, 'z': 3}}}}
+        )
+        self.assertEqual(
+            engine.get_branch_delta(*(trunk_time + b_time)),
+            {'g': {'nodes': {1: True}, 'node_val': {0: {'x': 2, 'y': 2, 'z': None}}}}
+        )
+        engine.close()
+
+
+class DeltaFilterTest(unittest.TestCase):
+    def runTest(self):
+        """Test that filtered deltas leave out what isn't wanted, in one turn or several."""
+        engine = allegedb.ORM('sqlite:///:memory:')
+        g = engine.new_digraph('g')
+        h = engine.new_digraph('h')
+        g.add_node(0)
+        start = engine.btt()
+        for turn in (1, 2):
+            engine.turn = turn
+            g.add_node(turn)
+            g.node[turn]['x'] = turn
+            g.node[turn]['y'] = turn
+            g.add_edge(0, turn)
+            h.add_node(turn)
+        end = engine.btt()
+        filt = allegedb.DeltaFilter(graphs=['g'], nodes={'g': [0, 2]}, stats=['x'])
+        delta = engine.get_delta(start[0], start[1], start[2], end[1], end[2], filt)
+        self.assertNotIn('h', delta)
+        self.assertEqual(delta['g']['nodes'], {2: True})
+        self.assertEqual(delta['g']['node_val'], {2: {'x': 2}})
+        self.assertEqual(delta['g']['edges'], {0: {1: True, 2: True}})
+        delta = engine.get_turn_delta(end[0], end[1], 0, end[2], filt)
+        self.assertEqual(delta['g']['node_val'], {2: {'x': 2}})
+        self.assertNotIn('h', delta)
+        engine.close()
+
+
+class JSONMemoTest(unittest.TestCase):
+    def runTest(self):
+        """Test that JSONMemo only remembers a bounded number of small, immutable things."""
+        from allegedb.xjson import JSONMemo
+        memo = JSONMemo(maxsize=2)
+        self.assertEqual(memo.dump(1), memo.dump(1))
+        self.assertEqual(memo.hits, 1)
+        self.assertNotEqual(memo.dump(True), memo.dump(1))
+        self.assertEqual(memo.load(memo.dump(('a', 1))), ('a', 1))
+        self.assertEqual(memo.load(memo.dump((1, 'a'))), (1, 'a'))
+        self.assertLessEqual(len(memo._dumped), 2)
+        self.assertLessEqual(len(memo._loaded), 2)
+        s = memo.dump({'a': [1]})
+        self.assertEqual(memo.skipped, 1)
+        d = memo.load(s)
+        d['a'].append(2)
+        self.assertEqual(memo.load(s), {'a': [1]})
+        self.assertIn('hit_rate', memo.stats())
+
+
+class ColumnarTest(unittest.TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tempdir)
+
+    def runTest(self):
+        """Test that history exported in columns imports into a new database."""
+        from allegedb.columnar import have_arrow
+        if not have_arrow():
+            try:
+                import numpy
+            except ImportError:
+                self.skipTest("Needs pyarrow or numpy")
+        import os
+        path = os.path.join(self.tempdir, 'history')
+        engine = allegedb.ORM('sqlite:///:memory:')
+        g = engine.new_digraph('g')
+        g.add_node(0)
+        g.add_edge(0, 1)
+        for turn in range(1, 4):
+            engine.turn = turn
+            g.node[0]['x'] = turn
+            g.edge[0][1]['y'] = (turn, 'turns')
+        engine.branch = 'b'
+        del g.node[0]['x']
+        engine.export_history(path)
+        caches = ('_nodes_cache', '_edges_cache', '_graph_val_cache', '_node_val_cache', '_edge_val_cache')
+
+        def settings(engine):
+            return {
+                (cache, branch, turn, tick): (
+                    getattr(engine, cache).settings[branch][turn][tick],
+                    getattr(engine, cache).presettings[branch][turn][tick]
+                )
+                for cache in caches
+                for branch, turns in getattr(engine, cache).settings.items()
+                for turn, ticks in turns.items()
+                for tick in ticks
+            }
+        exported = settings(engine)
+        engine.close()
+
+        def check(engine):
+            g = engine.graph['g']
+            engine.turn = 2
+            self.assertEqual(g.node[0]['x'], 2)
+            self.assertEqual(g.edge[0][1]['y'], (2, 'turns'))
+            engine.turn = 3
+            engine.branch = 'b'
+            self.assertNotIn('x', g.node[0])
+        # with nothing in the caches, they're built straight from the columns
+        engine = allegedb.ORM('sqlite:///:memory:')
+        engine.import_history(path)
+        self.assertEqual(settings(engine), exported)
+        check(engine)
+        engine.close()
+        # otherwise, they're loaded again from the database
+        engine = allegedb.ORM('sqlite:///:memory:')
+        engine.turn = 10
+        engine.new_graph('h').add_node('z')
+        engine.import_history(path)
+        self.assertIn('z', engine.graph['h'].node)
+        check(engine)
+        engine.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,9 @@
 # This file is part of allegedb, an object relational mapper for versioned graphs.
 # Copyright (C) Zachary Spector. zacharyspector@gmail.com
-from collections import MutableMapping, MutableSequence
+from collections import MutableMapping, MutableSequence, OrderedDict
 from json import dumps, loads
 from copy import deepcopy
+from threading import Lock
 
 
 def enc_tuple(o):
@@ -43,35 +44,138 @@ def dec_tuple(o):
         return o
 
 
-json_dump_hints = {}
-
-
 def json_dump(obj,  hint=True):
-    """JSON dumper that distinguishes lists from tuples"""
-    if not hint:
-        return dumps(enc_tuple(obj))
-    k = str(obj)
-    if k not in json_dump_hints:
-        json_dump_hints[k] = dumps(enc_tuple(obj))
-    return json_dump_hints[k]
+    """JSON dumper that distinguishes lists from tuples
 
+    ``hint`` is ignored. Use a :class:`JSONMemo` to memoize.
 
-json_load_hints = {}
+    """
+    return dumps(enc_tuple(obj))
 
 
 def json_load(s,  hint=True):
-    """JSON loader that distinguishes lists from tuples"""
+    """JSON loader that distinguishes lists from tuples
+
+    ``hint`` is ignored. Use a :class:`JSONMemo` to memoize.
+
+    """
     if s is None:
         return None
     if s == '["list"]':
         return []
     if s == '["tuple"]':
         return tuple()
-    if not hint:
-        return dec_tuple(loads(s))
-    if s not in json_load_hints:
-        json_load_hints[s] = dec_tuple(loads(s))
-    return json_load_hints[s]
+    return dec_tuple(loads(s))
+
+
+_memo_scalars = (str, int, bool, type(None))
+
+
+def memo_key(obj, maxlen=64):
+    """Return a key to memoize ``obj`` under, or ``None`` if it shouldn't be.
+
+    Only strings up to ``maxlen`` long, ints, bools, ``None``, and
+    short tuples of those are memoized, since they're immutable and
+    are what names are made of. The key includes the types, so that
+    ``1`` and ``True`` don't share a cache entry.
+
+    """
+    t = type(obj)
+    if t is str:
+        return obj if len(obj) <= maxlen else None
+    if t in _memo_scalars:
+        return t, obj
+    if t is tuple and len(obj) <= 8:
+        key = []
+        for v in obj:
+            k = memo_key(v, maxlen)
+            if k is None:
+                return None
+            key.append(k)
+        return tuple, tuple(key)
+    return None
+
+
+class JSONMemo(object):
+    """Memoize a JSON dumper and loader, for names.
+
+    Only objects that ``memo_key`` accepts are memoized, and only the
+    ``maxsize`` most recently used of each direction. Anything else,
+    such as the values of stats, is encoded or decoded every time, so
+    nobody gets an object that somebody else might mutate.
+
+    Counts ``hits``, ``misses``, and ``skipped`` calls. Safe to use
+    from several threads.
+
+    """
+    __slots__ = ['_dump', '_load', '_dumped', '_loaded', '_lock', 'maxsize',
+                 'maxlen', 'hits', 'misses', 'skipped']
+
+    def __init__(self, dump=json_dump, load=json_load, maxsize=4096, maxlen=64):
+        self._dump = dump
+        self._load = load
+        self._dumped = OrderedDict()
+        self._loaded = OrderedDict()
+        self._lock = Lock()
+        self.maxsize = maxsize
+        self.maxlen = maxlen
+        self.hits = self.misses = self.skipped = 0
+
+    def _remember(self, cache, k, v):
+        cache[k] = v
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def dump(self, obj):
+        k = memo_key(obj, self.maxlen)
+        if k is None:
+            self.skipped += 1
+            return self._dump(obj)
+        with self._lock:
+            if k in self._dumped:
+                self.hits += 1
+                self._dumped.move_to_end(k)
+                return self._dumped[k]
+            self.misses += 1
+        s = self._dump(obj)
+        with self._lock:
+            self._remember(self._dumped, k, s)
+            # an encoding this short decodes to something just as small
+            self._remember(self._loaded, s, obj)
+        return s
+
+    def load(self, s):
+        if s is None or len(s) > self.maxlen + 16:
+            self.skipped += 1
+            return self._load(s)
+        with self._lock:
+            if s in self._loaded:
+                self.hits += 1
+                self._loaded.move_to_end(s)
+                return self._loaded[s]
+            self.misses += 1
+        obj = self._load(s)
+        if memo_key(obj, self.maxlen) is not None:
+            with self._lock:
+                self._remember(self._loaded, s, obj)
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self._dumped.clear()
+            self._loaded.clear()
+
+    def stats(self):
+        """Return a dictionary of the counts, sizes, and the hit rate."""
+        looked_up = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'hit_rate': self.hits / looked_up if looked_up else 0.,
+            'dumped': len(self._dumped),
+            'loaded': len(self._loaded)
+        }
 
 
 class JSONWrapper(MutableMapping):
@@ -0,0 +1,73 @@
+"""Compare the performance of alternative cache structures.
+
+Run with ``python bench.py``.
+
+"""
+import os
+from random import Random
+from time import perf_counter
+from timeit import timeit
+
+from allegedb import ORM
+from allegedb.cache import WindowDict, BisectWindowDict
+
+
+def windowdict_bench(revs=5000, seeks=5000, number=3):
+    """Time sequential and random-jump lookups on each WindowDict class."""
+    rando = Random(0)
+    jumps = [rando.randrange(revs) for i in range(seeks)]
+    for cls in (WindowDict, BisectWindowDict):
+        wd = cls({rev: rev for rev in range(0, revs, 2)})
+
+        def sequential():
+            for rev in range(revs):
+                wd[rev]
+
+        def random_jump():
+            for rev in jumps:
+                wd[rev]
+
+        print("{}: sequential {:.4f}s, random jump {:.4f}s".format(
+            cls.__name__,
+            timeit(sequential, number=number),
+            timeit(random_jump, number=number)
+        ))
+
+
+
+def keyframe_bench(lengths=(100, 1000, 3000), interval=50, window=10, nodes=20):
+    """Time loading the end of histories of different lengths, and jumping
+    to the middle of them, with and without keyframes.
+
+    """
+    for length in lengths:
+        for keyframe_interval in (None, interval):
+            # graph names need to be unique in the process
+            name = 'bench{}_{}'.format(length, keyframe_interval)
+            fn = name + '.db'
+            if os.path.exists(fn):
+                os.remove(fn)
+            orm = ORM('sqlite:///' + fn, alchemy=False, keyframe_interval=keyframe_interval)
+            g = orm.new_graph(name)
+            g.add_nodes_from(range(nodes))
+            for turn in range(1, length):
+                orm.turn = turn
+                g.node[turn % nodes]['turn'] = turn
+                g.graph['turn'] = turn
+            orm.close()
+            start = perf_counter()
+            orm = ORM('sqlite:///' + fn, alchemy=False, load_window=window)
+            loaded = perf_counter() - start
+            start = perf_counter()
+            orm.turn = length // 2
+            jumped = perf_counter() - start
+            orm.close()
+            os.remove(fn)
+            print("{} turns, keyframe interval {}: load {:.4f}s, jump {:.4f}s".format(
+                length, keyframe_interval, loaded, jumped
+            ))
+
+
+if __name__ == '__main__':
+    windowdict_bench()
+    keyframe_bench()